@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Per building API call count benchmark.
+
+Runs get_bes_buildings against a FakeBESServer seeded with buildings of
+one kind at a time (preview or full; rated, editing, invalid i.e. without
+blocks, or running) and reports the API calls made per building, not
+counting the listing and status type calls shared by all buildings.
+A second pass with the same NegativeCache shows the calls made for
+buildings that haven't changed since the first.
+
+Usage (with py-bes installed, e.g. ``pip install -e .``)::
+
+    python benchmarks/call_counts.py --buildings 20
+"""
+
+# Imports from Standard Library
+import argparse
+import json
+
+# Local Imports
+from pybes.cache import NegativeCache
+from pybes.testing.fake_server import (
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESServer,
+)
+from pybes.testing.synthetic import make_full_building, make_preview_building
+from pybes.utils.bes_full import get_bes_buildings
+
+# Constants
+# name, preview, status, blocks
+SCENARIOS = (
+    ('preview_rated', True, 'Rated', 1),
+    ('preview_editing', True, 'Editing', 1),
+    ('preview_invalid', True, 'Editing', 0),
+    ('preview_running', True, 'Running', 1),
+    ('full_rated', False, 'Rated', 1),
+    ('full_editing', False, 'Editing', 1),
+    ('full_invalid', False, 'Editing', 0),
+    ('full_running', False, 'Running', 1),
+)
+COLUMNS = (
+    ('scenario', '{:<16}'), ('complete', '{:>8d}'),
+    ('calls_per_bldg', '{:>14.2f}'), ('second_pass', '{:>11.2f}'),
+)
+START_ID = 100
+
+
+# Private Functions
+def _building_calls(calls):
+    """Calls made for individual buildings, by endpoint"""
+    return {
+        call: count for call, count in calls.items() if '{id}' in call
+    }
+
+
+# Public Functions
+def run_scenario(scenario, n_bldgs):
+    """
+    Fetch reports for n_bldgs buildings of scenario's kind.
+
+    :returns: dict of results, see COLUMNS
+    """
+    name, preview, status, blocks = scenario
+    ids = range(START_ID, START_ID + n_bldgs)
+    if preview:
+        seed = {'preview': [
+            make_preview_building(bldg_id, n_blocks=blocks, status=status)
+            for bldg_id in ids
+        ]}
+    else:
+        seed = {'full': [
+            make_full_building(bldg_id, n_blocks=blocks, status=status)
+            for bldg_id in ids
+        ]}
+    negative_cache = NegativeCache()
+    passes = []
+    with FakeBESServer() as server:
+        server.app.seed(**seed)
+        for _ in range(2):
+            server.app.calls.clear()
+            # rated buildings are reported each pass, the rest recorded
+            # as incomplete
+            complete = len(list(get_bes_buildings(
+                [], base_url=server.base_url, access_token=DEFAULT_TOKEN,
+                user_id=DEFAULT_USER_ID, negative_cache=negative_cache
+            )))
+            passes.append((complete, _building_calls(server.app.calls)))
+    (complete, endpoints), (_, second) = passes
+    return {
+        'scenario': name,
+        'complete': complete,
+        'calls_per_bldg': sum(endpoints.values()) / float(n_bldgs),
+        'second_pass': sum(second.values()) / float(n_bldgs),
+        'endpoints': endpoints,
+    }
+
+
+def format_table(results):
+    """Results as a text table"""
+    lines = [' '.join(
+        '{:>{}}'.format(name, len(fmt.format(results[0][name])))
+        if results else name
+        for name, fmt in COLUMNS
+    )]
+    for result in results:
+        lines.append(' '.join(
+            fmt.format(result[name]) for name, fmt in COLUMNS
+        ))
+    return '\n'.join(lines)
+
+
+def main(args=None):
+    """Count API calls per building against a fake BES server"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--buildings', type=int, default=10,
+                        help='buildings per scenario')
+    parser.add_argument('--scenarios',
+                        default=','.join(name for name, _, _, _ in SCENARIOS),
+                        help='comma separated scenarios to run')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as json')
+    opts = parser.parse_args(args)
+    names = [name.strip() for name in opts.scenarios.split(',')]
+    results = [
+        run_scenario(scenario, opts.buildings)
+        for scenario in SCENARIOS if scenario[0] in names
+    ]
+    if opts.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print(format_table(results))
+
+
+if __name__ == '__main__':
+    main()
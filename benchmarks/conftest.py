@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Shared fixtures for the pybes benchmark suite.
+"""
+
+# Imports from Standard Library
+import copy
+import json
+
+# Imports from Third Party Modules
+import pytest
+import requests
+
+# Local Imports
+from pybes.pybes import BESClient
+from pybes.testing.synthetic import (
+    full_scores,
+    make_full_building,
+    make_preview_building,
+    preview_scores,
+)
+
+# Constants
+BASE_URL = 'https://api.labworks.org/api'
+# blocks per synthetic building, lighting fixtures scale with blocks
+SIZES = (1, 10, 50)
+N_FIXTURES = 4
+STATUS_MAP = {1: 'Editing', 2: 'Running', 3: 'Rated', 4: 'Submitted'}
+
+
+# Helper Functions & Classes
+class StubClient(object):
+    """
+    Serves canned synthetic buildings in place of BESClient, so report
+    builders are measured without any network or mock overhead.
+    """
+
+    def __init__(self, n_blocks):
+        self.preview = make_preview_building(
+            1, n_blocks=n_blocks, n_fixtures=N_FIXTURES
+        )
+        self.full = make_full_building(
+            2, n_blocks=n_blocks, n_fixtures=N_FIXTURES
+        )
+
+    def get_preview_building(self, building_id, report_type=None):
+        """Preview building or its score report"""
+        if report_type:
+            report = preview_scores(building_id)
+            report.update({
+                'id': building_id, 'name': self.preview['name'],
+                'pdf_url': '{}/buildings/{}/report.pdf'.format(
+                    BASE_URL, building_id
+                )
+            })
+            return report
+        return copy.deepcopy(self.preview)
+
+    def get_building(self, building_id, report_type=None):
+        """Full building"""
+        # pylint: disable=unused-argument
+        return copy.deepcopy(self.full)
+
+    def get_building_score(self, building_id):
+        """Full building score"""
+        return {'score': full_scores(building_id)}
+
+
+def make_response(status_code, content):
+    """requests.Response with status_code and raw content"""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content                 # pylint: disable=W0212
+    response.url = '{}/v1/buildings/1'.format(BASE_URL)
+    return response
+
+
+# Hooks
+def pytest_benchmark_update_json(config, benchmarks, output_json):
+    """Drop raw timings from --benchmark-json output e.g. the baseline"""
+    # pylint: disable=unused-argument
+    for bench in output_json['benchmarks']:
+        bench['stats'].pop('data', None)
+
+
+# Fixtures
+@pytest.fixture
+def base_url():
+    """API url the client is configured with"""
+    return BASE_URL
+
+
+@pytest.fixture
+def client():
+    """BESClient, never makes a call"""
+    return BESClient(access_token='token', user_id=1, base_url=BASE_URL)
+
+
+@pytest.fixture(params=SIZES, ids=lambda size: '{}_blocks'.format(size))
+def n_blocks(request):
+    """Synthetic building size"""
+    return request.param
+
+
+@pytest.fixture
+def preview_building(n_blocks):
+    """Synthetic preview building"""
+    return make_preview_building(1, n_blocks=n_blocks, n_fixtures=N_FIXTURES)
+
+
+@pytest.fixture
+def stub_client(n_blocks):
+    """StubClient serving buildings of n_blocks"""
+    return StubClient(n_blocks)
+
+
+@pytest.fixture(
+    params=['errors', 'error', 'stack_trace', 'html'],
+    ids=lambda body: '{}_body'.format(body)
+)
+def error_response(request):
+    """Error responses in the forms returned by the v1 and v2 APIs"""
+    bodies = {
+        'errors': (422, json.dumps({'errors': {
+            'name': ["can't be blank"],
+            'year_of_construction': ['must be a number', 'is required'],
+        }}).encode('utf-8')),
+        'error': (401, json.dumps(
+            {'error': 'Invalid token'}
+        ).encode('utf-8')),
+        'stack_trace': (500, '\n'.join(
+            ['NoMethodError: undefined method']
+            + ['  app/controllers/api.rb:{}'.format(idx)
+               for idx in range(50)]
+        ).encode('utf-8')),
+        'html': (500, (
+            '<!DOCTYPE html><html><body>{}</body></html>'.format('x' * 2000)
+        ).encode('utf-8')),
+    }
+    return make_response(*bodies[request.param])
+
+
+@pytest.fixture
+def status_map():
+    """Full building status map"""
+    return STATUS_MAP
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+End to end portfolio sync benchmark.
+
+Generates a synthetic portfolio of preview and full buildings, serves it
+from a local FakeBESServer and fetches every report through the
+get_bes_buildings path in each execution mode:
+
+sync
+    get_bes_buildings, one request at a time
+threaded
+    get_bes_buildings(max_workers=N)
+async
+    an asyncio event loop consuming get_bes_buildings(max_workers=N),
+    each (blocking) step run in the loop's default executor
+
+Each mode runs in its own child process against a freshly seeded server,
+so peak RSS is that of the client alone. Reported per mode: wall time,
+buildings per second, API calls per building, p50/p95/p99 latency of API
+calls as seen by the client (timed by a BESClient hook) and peak RSS of
+the client process.
+
+Usage (with py-bes installed, e.g. ``pip install -e .``)::
+
+    python benchmarks/portfolio_sync.py --preview 200 --full 200 \\
+        --latency 0.05 --workers 8
+
+The async mode needs Python 3.5+.
+"""
+
+# Imports from Standard Library
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Local Imports
+from pybes.testing.fake_server import (
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESServer,
+    lognormal,
+)
+from pybes.testing.synthetic import make_portfolio
+from pybes.utils.bes_full import get_bes_buildings
+
+try:
+    import resource
+except ImportError:                                     # pragma: no cover
+    resource = None                   # pylint: disable=invalid-name
+
+# Constants
+MODES = ('sync', 'threaded', 'async')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLUMNS = (
+    ('mode', '{:<9}'), ('wall_s', '{:>8.2f}'), ('bldg_per_s', '{:>10.1f}'),
+    ('calls_per_bldg', '{:>14.2f}'), ('p50_ms', '{:>8.1f}'),
+    ('p95_ms', '{:>8.1f}'), ('p99_ms', '{:>8.1f}'),
+    ('peak_rss_mb', '{:>11.1f}'), ('max_in_flight', '{:>13d}'),
+)
+
+
+# Private Functions
+def _peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    if not resource:                                    # pragma: no cover
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    divisor = 1024.0 ** 2 if sys.platform == 'darwin' else 1024.0
+    return peak / divisor
+
+
+def _run_sync(bes_kwargs, workers):
+    """Fetch reports with get_bes_buildings, one request at a time"""
+    # pylint: disable=unused-argument
+    incomplete = []
+    results = list(get_bes_buildings(incomplete, **bes_kwargs))
+    return len(results), len(incomplete)
+
+
+def _run_threaded(bes_kwargs, workers):
+    """Fetch reports with get_bes_buildings using workers threads"""
+    incomplete = []
+    results = list(
+        get_bes_buildings(incomplete, max_workers=workers, **bes_kwargs)
+    )
+    return len(results), len(incomplete)
+
+
+async def _async_reports(loop, bes_kwargs, workers):
+    """Consume get_bes_buildings from an event loop"""
+    incomplete = []
+    reports = get_bes_buildings(incomplete, max_workers=workers, **bes_kwargs)
+    complete = 0
+    while True:
+        report = await loop.run_in_executor(None, next, reports, None)
+        if report is None:
+            break
+        complete += 1
+    return complete, len(incomplete)
+
+
+def _run_async(bes_kwargs, workers):
+    """Fetch reports with get_bes_buildings driven from an event loop"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(
+            _async_reports(loop, bes_kwargs, workers)
+        )
+    finally:
+        loop.close()
+
+
+RUNNERS = {'sync': _run_sync, 'threaded': _run_threaded, 'async': _run_async}
+
+
+def _child(mode, base_url, workers):
+    """Run mode against base_url, print results as json"""
+    latencies = []
+
+    def record(event):
+        """Record client side latency of an api call"""
+        latencies.append(event.latency * 1000)
+
+    bes_kwargs = {
+        'access_token': DEFAULT_TOKEN, 'user_id': DEFAULT_USER_ID,
+        'base_url': base_url, 'hooks': [record],
+    }
+    start = time.time()
+    complete, incomplete = RUNNERS[mode](bes_kwargs, workers)
+    print(json.dumps({
+        'wall_s': time.time() - start,
+        'complete': complete,
+        'incomplete': incomplete,
+        'peak_rss_mb': _peak_rss_mb(),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+    }))
+
+
+# Public Functions
+def percentile(values, pct):
+    """pct percentile of values (nearest rank)"""
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    rank = int(round(pct / 100.0 * (len(values) - 1)))
+    return values[rank]
+
+
+def run_mode(mode, opts):
+    """
+    Run mode in a child process against a freshly seeded fake server.
+
+    :returns: dict of results, see COLUMNS
+    """
+    preview, full = make_portfolio(
+        opts.preview, opts.full, n_blocks=opts.blocks,
+        n_fixtures=opts.fixtures, rated=opts.rated, seed=opts.seed
+    )
+    server = FakeBESServer(
+        latency=lognormal(opts.latency) if opts.latency else None,
+        rate_limit=opts.rate_limit, error_rate=opts.error_rate,
+        seed=opts.seed
+    )
+    server.app.seed(preview=preview, full=full)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        path for path in (ROOT, env.get('PYTHONPATH')) if path
+    )
+    with server:
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__), '--child', mode,
+            '--base-url', server.base_url, '--workers', str(opts.workers)
+        ], env=env)
+    result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    app = server.app
+    n_bldgs = max(opts.preview + opts.full, 1)
+    result.update({
+        'mode': mode,
+        'bldg_per_s': n_bldgs / result['wall_s'],
+        'calls': sum(app.calls.values()),
+        'calls_per_bldg': sum(app.calls.values()) / float(n_bldgs),
+        'max_in_flight': app.max_in_flight,
+        'endpoints': dict(app.calls),
+    })
+    return result
+
+
+def format_table(results):
+    """Results as a text table"""
+    lines = [' '.join(
+        '{:>{}}'.format(name, len(fmt.format(results[0][name])))
+        if results else name
+        for name, fmt in COLUMNS
+    )]
+    for result in results:
+        lines.append(' '.join(
+            fmt.format(result[name]) for name, fmt in COLUMNS
+        ))
+    return '\n'.join(lines)
+
+
+def main(args=None):
+    """Benchmark portfolio sync against a fake BES server"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--preview', type=int, default=100,
+                        help='number of preview buildings')
+    parser.add_argument('--full', type=int, default=100,
+                        help='number of full buildings')
+    parser.add_argument('--blocks', type=int, default=1,
+                        help='blocks per building')
+    parser.add_argument('--fixtures', type=int, default=2,
+                        help='lighting fixtures per block')
+    parser.add_argument('--rated', type=float, default=1.0,
+                        help='fraction of buildings already rated')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='median server latency in seconds (lognormal)')
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='server requests per second per token')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=8,
+                        help='threads for threaded and async modes')
+    parser.add_argument('--modes', default=','.join(MODES),
+                        help='comma separated modes to run')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true',
+                        help='print results as json')
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    opts = parser.parse_args(args)
+    if opts.child:
+        _child(opts.child, opts.base_url, opts.workers)
+        return
+    results = [
+        run_mode(mode.strip(), opts) for mode in opts.modes.split(',')
+    ]
+    if opts.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print(format_table(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Benchmarks for pybes hot paths.
+
+Record a baseline with ``tox -e benchmark-baseline`` (e.g. on the target
+branch), then ``tox -e benchmark`` fails if the mean of any benchmark is
+more than 15% slower than in it. Timings depend on the machine and
+interpreter, so both runs must be made on the same one; CI records the
+baseline from the target branch in the same job.
+"""
+
+# Imports from Standard Library
+import logging
+
+# Imports from Third Party Modules
+import pytest
+
+# Local Imports
+from pybes.pybes import (
+    APIError,
+    BES_RESOURCE_TYPES,
+    BES_RESOURCES,
+    BLOCK_RESOURCES,
+    _get_block_resource,
+    _get_resource_name,
+    _get_resource_type,
+    _params_from_dict,
+    remove_unknown,
+    unroll,
+)
+from pybes.utils.bes_full import get_bes_full_report
+from pybes.utils.bes_preview import get_bes_preview_report
+
+pytest.importorskip('pytest_benchmark')
+
+# Constants
+log = logging.getLogger(__name__)            # pylint: disable-msg=invalid-name
+log.addHandler(logging.NullHandler())
+
+PARAMS = {
+    'building_name': 'Preview Example 1',
+    'year_completed': '1990',
+    'floor_area': '100000',
+    'street': '123 Street',
+    'city': 'Boring',
+    'state': 'OR',
+    'postal_code': '97009',
+    'use_type': 'Office',
+    'number_floors': 5,
+    'orientation': 'North/South',
+    'assessment_type': 'Test',
+    'notes': None,
+    'api_version': 1,
+    'id': 12,
+}
+REQUIRED = ['building_name', 'year_completed', 'floor_area', 'use_type']
+
+
+# Tests
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'id': 12},
+    {'id': 12, 'action': 'score', 'api_version': 1},
+    {'id': 12, 'action': '/report/', 'base_url': True},
+], ids=['endpoint', 'id', 'action', 'base_url'])
+def test_construct_url(benchmark, client, base_url, kwargs):
+    """BESClient._construct_url"""
+    if kwargs.get('base_url'):
+        kwargs = dict(kwargs, base_url=base_url + '/')
+    url = benchmark(client._construct_url, 'buildings', **kwargs)
+    assert url.startswith(base_url)
+
+
+def test_params_from_dict(benchmark):
+    """_params_from_dict (exclude is mutated so is rebuilt each call)"""
+    params = benchmark(
+        lambda: _params_from_dict(PARAMS, exclude=[], required=REQUIRED)
+    )
+    assert 'notes' not in params
+
+
+def test_construct_payload(benchmark, client):
+    """BESClient._construct_payload"""
+    params = benchmark(
+        client._construct_payload, PARAMS, compulsory_params=REQUIRED
+    )
+    assert params['token'] == 'token'
+
+
+def test_check_call_success(benchmark, client, error_response):
+    """BESClient._check_call_success on error bodies"""
+    def check():
+        """Return raised error"""
+        try:
+            client._check_call_success(
+                error_response, prefix='Unable to get building'
+            )
+        except APIError as err:
+            return err
+    err = benchmark(check)
+    assert err.status_code == error_response.status_code
+
+
+def test_unroll(benchmark, preview_building):
+    """unroll"""
+    result = benchmark(unroll, preview_building)
+    assert 'floor' in result['blocks'][0]
+
+
+def test_remove_unknown(benchmark, preview_building):
+    """remove_unknown"""
+    result = benchmark(remove_unknown, preview_building)
+    assert 'floor:floor_type' not in result['blocks'][0]
+
+
+@pytest.mark.parametrize('func,names', [
+    (_get_block_resource, list(BLOCK_RESOURCES)),
+    (_get_resource_name, BES_RESOURCES),
+    (_get_resource_type, list(BES_RESOURCE_TYPES.values())),
+], ids=['block_resource', 'resource_name', 'resource_type'])
+def test_resource_lookup(benchmark, func, names):
+    """Resource name conversion and validation, over every valid name"""
+    result = benchmark(lambda: [func(name) for name in names])
+    assert len(result) == len(names)
+
+
+def test_bes_preview_report(benchmark, stub_client):
+    """bes_preview.get_bes_preview_report"""
+    report, status = benchmark(
+        get_bes_preview_report, stub_client, 1, status='Rated', logger=log
+    )
+    assert status == 'Rated'
+    assert report['bes_type'] == 'Preview'
+
+
+def test_bes_full_report(benchmark, stub_client, status_map, base_url):
+    """bes_full.get_bes_full_report"""
+    report, status = benchmark(
+        get_bes_full_report, stub_client, stub_client.full,
+        status_map=status_map, logger=log, base_url=base_url
+    )
+    assert status == 'Rated'
+    assert report['bes_type'] == 'Full'
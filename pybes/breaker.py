@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Circuit breakers for BES API endpoint families.
+
+When an endpoint starts failing (e.g. v1/buildings/{id}/score returning
+500s) calling it for every building only makes the outage worse. A
+CircuitBreaker tracks recent outcomes per endpoint family (the url
+template, e.g. v1/buildings/{id}/score). Once too many fail the circuit
+opens and calls fail fast with CircuitOpenError. After reset_timeout one
+probe call is let through (half open): if it succeeds the circuit closes,
+otherwise it opens again. Use it through CircuitBreakerTransport::
+
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    client = BESClient(..., transport=CircuitBreakerTransport(breaker))
+
+get_bes_buildings and WorkQueue.work defer buildings whose calls hit an
+open circuit, rather than failing them.
+"""
+
+# Imports from Standard Library
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+# Local Imports
+from pybes.pybes import BESError
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:                                     # pragma: no cover
+    from urlparse import urlsplit
+
+# Constants
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+ID_RE = re.compile(r'^\d+$')
+
+
+# Data Structure Definitions
+class CircuitOpenError(BESError):
+    """
+    Call not made as its endpoint family's circuit is open.
+    retry_after is the number of seconds until it will be probed.
+    """
+    pass
+
+
+class _Circuit(object):
+    """State of one endpoint family"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, window):
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=window)    # type: Deque[bool]
+        self.opened_at = 0.0
+        self.probing = False
+
+
+# Public Classes and Functions
+def endpoint_family(url):
+    # type: (str) -> str
+    """Endpoint family (template) of url e.g. v1/buildings/{id}/score"""
+    parts = [
+        '{id}' if ID_RE.match(part) else part
+        for part in urlsplit(url).path.strip('/').split('/') if part
+    ]
+    if 'api' in parts:
+        parts = parts[parts.index('api') + 1:]
+    return '/'.join(parts)
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker per endpoint family. Thread safe.
+
+    A family's circuit opens when, of its last window calls, at least
+    failure_threshold failed and they are at least error_rate of them.
+    """
+
+    def __init__(self, failure_threshold=5, error_rate=0.5, window=20,
+                 reset_timeout=30.0, clock=time.time):
+        # type: (int, float, int, float, Callable[[], float]) -> None
+        """
+        :param failure_threshold: failures needed to open a circuit
+        :param error_rate: fraction of recent calls that must have failed
+        :param window: number of recent calls considered
+        :param reset_timeout: seconds a circuit stays open before a probe
+        :param clock: function returning the current time in seconds
+        """
+        # pylint: disable=too-many-arguments
+        if failure_threshold > window:
+            raise ValueError('failure_threshold must be at most window')
+        self.failure_threshold = failure_threshold
+        self.error_rate = error_rate
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._reset()
+
+    def __getstate__(self):
+        return {
+            key: getattr(self, key) for key in (
+                'failure_threshold', 'error_rate', 'window',
+                'reset_timeout', 'clock',
+            )
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def _reset(self):
+        # type: () -> None
+        """All circuits closed"""
+        self.circuits = {}                  # type: Dict[str, _Circuit]
+        self.opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def _circuit(self, family):
+        # type: (str) -> _Circuit
+        """Circuit for family, created closed"""
+        circuit = self.circuits.get(family)
+        if circuit is None:
+            circuit = self.circuits[family] = _Circuit(self.window)
+        return circuit
+
+    def state(self, family):
+        # type: (str) -> str
+        """CLOSED, OPEN or HALF_OPEN"""
+        with self._lock:
+            circuit = self.circuits.get(family)
+            if circuit is None:
+                return CLOSED
+            if (circuit.state == OPEN and self.clock() - circuit.opened_at
+                    >= self.reset_timeout):
+                return HALF_OPEN
+            return circuit.state
+
+    def states(self):
+        # type: () -> Dict[str, str]
+        """State of each family that isn't closed"""
+        with self._lock:
+            families = list(self.circuits)
+        states = {family: self.state(family) for family in families}
+        return {
+            family: state for family, state in states.items()
+            if state != CLOSED
+        }
+
+    def before(self, family):
+        # type: (str) -> bool
+        """
+        Call before calling family.
+
+        :returns: True if the call is the probe of a half open circuit
+        :raises: CircuitOpenError if the circuit is open, or half open
+            with its probe already in flight
+        """
+        with self._lock:
+            circuit = self._circuit(family)
+            if circuit.state == CLOSED:
+                return False
+            retry_after = circuit.opened_at + self.reset_timeout - self.clock()
+            if retry_after <= 0 and not circuit.probing:
+                circuit.state = HALF_OPEN
+                circuit.probing = True
+                return True
+            self.rejected += 1
+        raise CircuitOpenError(
+            'Circuit open for {}'.format(family), family=family,
+            retry_after=max(0.0, retry_after)
+        )
+
+    def record(self, family, success, probe=False):
+        # type: (str, bool, bool) -> None
+        """
+        Record the outcome of a call allowed by before.
+
+        :param family: endpoint family
+        :param success: the call succeeded
+        :param probe: before returned True for the call
+        """
+        with self._lock:
+            circuit = self._circuit(family)
+            if probe:
+                circuit.probing = False
+                if success:
+                    circuit.state = CLOSED
+                    circuit.outcomes.clear()
+                else:
+                    circuit.state = OPEN
+                    circuit.opened_at = self.clock()
+                    self.opened += 1
+                return
+            if circuit.state != CLOSED:
+                # finished after the circuit opened
+                return
+            circuit.outcomes.append(success)
+            failures = circuit.outcomes.count(False)
+            if (failures >= self.failure_threshold and failures >=
+                    self.error_rate * len(circuit.outcomes)):
+                circuit.state = OPEN
+                circuit.opened_at = self.clock()
+                self.opened += 1
+
+    def retry_after(self, family):
+        # type: (str) -> Optional[float]
+        """Seconds until family is probed, None if closed"""
+        with self._lock:
+            circuit = self.circuits.get(family)
+            if circuit is None or circuit.state == CLOSED:
+                return None
+            return max(
+                0.0, circuit.opened_at + self.reset_timeout - self.clock()
+            )
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+In-process caching for BESClient.
+
+LRUCache is a bounded, thread safe least recently used cache. Passed to
+BESClient as cache, it sits in front of get_block, get_block_resource,
+get_resource and get_resource_type, keyed by (endpoint, id). The client's
+create_* and attach_* methods write new objects through to it, and
+update_* and delete_* invalidate the entries they change. Block resources
+are cached as children of their block: written through with the block
+they were created for, or read through with the block_id of the response.
+Deleting a block invalidates them, and updating or deleting one
+invalidates its block::
+
+    cache = LRUCache(maxsize=2048)
+    client = BESClient(..., cache=cache)
+    ...
+    cache.stats()       # hits, misses, evictions... for sizing
+
+One cache can be shared by several clients using the same account.
+
+NegativeCache remembers building calls that failed in a way that won't
+change until the building does (a 404 score, a failed validation), keyed
+by building id and updated_at. The report helpers (get_bes_buildings,
+get_bes_full_report, get_bes_preview_report) take one as negative_cache
+and skip those calls::
+
+    negative_cache = NegativeCache(ttl=600)
+    get_bes_buildings(incomplete, negative_cache=negative_cache, ...)
+"""
+
+# Imports from Standard Library
+import copy
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Any, Callable, Dict, Hashable, Optional, Set
+
+# Local Imports
+from pybes.pybes import APIError
+
+# Constants
+_MISSING = object()
+
+# status codes of definite failures, None for validation errors returned
+# with a 200
+NEGATIVE_STATUSES = frozenset([None, 404, 422])
+
+
+# Data Structure Definitions
+CacheStats = namedtuple(
+    'CacheStats',
+    ['hits', 'misses', 'evictions', 'invalidations', 'size', 'maxsize']
+)
+
+
+# Public Classes and Functions
+class LRUCache(object):
+    """
+    Bounded least recently used cache. Thread safe.
+
+    Values are copied on the way in and out, so callers may modify what
+    they get back.
+    """
+
+    def __init__(self, maxsize=1024):
+        # type: (int) -> None
+        """
+        :param maxsize: maximum number of entries
+        """
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._data = OrderedDict()          # type: OrderedDict
+        self._parents = {}                  # type: Dict[Hashable, Hashable]
+        self._children = {}     # type: Dict[Hashable, Set[Hashable]]
+        self._lock = threading.Lock()
+        # bumped by every write, so fetches overlapping one aren't stored
+        self._writes = 0
+
+    def __getstate__(self):
+        # a copy in another process starts empty
+        return {'maxsize': self.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state['maxsize'])
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def _set(self, key, value, parent=None):
+        # type: (Hashable, Any, Optional[Hashable]) -> None
+        """Store value as most recent, evicting the least recently used"""
+        self._data.pop(key, None)
+        self._data[key] = value
+        if parent is not None:
+            self._unlink(key)
+            self._parents[key] = parent
+            self._children.setdefault(parent, set()).add(key)
+        while len(self._data) > self.maxsize:
+            evicted, _ = self._data.popitem(last=False)
+            self._unlink(evicted)
+            self.evictions += 1
+
+    def _pop(self, key):
+        # type: (Hashable) -> bool
+        """Remove key, returns True if it was cached"""
+        self._unlink(key)
+        return self._data.pop(key, _MISSING) is not _MISSING
+
+    def _unlink(self, key):
+        # type: (Hashable) -> None
+        """Forget key's parent, if it has one"""
+        parent = self._parents.pop(key, None)
+        if parent is not None:
+            siblings = self._children[parent]
+            siblings.discard(key)
+            if not siblings:
+                del self._children[parent]
+
+    def get(self, key, default=None):
+        # type: (Hashable, Any) -> Any
+        """Cached value for key, or default"""
+        with self._lock:
+            value = self._data.pop(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def set(self, key, value, parent=None):
+        # type: (Hashable, Any, Optional[Hashable]) -> None
+        """
+        Store value for key.
+
+        :param parent: key of the entry value belongs to, see
+            invalidate_children
+        """
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._writes += 1
+            self._set(key, value, parent=parent)
+
+    def get_or_fetch(self, key, fetch, parent=None):
+        # type: (Hashable, Callable[[], Any], Optional[Callable[[Any], Optional[Hashable]]]) -> Any
+        """
+        Cached value for key, or the result of fetch() which is cached.
+
+        fetch is called without holding the lock. Its result is not
+        cached if the cache was written or invalidated meanwhile, as it
+        may be stale.
+
+        :param parent: function returning the key of the entry the
+            fetched value belongs to (or None), see invalidate_children
+        """
+        with self._lock:
+            value = self._data.pop(key, _MISSING)
+            if value is not _MISSING:
+                self._data[key] = value
+                self.hits += 1
+                return copy.deepcopy(value)
+            self.misses += 1
+            writes = self._writes
+        value = fetch()
+        stored = copy.deepcopy(value)
+        parent_key = parent(value) if parent else None
+        with self._lock:
+            if self._writes == writes:
+                self._set(key, stored, parent=parent_key)
+        return value
+
+    def invalidate(self, key):
+        # type: (Hashable) -> bool
+        """Remove key, returns True if it was cached"""
+        with self._lock:
+            self._writes += 1
+            if not self._pop(key):
+                return False
+            self.invalidations += 1
+            return True
+
+    def parent(self, key):
+        # type: (Hashable) -> Optional[Hashable]
+        """Key of the entry key was set with as parent, if any"""
+        with self._lock:
+            return self._parents.get(key)
+
+    def invalidate_children(self, parent):
+        # type: (Hashable) -> int
+        """Remove the entries set with parent, returns how many"""
+        with self._lock:
+            self._writes += 1
+            removed = 0
+            for key in list(self._children.get(parent, ())):
+                removed += self._pop(key)
+            self.invalidations += removed
+            return removed
+
+    def clear(self):
+        # type: () -> None
+        """Remove all entries, statistics are kept"""
+        with self._lock:
+            self._writes += 1
+            self.invalidations += len(self._data)
+            self._data.clear()
+            self._parents.clear()
+            self._children.clear()
+
+    def stats(self):
+        # type: () -> CacheStats
+        """Current statistics"""
+        with self._lock:
+            return CacheStats(
+                self.hits, self.misses, self.evictions, self.invalidations,
+                len(self._data), self.maxsize
+            )
+
+    @property
+    def hit_rate(self):
+        # type: () -> Optional[float]
+        """Fraction of lookups that were hits, None before any lookup"""
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else None
+
+
+def is_negative(err):
+    # type: (Exception) -> bool
+    """True if err is an api answer that won't change until the building does"""
+    return (
+        isinstance(err, APIError)
+        and getattr(err, 'status_code', None) in NEGATIVE_STATUSES
+    )
+
+
+class NegativeCache(object):
+    """
+    Short lived cache of failed building calls. Thread safe.
+
+    Entries are keyed by call kind (e.g. 'score'), building id and the
+    building's updated_at, so are not found once the building changes,
+    and expire after ttl seconds in any case.
+    """
+
+    def __init__(self, ttl=600, maxsize=10000, clock=time.time):
+        # type: (float, int, Callable[[], float]) -> None
+        """
+        :param ttl: seconds entries are kept
+        :param maxsize: maximum number of entries
+        :param clock: function returning the current time in seconds
+        """
+        self.ttl = ttl
+        self.clock = clock
+        self.cache = LRUCache(maxsize)
+
+    def __len__(self):
+        return len(self.cache)
+
+    def get(self, kind, building_id, updated_at):
+        # type: (str, Any, Any) -> Optional[str]
+        """Error recorded for the call, or None"""
+        key = (kind, str(building_id), updated_at)
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        expires, error = entry
+        if expires <= self.clock():
+            self.cache.invalidate(key)
+            return None
+        return error
+
+    def add(self, kind, building_id, updated_at, error):
+        # type: (str, Any, Any, Any) -> None
+        """Record a failed call"""
+        self.cache.set(
+            (kind, str(building_id), updated_at),
+            (self.clock() + self.ttl, str(error))
+        )
+
+    def record(self, kind, building_id, updated_at, err):
+        # type: (str, Any, Any, Exception) -> bool
+        """Record err if is_negative(err), returns True if it was"""
+        if not is_negative(err):
+            return False
+        self.add(kind, building_id, updated_at, err)
+        return True
+
+    def stats(self):
+        # type: () -> CacheStats
+        """Statistics of the underlying LRUCache"""
+        return self.cache.stats()
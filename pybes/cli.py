@@ -0,0 +1,514 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+pybes command line interface for bulk operations.
+
+Subcommands::
+
+    pybes sync               fetch reports for rated buildings (json lines)
+    pybes simulate           validate and simulate buildings
+    pybes validate           validate buildings
+    pybes download-pdfs      download pdf reports
+    pybes export-scores      export scores csv via manage_buildings
+    pybes import-seed        create preview buildings from SEED json
+
+Credentials are taken from --email/--password/--org-token or
+--token/--user-id, or the PYBES_* environment variables. Every subcommand
+takes --workers, --rate-limit, --cache-dir and --checkpoint, and prints a
+throughput summary to stderr when it finishes.
+
+--checkpoint names a file that completed items are appended to, items
+listed there are skipped on the next run. --cache-dir stores each item's
+result, cached results are reused rather than fetched again.
+"""
+
+# Imports from Standard Library
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Local Imports
+from pybes.limiter import RateLimiter
+from pybes.pybes import BESClient, BESError
+from pybes.transports import RateLimitedTransport
+from pybes.utils.bes_full import get_bes_full_report, initiate_full_simulation
+from pybes.utils.bes_preview import (
+    create_bes_preview_bldg_from_seed,
+    get_bes_preview_report,
+    initiate_preview_simulation,
+)
+from pybes.utils.bes_utils import get_full_bldg_status_map
+from pybes.utils.bes_validation import PayloadValidator
+
+# Constants
+log = logging.getLogger(__name__)            # pylint: disable-msg=invalid-name
+
+ENVIRONMENT = {
+    'base_url': 'PYBES_BASE_URL',
+    'email': 'PYBES_EMAIL',
+    'password': 'PYBES_PASSWORD',
+    'organization_token': 'PYBES_ORG_TOKEN',
+    'access_token': 'PYBES_TOKEN',
+    'user_id': 'PYBES_USER_ID',
+}
+DEFAULT_WORKERS = 4
+EXPORT_CHUNK_SIZE = 50
+
+
+# Data Structure Definitions
+class Checkpoint(object):
+    """
+    Append only record of completed items, one 'command key' per line.
+    Thread safe. A path of None records nothing.
+    """
+
+    def __init__(self, path, command):
+        # type: (Optional[str], str) -> None
+        self.path = path
+        self.command = command
+        self.done = set()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as fil:
+                for line in fil:
+                    parts = line.split()
+                    if len(parts) == 2 and parts[0] == command:
+                        self.done.add(parts[1])
+
+    def __contains__(self, key):
+        return str(key) in self.done
+
+    def add(self, key):
+        # type: (Any) -> None
+        """Record key as done"""
+        key = str(key)
+        with self._lock:
+            self.done.add(key)
+            if self.path:
+                with open(self.path, 'a') as fil:
+                    fil.write('{} {}\n'.format(self.command, key))
+
+
+class Cache(object):
+    """Item results stored as json files in directory. None disables."""
+
+    def __init__(self, directory, command):
+        # type: (Optional[str], str) -> None
+        self.directory = (
+            os.path.join(directory, command) if directory else None
+        )
+        if self.directory and not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def _path(self, key):
+        # type: (Any) -> str
+        """File for key"""
+        return os.path.join(self.directory, '{}.json'.format(key))
+
+    def get(self, key):
+        # type: (Any) -> Any
+        """Cached result for key, or None"""
+        if not self.directory or not os.path.exists(self._path(key)):
+            return None
+        with open(self._path(key)) as fil:
+            return json.load(fil)
+
+    def set(self, key, value):
+        # type: (Any, Any) -> None
+        """Cache result"""
+        if self.directory:
+            tmp = '{}.tmp'.format(self._path(key))
+            with open(tmp, 'w') as fil:
+                json.dump(value, fil)
+            os.rename(tmp, self._path(key))
+
+
+class Summary(object):
+    """Counts of item outcomes and throughput"""
+
+    def __init__(self, command):
+        # type: (str) -> None
+        self.command = command
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.cached = 0
+        self.started = time.time()
+        self.elapsed = 0.0
+
+    def __str__(self):
+        rate = self.done / self.elapsed if self.elapsed else 0.0
+        return (
+            '{}: {} done ({} cached), {} failed, {} skipped in {:.1f}s '
+            '({:.1f}/s)'.format(
+                self.command, self.done, self.cached, self.failed,
+                self.skipped, self.elapsed, rate
+            )
+        )
+
+
+# Private Functions
+def _bes_kwargs(opts):
+    # type: (argparse.Namespace) -> Dict[str, Any]
+    """BESClient kwargs from options, rate limited if required"""
+    kwargs = {
+        key: getattr(opts, key) for key in ENVIRONMENT
+        if getattr(opts, key) is not None
+    }
+    if opts.rate_limit:
+        kwargs['transport'] = RateLimitedTransport(
+            RateLimiter(opts.rate_limit)
+        )
+    return kwargs
+
+
+def _open_output(path):
+    """File to write output to, stdout if path is None or -"""
+    if not path or path == '-':
+        return sys.stdout
+    return open(path, 'w')
+
+
+def _building_ids(client, opts):
+    # type: (BESClient, argparse.Namespace) -> List[int]
+    """Building ids from the command line or listed from the API"""
+    if opts.ids:
+        return opts.ids
+    preview_ids = [
+        bldg['building_id'] for bldg in client.list_preview_buildings()
+    ]
+    if not getattr(opts, 'full', False):
+        return preview_ids
+    preview_ids = set(preview_ids)
+    return [
+        bldg['id'] for bldg in client.list_buildings()
+        if bldg['id'] not in preview_ids
+    ]
+
+
+def _run(opts, items, func, key=str, cacheable=lambda result: True):
+    # type: (argparse.Namespace, Iterable, Callable, Callable, Callable) -> Tuple[List, Summary]
+    """
+    Call func(item) for each item on opts.workers threads.
+
+    Items whose key is in the checkpoint are skipped, cached results are
+    used in place of calling func. Results for which cacheable returns
+    True are cached and checkpointed.
+
+    :returns: list of (item, result) for completed items, summary
+    """
+    summary = Summary(opts.command)
+    checkpoint = Checkpoint(opts.checkpoint, opts.command)
+    cache = Cache(opts.cache_dir, opts.command)
+    results = []
+    pending = []
+    for item in items:
+        item_key = key(item)
+        if item_key in checkpoint:
+            summary.skipped += 1
+            continue
+        cached = cache.get(item_key)
+        if cached is not None:
+            summary.cached += 1
+            summary.done += 1
+            results.append((item, cached))
+        else:
+            pending.append(item)
+
+    with ThreadPoolExecutor(max_workers=opts.workers) as executor:
+        futures = {executor.submit(func, item): item for item in pending}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                result = future.result()
+            except (BESError, ValueError, IOError) as err:
+                summary.failed += 1
+                log.error('%s %s failed: %s', opts.command, key(item), err)
+                continue
+            if cacheable(result):
+                summary.done += 1
+                cache.set(key(item), result)
+                checkpoint.add(key(item))
+                results.append((item, result))
+            else:
+                summary.failed += 1
+    summary.elapsed = time.time() - summary.started
+    return results, summary
+
+
+# Subcommands
+def sync_reports(opts):
+    # type: (argparse.Namespace) -> Summary
+    """Fetch reports for rated buildings, written as json lines"""
+    bes_kwargs = _bes_kwargs(opts)
+    client = BESClient(**bes_kwargs)
+    status_map = get_full_bldg_status_map(**bes_kwargs)
+    preview_ids = set(
+        bldg['building_id'] for bldg in client.list_preview_buildings()
+    )
+    buildings = client.list_buildings()
+    if opts.ids:
+        ids = set(opts.ids)
+        buildings = [bldg for bldg in buildings if bldg['id'] in ids]
+
+    def report(bldg):
+        """Report for building"""
+        status = status_map.get(bldg['status_type_id'])
+        if bldg['id'] in preview_ids:
+            result, status = get_bes_preview_report(
+                client, bldg['id'], status=status
+            )
+        else:
+            result, status = get_bes_full_report(
+                client, bldg, status_map=status_map, **bes_kwargs
+            )
+        if not result:
+            log.warning('%s not rated: %s', bldg['id'], status)
+        return dict(result) if result else None
+
+    results, summary = _run(
+        opts, buildings, report, key=lambda bldg: bldg['id'],
+        cacheable=lambda result: result is not None
+    )
+    output = _open_output(opts.output)
+    for _, result in results:
+        output.write(json.dumps(result, sort_keys=True) + '\n')
+    if output is not sys.stdout:
+        output.close()
+    return summary
+
+
+def bulk_simulate(opts):
+    # type: (argparse.Namespace) -> Summary
+    """Validate and simulate buildings"""
+    bes_kwargs = _bes_kwargs(opts)
+    client = BESClient(**bes_kwargs)
+    if opts.full:
+        status_map = get_full_bldg_status_map(**bes_kwargs)
+        simulate = lambda building_id: initiate_full_simulation(
+            client, building_id, status_map=status_map, logger=log
+        )
+    else:
+        simulate = lambda building_id: initiate_preview_simulation(
+            client, building_id, logger=log
+        )
+    results, summary = _run(
+        opts, _building_ids(client, opts), simulate,
+        cacheable=lambda status: status in ('Running', 'Rated', 'Submitted')
+    )
+    for building_id, status in results:
+        print('{} {}'.format(building_id, status))
+    return summary
+
+
+def bulk_validate(opts):
+    # type: (argparse.Namespace) -> Summary
+    """Validate buildings"""
+    client = BESClient(**_bes_kwargs(opts))
+
+    def validate(building_id):
+        """Validation result"""
+        try:
+            if opts.full:
+                client.validate_building(building_id)
+            else:
+                client.validate_preview_building(building_id)
+        except BESError as err:
+            print('{} invalid: {}'.format(building_id, err))
+            return None
+        print('{} valid'.format(building_id))
+        return 'valid'
+
+    _, summary = _run(
+        opts, _building_ids(client, opts), validate,
+        cacheable=lambda result: result is not None
+    )
+    return summary
+
+
+def download_pdfs(opts):
+    # type: (argparse.Namespace) -> Summary
+    """Download pdf reports to output directory"""
+    client = BESClient(**_bes_kwargs(opts))
+    if not os.path.isdir(opts.output_dir):
+        os.makedirs(opts.output_dir)
+
+    def download(building_id):
+        """Download pdf, unless already present"""
+        filename = os.path.join(
+            opts.output_dir, '{}.pdf'.format(building_id)
+        )
+        if not os.path.exists(filename):
+            tmp = '{}.tmp'.format(filename)
+            client.get_pdf(building_id, tmp)
+            os.rename(tmp, filename)
+        return filename
+
+    _, summary = _run(opts, _building_ids(client, opts), download)
+    return summary
+
+
+def export_scores(opts):
+    # type: (argparse.Namespace) -> Summary
+    """Export scores csv via manage_buildings, in chunks"""
+    client = BESClient(**_bes_kwargs(opts))
+    ids = _building_ids(client, opts)
+    chunks = [
+        tuple(ids[idx:idx + opts.chunk_size])
+        for idx in range(0, len(ids), opts.chunk_size)
+    ]
+    results, summary = _run(
+        opts, chunks,
+        lambda chunk: client.manage_buildings(*chunk).decode('utf-8'),
+        key=lambda chunk: '{}-{}'.format(chunk[0], chunk[-1])
+    )
+    output = _open_output(opts.output)
+    header = None
+    for _, csv in sorted(results):
+        lines = csv.splitlines()
+        if not lines:
+            continue
+        if header is None:
+            header = lines[0]
+            output.write(header + '\n')
+        output.writelines(line + '\n' for line in lines[1:])
+    if output is not sys.stdout:
+        output.close()
+    return summary
+
+
+def import_seed(opts):
+    # type: (argparse.Namespace) -> Summary
+    """Create preview buildings from SEED property views json"""
+    client = BESClient(**_bes_kwargs(opts))
+    with open(opts.file) as fil:
+        views = json.load(fil)
+    if isinstance(views, dict):
+        views = views.get('results') or views.get('property_views') or []
+    views = [
+        (view.get('id', idx), view) for idx, view in enumerate(views)
+    ]
+    validator = PayloadValidator.from_client(client)
+    results, summary = _run(
+        opts, views,
+        lambda item: create_bes_preview_bldg_from_seed(
+            client, item[1], validator=validator
+        ),
+        key=lambda item: item[0]
+    )
+    for (view_id, _), building in results:
+        print(json.dumps({
+            'property_view': view_id,
+            'building_id': building.get('building_id'),
+        }))
+    return summary
+
+
+COMMANDS = {
+    'sync': sync_reports,
+    'simulate': bulk_simulate,
+    'validate': bulk_validate,
+    'download-pdfs': download_pdfs,
+    'export-scores': export_scores,
+    'import-seed': import_seed,
+}
+
+
+# Public Functions
+def make_parser():
+    # type: () -> argparse.ArgumentParser
+    """Argument parser"""
+    shared = argparse.ArgumentParser(add_help=False)
+    auth = shared.add_argument_group('authentication')
+    auth.add_argument('--base-url', dest='base_url',
+                      default=os.environ.get(ENVIRONMENT['base_url']))
+    auth.add_argument('--email', default=os.environ.get(ENVIRONMENT['email']))
+    auth.add_argument('--password',
+                      default=os.environ.get(ENVIRONMENT['password']))
+    auth.add_argument('--org-token', dest='organization_token',
+                      default=os.environ.get(
+                          ENVIRONMENT['organization_token']
+                      ))
+    auth.add_argument('--token', dest='access_token',
+                      default=os.environ.get(ENVIRONMENT['access_token']))
+    auth.add_argument('--user-id', dest='user_id', type=int,
+                      default=os.environ.get(ENVIRONMENT['user_id']))
+    tuning = shared.add_argument_group('bulk options')
+    tuning.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='concurrent requests (default %(default)s)')
+    tuning.add_argument('--rate-limit', type=float, default=None,
+                        help='max requests per second')
+    tuning.add_argument('--cache-dir', default=None,
+                        help='reuse results stored here')
+    tuning.add_argument('--checkpoint', default=None,
+                        help='skip items recorded here, record completed')
+    tuning.add_argument('-v', '--verbose', action='store_true')
+
+    parser = argparse.ArgumentParser(
+        prog='pybes', description='Bulk operations on the BES API'
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    ids_help = 'building ids (default all listed)'
+
+    sub = subparsers.add_parser('sync', parents=[shared],
+                                help=sync_reports.__doc__)
+    sub.add_argument('ids', nargs='*', type=int, help=ids_help)
+    sub.add_argument('-o', '--output', help='json lines file (default stdout)')
+
+    for name, func in (('simulate', bulk_simulate),
+                       ('validate', bulk_validate)):
+        sub = subparsers.add_parser(name, parents=[shared], help=func.__doc__)
+        sub.add_argument('ids', nargs='*', type=int, help=ids_help)
+        sub.add_argument('--full', action='store_true',
+                         help='v1 (full) rather than preview buildings')
+
+    sub = subparsers.add_parser('download-pdfs', parents=[shared],
+                                help=download_pdfs.__doc__)
+    sub.add_argument('ids', nargs='*', type=int, help=ids_help)
+    sub.add_argument('--full', action='store_true',
+                     help='v1 (full) rather than preview buildings')
+    sub.add_argument('-d', '--output-dir', default='.')
+
+    sub = subparsers.add_parser('export-scores', parents=[shared],
+                                help=export_scores.__doc__)
+    sub.add_argument('ids', nargs='*', type=int, help=ids_help)
+    sub.add_argument('--full', action='store_true',
+                     help='v1 (full) rather than preview buildings')
+    sub.add_argument('-o', '--output', help='csv file (default stdout)')
+    sub.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+                     help='buildings per request (default %(default)s)')
+
+    sub = subparsers.add_parser('import-seed', parents=[shared],
+                                help=import_seed.__doc__)
+    sub.add_argument('file', help='SEED property views json')
+    return parser
+
+
+def main(args=None):
+    # type: (Optional[List[str]]) -> int
+    """pybes console script"""
+    opts = make_parser().parse_args(args)
+    logging.basicConfig(
+        level=logging.INFO if opts.verbose else logging.WARNING,
+        format='%(levelname)s %(message)s'
+    )
+    if not opts.base_url:
+        sys.stderr.write('pybes: --base-url or PYBES_BASE_URL required\n')
+        return 2
+    summary = COMMANDS[opts.command](opts)
+    sys.stderr.write('{}\n'.format(summary))
+    return 1 if summary.failed else 0
+
+
+if __name__ == '__main__':                              # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Client side rate limiting.
+
+The BES API rate limits each user token. A RateLimiter shared by every
+thread making calls with a token keeps them under that limit, rather than
+relying on 429 responses. Use it through RateLimitedTransport::
+
+    limiter = RateLimiter(5)
+    client = BESClient(..., transport=RateLimitedTransport(limiter))
+
+An AdaptiveLimiter instead limits the number of calls in flight, finding
+the limit as it goes (additive increase, multiplicative decrease). Bulk
+helpers can then be given plenty of workers, with the limiter deciding
+how many calls they actually make at once::
+
+    limiter = AdaptiveLimiter(initial=4, maximum=32)
+    client = BESClient(..., transport=ConcurrencyLimitedTransport(limiter))
+    BatchSession(client, max_workers=32)
+    ...
+    limiter.limit       # current limit, also in limiter.to_prometheus()
+"""
+
+# Imports from Standard Library
+import threading
+import time
+from collections import deque, namedtuple
+from typing import Callable, Deque, List, Optional
+
+# Constants
+NAMESPACE = 'pybes'
+
+
+# Data Structure Definitions
+Permit = namedtuple('Permit', ['generation', 'saturated', 'start'])
+
+
+# Public Classes and Functions
+class RateLimiter(object):
+    """
+    Token bucket rate limiter. Thread safe.
+
+    Allows rate calls per second on average, with bursts of up to burst
+    calls.
+
+    A pickled copy (e.g. passed to another process) has the same rate and
+    burst but a bucket of its own, so divide rate between processes.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.time, sleep=time.sleep):
+        # type: (float, Optional[float], Callable[[], float], Callable[[float], None]) -> None
+        """
+        :param rate: calls per second
+        :param burst: bucket size, default max(rate, 1)
+        :param clock: function returning the current time in seconds
+        :param sleep: function used to wait
+        """
+        if not rate or rate <= 0:
+            raise ValueError('rate must be greater than 0')
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.clock = clock
+        self.sleep = sleep
+        self._reset()
+
+    def __getstate__(self):
+        return {
+            'rate': self.rate, 'burst': self.burst, 'clock': self.clock,
+            'sleep': self.sleep,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def _reset(self):
+        # type: () -> None
+        """Start with a full bucket"""
+        self.tokens = self.burst
+        self.updated = self.clock()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # type: (float) -> None
+        """Add tokens for time since last refill"""
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        # type: (float) -> bool
+        """Take tokens if available without waiting"""
+        with self._lock:
+            self._refill(self.clock())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        # type: (float) -> float
+        """
+        Take tokens, waiting until they are available.
+
+        Tokens are reserved before waiting, so callers are served in the
+        order they arrive.
+
+        :returns: seconds waited
+        """
+        with self._lock:
+            self._refill(self.clock())
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.waited += wait
+        if wait:
+            self.sleep(wait)
+        return wait
+
+
+class AdaptiveLimiter(object):
+    """
+    Concurrency limiter that adapts its limit (AIMD). Thread safe.
+
+    Each call takes a permit with acquire, waiting while limit calls are
+    in flight, and hands it back to release with the response status.
+
+    * While at least half the limit is in use and calls succeed it is
+      raised by increase / limit per call, i.e. by up to increase each
+      round trip.
+    * On 429, 5xx or a connection error, or when the 95th percentile
+      latency of the last window calls rises above latency_tolerance times
+      the baseline, it is multiplied by decrease. Calls that started
+      before a cut don't cut it again, so a burst of errors from calls
+      already in flight counts once.
+
+    The baseline is the lowest 95th percentile latency seen, but moves
+    baseline_decay of the way towards each higher one, so after a lasting
+    change in the api's latency it stops cutting the limit.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, initial=4, minimum=1, maximum=64, increase=1.0,
+                 decrease=0.5, window=20, latency_tolerance=2.0,
+                 baseline_decay=0.01, clock=time.time):
+        # type: (int, int, int, float, float, int, float, float, Callable[[], float]) -> None
+        """
+        :param initial: starting limit
+        :param minimum: lowest limit
+        :param maximum: highest limit
+        :param increase: added to the limit each round trip
+        :param decrease: factor applied to the limit when congested
+        :param window: calls used for the latency percentile
+        :param latency_tolerance: p95 latency above this multiple of the
+            baseline counts as congestion
+        :param baseline_decay: fraction of the way the baseline moves
+            towards a higher p95, per call
+        :param clock: function returning the current time in seconds
+        """
+        # pylint: disable=too-many-arguments
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError('Must have 1 <= minimum <= initial <= maximum')
+        if not 0 < decrease < 1:
+            raise ValueError('decrease must be between 0 and 1')
+        if not 0 <= baseline_decay <= 1:
+            raise ValueError('baseline_decay must be between 0 and 1')
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = float(increase)
+        self.decrease = decrease
+        self.window = window
+        self.latency_tolerance = latency_tolerance
+        self.baseline_decay = baseline_decay
+        self.clock = clock
+        self.initial = initial
+        self._reset()
+
+    def __getstate__(self):
+        return {
+            key: getattr(self, key) for key in (
+                'initial', 'minimum', 'maximum', 'increase', 'decrease',
+                'window', 'latency_tolerance', 'baseline_decay', 'clock',
+            )
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def _reset(self):
+        # type: () -> None
+        """Start at the initial limit"""
+        self._limit = float(self.initial)
+        self.in_flight = 0
+        self.generation = 0
+        self.increases = 0
+        self.decreases = 0
+        self.baseline = None                # type: Optional[float]
+        self.latencies = deque(maxlen=self.window)   # type: Deque[float]
+        self._cond = threading.Condition(threading.Lock())
+
+    @property
+    def limit(self):
+        # type: () -> int
+        """Current limit"""
+        return int(self._limit)
+
+    def acquire(self):
+        # type: () -> Permit
+        """Wait until a call can be made"""
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+            return Permit(
+                self.generation, 2 * self.in_flight >= self.limit,
+                self.clock()
+            )
+
+    def _cut(self, permit):
+        # type: (Permit) -> None
+        """Decrease limit, once per generation"""
+        if permit.generation != self.generation:
+            return
+        self._limit = max(self.minimum, self._limit * self.decrease)
+        self.generation += 1
+        self.decreases += 1
+        self.latencies.clear()
+
+    def _p95(self):
+        # type: () -> float
+        """95th percentile of latencies"""
+        latencies = sorted(self.latencies)
+        return latencies[int(0.95 * (len(latencies) - 1))]
+
+    def release(self, permit, status=None, error=False):
+        # type: (Permit, Optional[int], bool) -> None
+        """
+        Record a finished call.
+
+        :param permit: returned by acquire
+        :param status: response status code
+        :param error: call failed without a response
+        """
+        latency = self.clock() - permit.start
+        with self._cond:
+            self.in_flight -= 1
+            if error or status == 429 or (status or 0) >= 500:
+                self._cut(permit)
+            else:
+                self.latencies.append(latency)
+                if len(self.latencies) == self.window:
+                    p95 = self._p95()
+                    if self.baseline is None or p95 < self.baseline:
+                        self.baseline = p95
+                    else:
+                        if p95 > self.baseline * self.latency_tolerance:
+                            self._cut(permit)
+                        self.baseline += self.baseline_decay * (
+                            p95 - self.baseline
+                        )
+                if (permit.saturated and permit.generation == self.generation
+                        and self._limit < self.maximum):
+                    limit = self.limit
+                    self._limit = min(
+                        self.maximum, self._limit + self.increase / limit
+                    )
+                    if self.limit > limit:
+                        self.increases += 1
+            self._cond.notify_all()
+
+    def to_prometheus(self, namespace=NAMESPACE):
+        # type: (str) -> str
+        """Limit, calls in flight and adjustments as Prometheus text"""
+        lines = []                              # type: List[str]
+        with self._cond:
+            for metric, kind, value, help_text in (
+                    ('concurrency_limit', 'gauge', self.limit,
+                     'Adaptive concurrency limit.'),
+                    ('concurrency_in_flight', 'gauge', self.in_flight,
+                     'Calls in flight.'),
+                    ('concurrency_increases_total', 'counter',
+                     self.increases, 'Concurrency limit increases.'),
+                    ('concurrency_decreases_total', 'counter',
+                     self.decreases, 'Concurrency limit decreases.')):
+                metric = '{}_{}'.format(namespace, metric)
+                lines.append('# HELP {} {}'.format(metric, help_text))
+                lines.append('# TYPE {} {}'.format(metric, kind))
+                lines.append('{} {}'.format(metric, value))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Collectors for BESClient request hooks.
+
+Each collector is a callable taking a RequestEvent, so can be passed to
+BESClient(hooks=[...]) or appended to client.hooks::
+
+    histogram = HistogramCollector()
+    client = BESClient(..., hooks=[histogram])
+    ...
+    histogram.summary()         # per endpoint counts, bytes, latencies
+    histogram.to_prometheus()   # Prometheus text exposition format
+
+OpenTelemetryCollector needs opentelemetry-api
+(``pip install py-bes[otel]``).
+
+AdaptiveTimeouts sets each endpoint's read timeout from the latencies a
+HistogramCollector has seen::
+
+    client = BESClient(
+        ..., hooks=[histogram], timeouts=AdaptiveTimeouts(histogram)
+    )
+"""
+
+# Imports from Standard Library
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+# Local Imports
+from pybes.pybes import CONNECT_TIMEOUT
+
+# Constants
+# seconds, as used by the Prometheus client libraries
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0,
+    7.5, 10.0
+)
+NAMESPACE = 'pybes'
+
+
+# Data Structure Definitions
+class _Series(object):
+    """Counts for one endpoint, method and status"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, n_buckets):
+        self.count = 0
+        self.latency = 0.0
+        self.bytes = 0
+        self.retries = 0
+        # last bucket is +Inf
+        self.buckets = [0] * (n_buckets + 1)
+
+
+# Private Functions
+def _labels(endpoint, method, status):
+    # type: (str, str, Optional[int]) -> str
+    """Prometheus label set"""
+    return 'endpoint="{}",method="{}",status="{}"'.format(
+        endpoint, method, status if status is not None else 'error'
+    )
+
+
+# Public Classes and Functions
+class HistogramCollector(object):
+    """
+    In-memory latency histograms, call, byte and retry counts by
+    endpoint template, method and status. Thread safe.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        # type: (Sequence[float]) -> None
+        """
+        :param buckets: upper bounds of latency buckets in seconds
+        """
+        self.bounds = tuple(sorted(buckets))
+        self.series = OrderedDict()     # type: Dict[Tuple, _Series]
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        # type: (Any) -> None
+        """Record event, a pybes.pybes.RequestEvent"""
+        key = (event.endpoint, event.method, event.status)
+        idx = bisect.bisect_left(self.bounds, event.latency)
+        with self._lock:
+            series = self.series.get(key)
+            if not series:
+                series = self.series[key] = _Series(len(self.bounds))
+            series.count += 1
+            series.latency += event.latency
+            series.bytes += event.bytes
+            series.retries += event.retries
+            series.buckets[idx] += 1
+
+    def reset(self):
+        # type: () -> None
+        """Discard recorded events"""
+        with self._lock:
+            self.series.clear()
+
+    def count(self, endpoint=None, method=None):
+        # type: (Optional[str], Optional[str]) -> int
+        """Number of calls recorded, for endpoint template and method"""
+        with self._lock:
+            return sum(
+                series.count
+                for (s_endpoint, s_method, _), series in self.series.items()
+                if (not endpoint or s_endpoint == endpoint)
+                and (not method or s_method == method)
+            )
+
+    def percentile(self, pct, endpoint=None, method=None):
+        # type: (float, Optional[str], Optional[str]) -> float
+        """
+        Estimate latency percentile from the histogram, as the upper bound
+        of the bucket it falls in (so at most the bucket width high).
+
+        :param pct: percentile e.g. 95
+        :param endpoint: restrict to endpoint template
+        :param method: restrict to method
+        :returns: seconds, inf if above the largest bucket, None if nothing
+            was recorded
+        """
+        counts = [0] * (len(self.bounds) + 1)
+        with self._lock:
+            for (s_endpoint, s_method, _), series in self.series.items():
+                if endpoint and s_endpoint != endpoint:
+                    continue
+                if method and s_method != method:
+                    continue
+                counts = [sum(pair) for pair in zip(counts, series.buckets)]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = pct / 100.0 * total
+        seen = 0
+        for bound, count in zip(self.bounds + (float('inf'),), counts):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        # type: () -> List[Dict]
+        """Per endpoint, method and status totals, slowest (total) first"""
+        with self._lock:
+            rows = [
+                {
+                    'endpoint': endpoint, 'method': method, 'status': status,
+                    'count': series.count, 'latency': series.latency,
+                    'mean_latency': series.latency / series.count,
+                    'bytes': series.bytes, 'retries': series.retries,
+                }
+                for (endpoint, method, status), series
+                in self.series.items()
+            ]
+        return sorted(rows, key=lambda row: row['latency'], reverse=True)
+
+    def to_prometheus(self, namespace=NAMESPACE):
+        # type: (str) -> str
+        """Prometheus text exposition format"""
+        name = '{}_request_duration_seconds'.format(namespace)
+        lines = [
+            '# HELP {} BES API request latency.'.format(name),
+            '# TYPE {} histogram'.format(name),
+        ]
+        totals = []
+        with self._lock:
+            for key, series in self.series.items():
+                labels = _labels(*key)
+                cumulative = 0
+                for bound, count in zip(
+                        self.bounds + (float('inf'),), series.buckets):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                        name, labels, le, cumulative
+                    ))
+                lines.append('{}_sum{{{}}} {!r}'.format(
+                    name, labels, series.latency
+                ))
+                lines.append('{}_count{{{}}} {}'.format(
+                    name, labels, series.count
+                ))
+                totals.append((labels, series))
+        for metric, attr, help_text in (
+                ('response_bytes_total', 'bytes', 'Bytes received.'),
+                ('retries_total', 'retries', 'Retried requests.')):
+            metric = '{}_{}'.format(namespace, metric)
+            lines.append('# HELP {} {}'.format(metric, help_text))
+            lines.append('# TYPE {} counter'.format(metric))
+            for labels, series in totals:
+                lines.append('{}{{{}}} {}'.format(
+                    metric, labels, getattr(series, attr)
+                ))
+        return '\n'.join(lines) + '\n'
+
+
+class AdaptiveTimeouts(object):
+    """
+    Read timeouts from observed latencies, for BESClient(timeouts=...).
+    Thread safe.
+
+    An endpoint's read timeout is multiplier times its percentile latency
+    in histogram (which must be one of the client's hooks), between
+    minimum and maximum. Until the endpoint has min_count calls the
+    timeout from fallback (e.g. TIMEOUT_PROFILE) is used, or failing that
+    the client's timeout. Timeouts are recalculated every ttl seconds.
+    """
+    # pylint: disable=too-many-instance-attributes,too-few-public-methods
+
+    def __init__(self, histogram, percentile=99, multiplier=3.0,
+                 minimum=1.0, maximum=60.0, min_count=50,
+                 connect=CONNECT_TIMEOUT, fallback=None, ttl=10.0,
+                 clock=time.time):
+        # type: (HistogramCollector, float, float, float, float, int, float, Optional[Mapping], float, Callable[[], float]) -> None
+        """
+        :param histogram: HistogramCollector recording the client's calls
+        :param percentile: latency percentile
+        :param multiplier: read timeout as a multiple of the percentile
+        :param minimum: shortest read timeout, seconds
+        :param maximum: longest read timeout, seconds
+        :param min_count: calls needed before latency is used
+        :param connect: connect timeout, seconds
+        :param fallback: timeouts by endpoint template until then
+        :param ttl: seconds timeouts are reused for
+        :param clock: function returning the current time in seconds
+        """
+        # pylint: disable=too-many-arguments
+        self.histogram = histogram
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.minimum = minimum
+        self.maximum = maximum
+        self.min_count = min_count
+        self.connect = connect
+        self.fallback = fallback or {}
+        self.ttl = ttl
+        self.clock = clock
+        self._cache = {}            # type: Dict[Tuple[str, str], Tuple]
+        self._lock = threading.Lock()
+
+    def _calculate(self, method, template):
+        # type: (str, str) -> Union[None, float, Tuple[float, float]]
+        """Timeout for endpoint"""
+        if self.histogram.count(template, method) >= self.min_count:
+            latency = self.histogram.percentile(
+                self.percentile, endpoint=template, method=method
+            )
+            read = min(self.maximum, max(self.minimum,
+                                         latency * self.multiplier))
+            return self.connect, read
+        timeout = self.fallback.get('{} {}'.format(method, template))
+        if timeout is None:
+            timeout = self.fallback.get(template)
+        return timeout
+
+    def __call__(self, method, template):
+        # type: (str, str) -> Union[None, float, Tuple[float, float]]
+        """Timeout for method and endpoint template"""
+        key = (method, template)
+        now = self.clock()
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached and now - cached[0] < self.ttl:
+            return cached[1]
+        timeout = self._calculate(method, template)
+        with self._lock:
+            self._cache[key] = (now, timeout)
+        return timeout
+
+
+class OpenTelemetryCollector(object):
+    """
+    Records each request as an OpenTelemetry span.
+
+    Spans are created after the call completes, with its start and end
+    times, so they are children of whatever span was current when the
+    hook ran.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, tracer=None):
+        """
+        :param tracer: opentelemetry tracer, default one named pybes from
+            the global tracer provider
+        """
+        if tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                raise ImportError(
+                    'OpenTelemetryCollector requires opentelemetry-api: '
+                    'pip install py-bes[otel]'
+                )
+            tracer = trace.get_tracer(NAMESPACE)
+        self.tracer = tracer
+
+    def __call__(self, event):
+        # type: (Any) -> None
+        """Record event (a pybes.pybes.RequestEvent) as a span"""
+        start = int(event.start * 1e9)
+        attributes = {
+            'http.method': event.method,
+            'http.route': event.endpoint,
+            'http.response_content_length': event.bytes,
+            'pybes.retries': event.retries,
+        }
+        if event.status is not None:
+            attributes['http.status_code'] = event.status
+        span = self.tracer.start_span(
+            '{} {}'.format(event.method, event.endpoint),
+            start_time=start, attributes=attributes
+        )
+        span.end(end_time=start + int(event.latency * 1e9))
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Pool of BESClients for spreading load across several API users.
+
+The BES API rate limits each user token, and a building can only be
+accessed by the user that created it. BESClientPool holds a client for
+each account, each with its own RateLimiter, and routes calls for a
+building to the client of the account that owns it. New buildings are
+created by the least busy account, so work spreads evenly and aggregate
+throughput grows with the number of accounts::
+
+    pool = BESClientPool.from_credentials(
+        [{'email': ..., 'password': ..., 'organization_token': ...}, ...],
+        base_url=BASE_URL, rate_limit=5
+    )
+    pool.discover()                     # learn who owns what
+    pool.get_preview_building(building_id)
+    results = pool.map(
+        lambda client, building_id: client.get_building_score(building_id),
+        building_ids, max_workers=16
+    )
+
+Calls that take a building id (see BUILDING_ARGS) are routed
+automatically. For block and resource level calls use
+pool.client_for(building_id).
+"""
+
+# Imports from Standard Library
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional
+
+# Local Imports
+from pybes.limiter import RateLimiter
+from pybes.pybes import BESClient, BESError
+from pybes.transports import RateLimitedTransport
+
+try:
+    from itertools import zip_longest
+except ImportError:                                     # pragma: no cover
+    from itertools import izip_longest as zip_longest
+
+# Constants
+# method: position (after self) or name of the building id argument
+BUILDING_ARGS = {
+    'delete_preview_building': (0, 'id'),
+    'duplicate_preview_building': (0, 'id'),
+    'get_preview_building': (0, 'id'),
+    'set_preview_building_status': (0, 'id'),
+    'simulate_preview_building': (0, 'id'),
+    'update_preview_building': (0, 'building_id'),
+    'validate_preview_building': (0, 'id'),
+    'create_block': (0, 'building_id'),
+    'delete_building': (0, 'id'),
+    'get_building': (0, 'id'),
+    'get_pdf': (0, 'id'),
+    'get_building_blocks': (0, 'building_id'),
+    'get_building_resources': (1, 'building_id'),
+    'get_building_score': (0, 'id'),
+    'simulate_building': (0, 'id'),
+    'update_building': (0, 'id'),
+    'validate_building': (0, 'id'),
+    'create_resource': (1, 'building_id'),
+}
+# methods that create a building, and the key of its id in the response
+CREATE_METHODS = {
+    'create_preview_building': 'building_id',
+    'create_building': 'id',
+    'duplicate_preview_building': 'building_id',
+}
+LIST_METHODS = {
+    'list_buildings': 'id',
+    'list_preview_buildings': 'building_id',
+}
+
+
+# Data Structure Definitions
+class PoolMember(object):
+    """A client in the pool, with its rate limiter and load"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, client, limiter=None):
+        # type: (BESClient, Optional[RateLimiter]) -> None
+        self.client = client
+        self.limiter = limiter
+        self.in_flight = 0
+        self.calls = 0
+
+    def __repr__(self):
+        return '<PoolMember user_id={} in_flight={} calls={}>'.format(
+            self.client.user_id, self.in_flight, self.calls
+        )
+
+
+# Private Functions
+def _building_id(method, args, kwargs):
+    # type: (str, tuple, Dict) -> Any
+    """Building id argument of method call"""
+    position, name = BUILDING_ARGS[method]
+    if name in kwargs:
+        return kwargs[name]
+    if len(args) > position:
+        return args[position]
+    raise TypeError('{}() requires {}'.format(method, name))
+
+
+# Public Classes and Functions
+class BESClientPool(object):
+    """
+    Routes BESClient calls to the client of the account owning the
+    building, or the least busy account for new buildings. Thread safe.
+    """
+
+    def __init__(self, clients, limiters=None):
+        # type: (List[BESClient], Optional[List[RateLimiter]]) -> None
+        """
+        :param clients: authenticated clients, one per account
+        :param limiters: RateLimiter for each client, if not already
+            applied by its transport. Used to prefer accounts with spare
+            rate budget
+        """
+        if not clients:
+            raise BESError('BESClientPool requires at least one client')
+        limiters = limiters or [None] * len(clients)
+        self.members = [
+            PoolMember(client, limiter)
+            for client, limiter in zip(clients, limiters)
+        ]
+        self.owners = {}                # type: Dict[int, PoolMember]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_credentials(cls, credentials, base_url, rate_limit=None,
+                         burst=None, **client_kwargs):
+        # type: (Iterable[Mapping], str, Optional[float], Optional[float], **Any) -> BESClientPool
+        """
+        Create a pool, authenticating a client for each account.
+
+        :param credentials: BESClient kwargs for each account e.g.
+            email, password and organization_token or access_token and
+            user_id
+        :param base_url: api base url
+        :param rate_limit: requests per second allowed for each account
+        :param burst: rate limiter burst size
+        :param client_kwargs: passed to every BESClient e.g. timeout
+        """
+        clients = []
+        limiters = []
+        for creds in credentials:
+            kwargs = dict(client_kwargs, base_url=base_url)
+            kwargs.update(creds)
+            limiter = RateLimiter(rate_limit, burst) if rate_limit else None
+            if limiter:
+                kwargs['transport'] = RateLimitedTransport(
+                    limiter, transport=kwargs.get('transport')
+                )
+            clients.append(BESClient(**kwargs))
+            limiters.append(limiter)
+        return cls(clients, limiters)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __getattr__(self, name):
+        if name in BUILDING_ARGS or name in CREATE_METHODS:
+            return functools.partial(self._call, name)
+        if name in LIST_METHODS:
+            return functools.partial(self._list, name)
+        raise AttributeError(name)
+
+    def _least_busy(self):
+        # type: () -> PoolMember
+        """Member with fewest calls in flight, then most rate budget"""
+        def load(member):
+            """Sort key"""
+            tokens = member.limiter.tokens if member.limiter else 0
+            return (member.in_flight, -tokens, member.calls)
+        with self._lock:
+            return min(self.members, key=load)
+
+    def _member_for(self, building_id, discover=True):
+        # type: (Any, bool) -> PoolMember
+        """
+        Member owning building_id, discovering owners if unknown (and
+        discover is set)
+        """
+        building_id = int(building_id)
+        member = self.owners.get(building_id)
+        if not member and discover:
+            self.discover()
+            member = self.owners.get(building_id)
+        if not member:
+            raise BESError(
+                'Building {} is not owned by any account in the '
+                'pool'.format(building_id),
+                building_id=building_id
+            )
+        return member
+
+    def _run(self, member, method, *args, **kwargs):
+        # type: (PoolMember, str, *Any, **Any) -> Any
+        """Call method on member's client, tracking load"""
+        with self._lock:
+            member.in_flight += 1
+            member.calls += 1
+        try:
+            return getattr(member.client, method)(*args, **kwargs)
+        finally:
+            with self._lock:
+                member.in_flight -= 1
+
+    def _call(self, method, *args, **kwargs):
+        # type: (str, *Any, **Any) -> Any
+        """Route method call"""
+        if method in BUILDING_ARGS:
+            member = self._member_for(_building_id(method, args, kwargs))
+        else:
+            member = self._least_busy()
+        result = self._run(member, method, *args, **kwargs)
+        if method in CREATE_METHODS:
+            new_id = (result or {}).get(CREATE_METHODS[method])
+            if new_id is not None:
+                with self._lock:
+                    self.owners[int(new_id)] = member
+        return result
+
+    def _list(self, method):
+        # type: (str) -> List[Dict]
+        """Combined listing from every account, recording owners"""
+        key = LIST_METHODS[method]
+        buildings = []
+        for member in self.members:
+            listed = self._run(member, method)
+            with self._lock:
+                for bldg in listed:
+                    self.owners[int(bldg[key])] = member
+            buildings.extend(listed)
+        return buildings
+
+    def client_for(self, building_id):
+        # type: (Any) -> BESClient
+        """Client of the account owning building_id"""
+        return self._member_for(building_id).client
+
+    def discover(self):
+        # type: () -> Dict[int, PoolMember]
+        """List every account's buildings to learn their owners"""
+        self._list('list_buildings')
+        return self.owners
+
+    def map(self, func, building_ids, max_workers=None):
+        # type: (Callable[[BESClient, Any], Any], Iterable, Optional[int]) -> List[Any]
+        """
+        Call func(client, building_id) for each building with the owning
+        account's client, on a thread pool.
+
+        :param func: function taking client, building_id
+        :param building_ids: building ids
+        :param max_workers: threads, default 4 per account
+        :returns: results in building_ids order, exceptions raised by func
+            (or BESError for a building no account owns) are returned in
+            place of the result
+        """
+        building_ids = list(building_ids)
+
+        def owner(building_id):
+            """Member owning building_id, or the error finding it"""
+            try:
+                return self._member_for(building_id, discover=False)
+            except (BESError, TypeError, ValueError) as err:
+                return err
+
+        members = [owner(bid) for bid in building_ids]
+        if any(isinstance(member, Exception) for member in members):
+            # one listing for every building not yet known
+            self.discover()
+            members = [owner(bid) for bid in building_ids]
+
+        def run(member, building_id):
+            """Call func, returning exceptions"""
+            with self._lock:
+                member.in_flight += 1
+                member.calls += 1
+            try:
+                return func(member.client, building_id)
+            except Exception as err:        # pylint: disable=broad-except
+                return err
+            finally:
+                with self._lock:
+                    member.in_flight -= 1
+
+        # interleave accounts, so a throttled account does not hold up the
+        # others by taking every worker
+        results = [None] * len(building_ids)
+        queues = {}
+        for idx, member in enumerate(members):
+            if isinstance(member, Exception):
+                results[idx] = member
+            else:
+                queues.setdefault(id(member), []).append(idx)
+        order = [
+            idx for batch in zip_longest(*queues.values())
+            for idx in batch if idx is not None
+        ]
+        workers = max_workers or 4 * len(self.members)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(run, members[idx], building_ids[idx]): idx
+                for idx in order
+            }
+            for future, idx in futures.items():
+                results[idx] = future.result()
+        return results
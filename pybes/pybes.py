@@ -7,18 +7,28 @@ BES API Client"""
 
 
 # Imports from Standard Library
-from collections import (Mapping, Sequence)
+from collections import (Mapping, Sequence, namedtuple)
+import functools
+import logging
+import os
 import string
 import sys
+import threading
+import time
 
 # Imports from External Modules
 import requests
 
+# Local Imports
+from pybes.streaming import CHUNK_SIZE, iter_array
+
 # Config/Constants
 PY3 = sys.version_info[0] == 3
 if PY3:
     basestring = str
 
+log = logging.getLogger(__name__)            # pylint: disable-msg=invalid-name
+
 
 UPPERCASE = set(string.ascii_uppercase)
 LOWERCASE = set(string.ascii_lowercase)
@@ -28,6 +38,8 @@ SYMBOLS = set(string.punctuation)
 
 # http://docs.python-requests.org/en/master/user/quickstart/#timeouts
 TIMEOUT = 10
+# http://docs.python-requests.org/en/master/user/advanced/#timeouts
+CONNECT_TIMEOUT = 3.05
 
 BLOCK_RESOURCES = {
     'air_handler': 'block_air_handlers',
@@ -91,8 +103,47 @@ BES_RESOURCE_TYPES = {
     'zone_layout': 'zone_layouts'
 }
 
+# (connect, read) timeouts by endpoint template, for BESClient(timeouts=...)
+# Reports and csv downloads are slow, resource type lookups and building
+# status checks (get_building, get_preview_building) quick.
+TIMEOUT_PROFILE = {
+    'v1/buildings': (CONNECT_TIMEOUT, 60),
+    'GET v1/buildings/{id}': (CONNECT_TIMEOUT, 5),
+    'v1/buildings/{id}/report': (CONNECT_TIMEOUT, 60),
+    'v1/manage_buildings/csv': (CONNECT_TIMEOUT, 120),
+    'GET v2/preview_buildings/{id}': (CONNECT_TIMEOUT, 5),
+    'v2/preview_buildings/{id}/report': (CONNECT_TIMEOUT, 60),
+}
+TIMEOUT_PROFILE.update({
+    template.format(endpoint): (CONNECT_TIMEOUT, 5)
+    for endpoint in BES_RESOURCE_TYPES.values()
+    for template in ('v1/{}', 'v1/{}/{{id}}')
+})
+
+
+# Emitted to hooks after each api call, see BESClient._request.
+# endpoint is the url template e.g. 'v1/buildings/{id}/score', status is None
+# if no response was received, start is the epoch time the call was made.
+RequestEvent = namedtuple(
+    'RequestEvent',
+    ['endpoint', 'method', 'status', 'bytes', 'latency', 'retries', 'start']
+)
+
 
 # Private Functions and Classes
+def _endpoint_template(endpoint, api_version, kwargs):
+    """Endpoint template e.g. v1/buildings/{id}/score, for metrics."""
+    version = str(kwargs.get('api_version') or api_version)
+    if not version.startswith('v'):
+        version = 'v{}'.format(version)
+    template = "{}/{}".format(version, endpoint.strip('/'))
+    if kwargs.get('id'):
+        template = "{}/{{id}}".format(template)
+    if kwargs.get('action'):
+        template = "{}/{}".format(template, kwargs['action'].strip('/'))
+    return template
+
+
 def _fix_params(params):
     """For v1 api  -- True is True but False is a string"""
     for key, val in params.items():
@@ -114,6 +165,13 @@ def _get_block_resource(block_resource):
     return BLOCK_RESOURCES[blockres], "{}_id".format(blockres)
 
 
+def _parent_block(resource):
+    """Cache key of the block a block resource belongs to, if known"""
+    if isinstance(resource, dict) and resource.get('block_id'):
+        return ('blocks', str(resource['block_id']))
+    return None
+
+
 def _get_resource_name(resource_name):
     """Perform conversions and check is valid"""
     rname = resource_name.lower().replace(' ', '_')
@@ -386,12 +444,31 @@ class APIError(BESError):
 class BESClient(object):
     """
     API Client for BES API
+
+    A client may be shared between threads. If it was created with email,
+    password and organization_token an expired token is refreshed (once,
+    under a lock) when a call is rejected with 401, and the call retried.
+    By default each call uses requests directly; session_per_thread=True
+    keeps a pooled session per thread for connection reuse (see
+    pybes.transports.SessionTransport). Transports, hooks and caches
+    passed in must themselves be thread safe, as all those in pybes are.
+
+    Clients can be pickled, e.g. to pass to a ProcessPoolExecutor. Only
+    the connection settings and current token are kept, with the transport
+    and cache (which pickle as their configuration), so the copy is ready
+    to use without authenticating again. Credentials are only kept if
+    pickle_credentials is set, otherwise the copy can't refresh its token.
+    Hooks are not kept. A client inherited by a forked process is also
+    safe to use.
     """
     # pylint: disable=too-few-public-methods, too-many-instance-attributes
 
     def __init__(self, email=None, password=None, organization_token=None,
                  access_token=None, user_id=None, base_url=None,
-                 api_version=2, timeout=TIMEOUT):
+                 api_version=2, timeout=(CONNECT_TIMEOUT, TIMEOUT),
+                 hooks=None, transport=None, cache=None,
+                 session_per_thread=False, timeouts=None,
+                 pickle_credentials=False):
         # pylint: disable=too-many-arguments
         """
         Set up Client:
@@ -418,8 +495,29 @@ class BESClient(object):
         :type access_token: str
         :param user_id_token: api user_id token
         :type user_id_token: str
-        :param timeout: server timeout in seconds default 0.5
+        :param timeout: server timeout in seconds, or a (connect, read)
+            tuple, default (CONNECT_TIMEOUT, TIMEOUT)
         :type timeout: float
+        :param timeouts: timeouts overriding timeout by endpoint template,
+            e.g. TIMEOUT_PROFILE. Either a mapping with keys like
+            'v1/buildings/{id}/report' or 'GET v1/buildings/{id}/report'
+            or a callable taking method and template and returning a
+            timeout or None, e.g. pybes.metrics.AdaptiveTimeouts
+        :param hooks: callables called with a RequestEvent after each api
+            call, see pybes.metrics for collectors. Can also be appended
+            to client.hooks.
+        :type hooks: list
+        :param transport: makes the http calls, default requests. Any object
+            with a request(method, url, **kwargs) method returning a
+            requests.Response, see pybes.transports
+        :param cache: pybes.cache.LRUCache for block, resource and resource
+            type lookups. Kept up to date by this client's writes
+        :param session_per_thread: make calls with a requests.Session per
+            thread (if transport is not set)
+        :param pickle_credentials: keep email, password and
+            organization_token when the client is pickled, so the copy can
+            refresh its token. By default they are dropped and the copy
+            only has the token
         """
         if not base_url:
             raise APIError('Base url must be supplied')
@@ -433,6 +531,17 @@ class BESClient(object):
         self.password = password
         self.organization_token = organization_token
         self.timeout = timeout
+        self.timeouts = timeouts
+        self.hooks = list(hooks) if hooks else []
+        if transport is None and session_per_thread:
+            # imported here as pybes.transports imports this module
+            from pybes.transports import SessionTransport
+            transport = SessionTransport()
+        self.transport = transport
+        self.cache = cache
+        self.pickle_credentials = pickle_credentials
+        self._token_lock = threading.Lock()
+        self._pid = os.getpid()
         if access_token:
             self.token = access_token
             self.user_id = user_id
@@ -471,6 +580,65 @@ class BESClient(object):
         token = response.json()['token']
         return user_id, token
 
+    def __getstate__(self):
+        """Descriptor used to pickle client"""
+        state = {
+            key: getattr(self, key, None) for key in (
+                'base_url', 'api_version', 'email', 'password',
+                'organization_token', 'token', 'user_id', 'timeout',
+                'timeouts', 'transport', 'cache', 'pickle_credentials',
+            )
+        }
+        if state['token'] is None:
+            del state['token']
+        if not state['pickle_credentials']:
+            for key in ('email', 'password', 'organization_token'):
+                state[key] = None
+        if callable(state['timeouts']):
+            # e.g. AdaptiveTimeouts, fed by hooks which aren't kept
+            state['timeouts'] = None
+        return state
+
+    def __setstate__(self, state):
+        """Rebuild client from descriptor, no api calls are made"""
+        self.__dict__.update(state)
+        self.hooks = []
+        self._token_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _can_refresh_token(self):
+        """True if the client has credentials to get a new token"""
+        return bool(self.email and self.password and self.organization_token)
+
+    def refresh_token(self, stale=None):
+        """
+        Obtain a new access token. Thread safe.
+
+        If stale is given and the client's token has already been replaced
+        (e.g. by another thread) the current token is returned instead.
+
+        :param stale: token that was rejected
+        :type stale: str
+        :returns: str -- token
+        :raises: APIError
+        """
+        if self._pid != os.getpid():
+            # forked, the lock may be held by a thread that wasn't copied
+            self._token_lock = threading.Lock()
+            self._pid = os.getpid()
+        with self._token_lock:
+            if stale is not None and getattr(self, 'token', None) != stale:
+                return self.token
+            if not self._can_refresh_token():
+                raise APIError(
+                    'Unable to refresh token: email, password and '
+                    'organization_token are required'
+                )
+            self.user_id, self.token = self._authenticate(
+                self.email, self.password, self.organization_token
+            )
+            return self.token
+
     def _check_call_success(self, response, prefix=None, default=None):
         """
         Check if api call was successful.
@@ -580,8 +748,98 @@ class BESClient(object):
             url = "{}/{}".format(url, action)
         return url
 
-    def _get(self, endpoint, compulsory_params=None, noid=False, **kwargs):
-        """Make api calls using GET."""
+    def _request(self, method, url, payload, endpoint, kwargs):
+        """
+        Make api call. All of _get, _post, _put, _patch and _delete go
+        through here. The call is made by self.transport if set, otherwise
+        by requests.
+
+        If there are any hooks each is called with a RequestEvent once the
+        call completes (or fails). Errors raised by hooks are logged, not
+        raised.
+
+        :param method: requests method e.g. 'get'
+        :param url: url
+        :param payload: keyword arguments for the requests method
+        :param endpoint: endpoint, used with kwargs to build the template
+        :param kwargs: kwargs passed to _construct_url
+        """
+        template = None
+        if self.timeouts:
+            template = _endpoint_template(endpoint, self.api_version, kwargs)
+            timeout = self._endpoint_timeout(method.upper(), template)
+            if timeout is not None:
+                payload = dict(payload, timeout=timeout)
+        if self.transport:
+            send = functools.partial(self.transport.request, method)
+        else:
+            send = getattr(requests, method)
+        if not self.hooks:
+            return self._send(send, url, payload, endpoint)[0]
+        start = time.time()
+        status = None
+        size = 0
+        retries = 0
+        try:
+            response, retries = self._send(send, url, payload, endpoint)
+            status = response.status_code
+            if payload.get('stream'):
+                # reading content would load the whole body
+                size = int(response.headers.get('Content-Length') or 0)
+            else:
+                size = len(response.content or b'')
+            return response
+        finally:
+            event = RequestEvent(
+                endpoint=template or _endpoint_template(
+                    endpoint, self.api_version, kwargs
+                ),
+                method=method.upper(), status=status, bytes=size,
+                latency=time.time() - start, retries=retries, start=start
+            )
+            for hook in self.hooks:
+                try:
+                    hook(event)
+                except Exception:          # pylint: disable=broad-except
+                    log.exception('Error in request hook %r', hook)
+
+    def _endpoint_timeout(self, method, template):
+        """Timeout from self.timeouts for endpoint, or None"""
+        if callable(self.timeouts):
+            return self.timeouts(method, template)
+        timeout = self.timeouts.get('{} {}'.format(method, template))
+        if timeout is None:
+            timeout = self.timeouts.get(template)
+        return timeout
+
+    def _send(self, send, url, payload, endpoint):
+        """
+        Make call with send, refreshing the token and resending once if it
+        is rejected with 401.
+
+        :returns: response, number of retries
+        """
+        response = send(url, **payload)
+        if (getattr(response, 'status_code', None) != 401
+                or endpoint == 'users/authenticate'
+                or not self._can_refresh_token()):
+            return response, 0
+        params = payload.get('json') or payload.get('params') or {}
+        stale = params.get('token')
+        if payload.get('stream'):
+            # release the connection of the unread response
+            response.close()
+        token = self.refresh_token(stale=stale)
+        log.info('Access token refreshed, retrying %s', url)
+        payload = dict(payload)
+        for key in ('json', 'params'):
+            if payload.get(key) and 'token' in payload[key]:
+                payload[key] = dict(payload[key], token=token)
+        return send(url, **payload), 1
+
+    def _get(self, endpoint, compulsory_params=None, noid=False,
+             stream=False, **kwargs):
+        """Make api calls using GET. stream defers reading the body."""
         url = self._construct_url(endpoint, noid=noid, **kwargs)
         params = self._construct_payload(
             kwargs, compulsory_params=compulsory_params
@@ -589,7 +847,9 @@ class BESClient(object):
         payload = {'timeout': self.timeout}
         if params:
             payload['params'] = params
-        api_call = requests.get(url, **payload)
+        if stream:
+            payload['stream'] = True
+        api_call = self._request('get', url, payload, endpoint, kwargs)
         return api_call
 
     def _post(self, endpoint, compulsory_params=None, files=None, **kwargs):
@@ -602,7 +862,7 @@ class BESClient(object):
         if files:
             payload['files'] = files
         payload['json'] = params
-        api_call = requests.post(url, **payload)
+        api_call = self._request('post', url, payload, endpoint, kwargs)
         return api_call
 
     def _put(self, endpoint, compulsory_params=None, files=None,
@@ -619,7 +879,7 @@ class BESClient(object):
             payload['json'] = params
         else:
             payload['params'] = params
-        api_call = requests.put(url, **payload)
+        api_call = self._request('put', url, payload, endpoint, kwargs)
         return api_call
 
     def _patch(self, endpoint, compulsory_params=None, files=None, **kwargs):
@@ -636,7 +896,7 @@ class BESClient(object):
         if files:
             payload['files'] = files
         payload['json'] = params
-        api_call = requests.patch(url, **payload)
+        api_call = self._request('patch', url, payload, endpoint, kwargs)
         return api_call
 
     def _delete(self, endpoint, **kwargs):
@@ -646,9 +906,68 @@ class BESClient(object):
         payload = {'timeout': self.timeout}
         if params:
             payload['params'] = params
-        api_call = requests.delete(url, **payload)
+        api_call = self._request('delete', url, payload, endpoint, kwargs)
         return api_call
 
+    def _iter_list(self, endpoint, prefix, fields, chunk_size, **kwargs):
+        """
+        Yield items of a listing as they are read from the response.
+
+        :raises: APIError
+        """
+        response = self._get(endpoint, stream=True, **kwargs)
+        try:
+            self._check_call_success(response, prefix=prefix)
+            try:
+                for item in iter_array(
+                        response.iter_content(chunk_size), fields=fields):
+                    yield item
+            except ValueError as err:
+                raise APIError('{}: invalid response: {}'.format(prefix, err))
+        finally:
+            response.close()
+
+    def _cached(self, kind, id, fetch, parent=None):
+        """
+        Result of fetch(), read through self.cache if set.
+
+        parent, if given, returns the key of the entry the result belongs
+        to e.g. a block resource's block.
+        """
+        # pylint: disable=redefined-builtin
+        if self.cache is None:
+            return fetch()
+        return self.cache.get_or_fetch((kind, str(id)), fetch, parent=parent)
+
+    def _invalidate(self, kind, id):
+        """Remove (kind, id) from self.cache if set."""
+        # pylint: disable=redefined-builtin
+        if self.cache is not None:
+            self.cache.invalidate((kind, str(id)))
+
+    def _invalidate_block_resource(self, kind, id):
+        """
+        Remove a block resource, and the block it belongs to (as its view
+        includes its resources), from self.cache if set.
+        """
+        # pylint: disable=redefined-builtin
+        if self.cache is not None:
+            block = self.cache.parent((kind, str(id)))
+            self.cache.invalidate((kind, str(id)))
+            if block is not None:
+                self.cache.invalidate(block)
+
+    def _write_through(self, kind, obj, block_id=None):
+        """
+        Store obj returned by a create call in self.cache if set.
+
+        A block resource is stored as a child of its block (block_id), so
+        delete_block can invalidate it.
+        """
+        if self.cache is not None and isinstance(obj, dict) and obj.get('id'):
+            parent = None if block_id is None else ('blocks', str(block_id))
+            self.cache.set((kind, str(obj['id'])), obj, parent=parent)
+
     # Public Methods
     def create_preview_building(self,
                                 assessment_type='Test',
@@ -780,6 +1099,24 @@ class BESClient(object):
         )
         return response.json()
 
+    def iter_preview_buildings(self, fields=None, chunk_size=CHUNK_SIZE):
+        """
+        Iterate over preview buildings (belonging to user), as
+        list_preview_buildings, parsing the response as it is read so
+        memory use doesn't grow with the number of buildings.
+
+        :param fields: keys to keep from each building, default all
+        :type fields: list
+        :param chunk_size: bytes read at a time
+        :type chunk_size: int
+        :raises: APIError
+        :returns: generator of buildings (simple format)
+        """
+        endpoint = 'preview_buildings'
+        return self._iter_list(
+            endpoint, "Unable to list preview buildings", fields, chunk_size
+        )
+
     def set_preview_building_status(self, id, status):
         """
         Set  a preview buildings status.
@@ -1097,7 +1434,9 @@ class BESClient(object):
         self._check_call_success(
             response, prefix="Unable to create block"
         )
-        return response.json()
+        block = response.json()
+        self._write_through('blocks', block)
+        return block
 
     def delete_block(self, id):
         """
@@ -1114,6 +1453,9 @@ class BESClient(object):
         self._check_call_success(
             response, prefix="Unable to delete block"
         )
+        self._invalidate(endpoint, id)
+        if self.cache is not None:
+            self.cache.invalidate_children((endpoint, str(id)))
 
     def get_block(self, id):
         """
@@ -1128,11 +1470,15 @@ class BESClient(object):
         api_version = 1
         endpoint = 'blocks'
         params = {'api_version': api_version}
-        response = self._get(endpoint, id=id, **params)
-        self._check_call_success(
-            response, prefix="Unable to get block"
-        )
-        return response.json()
+
+        def fetch():
+            """Get block from api"""
+            response = self._get(endpoint, id=id, **params)
+            self._check_call_success(
+                response, prefix="Unable to get block"
+            )
+            return response.json()
+        return self._cached(endpoint, id, fetch)
 
     def update_block(self,
                      id,
@@ -1271,6 +1617,7 @@ class BESClient(object):
         self._check_call_success(
             response, prefix="Unable to update block"
         )
+        self._invalidate(endpoint, id)
 
     def attach_block_resource(self, block_resource, block_id, resource_id,
                               **kwargs):
@@ -1313,7 +1660,10 @@ class BESClient(object):
             action, block_id
         )
         self._check_call_success(response, prefix=prefix)
-        return response.json()
+        resource = response.json()
+        self._invalidate(endpoint, block_id)
+        self._write_through(action, resource, block_id=block_id)
+        return resource
 
     def create_block_resource(self, block_resource, block_id, name,
                               **kwargs):
@@ -1357,7 +1707,10 @@ class BESClient(object):
             action, block_id
         )
         self._check_call_success(response, prefix=prefix)
-        return response.json()
+        resource = response.json()
+        self._invalidate(endpoint, block_id)
+        self._write_through(action, resource, block_id=block_id)
+        return resource
 
     def delete_block_resource(self, block_resource, id):
         """
@@ -1387,6 +1740,7 @@ class BESClient(object):
         response = self._delete(endpoint, **params)
         prefix = "Unable to delete {}".format(endpoint)
         self._check_call_success(response, prefix=prefix)
+        self._invalidate_block_resource(endpoint, id)
 
     def get_block_resource(self, block_resource, id):
         """
@@ -1414,10 +1768,14 @@ class BESClient(object):
         # convert to correct format and check validity
         endpoint, _ = _get_block_resource(block_resource)
         params = {'id': id, 'api_version': api_version}
-        response = self._get(endpoint, **params)
-        prefix = "Unable to get {}".format(endpoint)
-        self._check_call_success(response, prefix=prefix)
-        return response.json()
+
+        def fetch():
+            """Get from api"""
+            response = self._get(endpoint, **params)
+            prefix = "Unable to get {}".format(endpoint)
+            self._check_call_success(response, prefix=prefix)
+            return response.json()
+        return self._cached(endpoint, id, fetch, parent=_parent_block)
 
     def get_block_resources(self, block_resource, block_id):
         """
@@ -1492,6 +1850,7 @@ class BESClient(object):
         )
         prefix = "Unable to update {}".format(endpoint)
         self._check_call_success(response, prefix=prefix)
+        self._invalidate_block_resource(endpoint, block_resource_id)
 
     def create_building(self,
                         assessment_type_id,
@@ -1542,6 +1901,22 @@ class BESClient(object):
         )
         return response.json()
 
+    def delete_building(self, id):
+        """
+        Delete a building (using v1 api)
+
+        :param id: id of building
+        :type id: int
+        :rtype: None
+        :raises: APIError
+        """
+        api_version = 1
+        endpoint = 'buildings'
+        response = self._delete(endpoint, id=id, api_version=api_version)
+        self._check_call_success(
+            response, prefix="Unable to delete building"
+        )
+
     def get_building(self, id, report_type=None):
         """
         Get Building Details
@@ -1673,6 +2048,27 @@ class BESClient(object):
         )
         return response.json()
 
+    def iter_buildings(self, fields=None, chunk_size=CHUNK_SIZE):
+        """
+        Iterate over buildings, as list_buildings, parsing the response as
+        it is read so memory use doesn't grow with the number of buildings.
+
+        :param fields: keys to keep from each building, default all,
+            e.g. ('id', 'status_type_id', 'updated_at')
+        :type fields: list
+        :param chunk_size: bytes read at a time
+        :type chunk_size: int
+        :raises: APIError
+        :returns: generator of buildings
+        """
+        api_version = 1
+        endpoint = 'buildings'
+        params = {'api_version': api_version}
+        return self._iter_list(
+            endpoint, "Unable to list buildings", fields, chunk_size,
+            **params
+        )
+
     def manage_buildings(self, *args):
         """
         Download Simulation Results
@@ -1818,7 +2214,9 @@ class BESClient(object):
             action, building_id
         )
         self._check_call_success(response, prefix=prefix)
-        return response.json()
+        resource = response.json()
+        self._write_through(action, resource)
+        return resource
 
     def delete_resource(self, resource_name, id):
         """
@@ -1848,6 +2246,7 @@ class BESClient(object):
         response = self._delete(endpoint, **params)
         prefix = "Unable to delete {}".format(endpoint)
         self._check_call_success(response, prefix=prefix)
+        self._invalidate(endpoint, id)
 
     def get_resource(self, resource_name, id):
         """
@@ -1875,10 +2274,14 @@ class BESClient(object):
         # convert to correct format and check validity
         endpoint = _get_resource_name(resource_name)
         params = {'id': id, 'api_version': api_version}
-        response = self._get(endpoint, **params)
-        prefix = "Unable to get {}".format(endpoint)
-        self._check_call_success(response, prefix=prefix)
-        return response.json()
+
+        def fetch():
+            """Get from api"""
+            response = self._get(endpoint, **params)
+            prefix = "Unable to get {}".format(endpoint)
+            self._check_call_success(response, prefix=prefix)
+            return response.json()
+        return self._cached(endpoint, id, fetch)
 
     def update_resource(self, resource_name, id, **kwargs):
         """
@@ -1910,6 +2313,7 @@ class BESClient(object):
         )
         prefix = "Unable to update {}".format(endpoint)
         self._check_call_success(response, prefix=prefix)
+        self._invalidate(endpoint, id)
 
     def get_resource_type(self, resource_type, id):
         """
@@ -1942,10 +2346,14 @@ class BESClient(object):
         # convert to correct format and check validity
         endpoint = _get_resource_type(resource_type)
         params = {'id': id, 'api_version': api_version}
-        response = self._get(endpoint, **params)
-        prefix = "Unable to get {}".format(endpoint)
-        self._check_call_success(response, prefix=prefix)
-        return response.json()
+
+        def fetch():
+            """Get from api"""
+            response = self._get(endpoint, **params)
+            prefix = "Unable to get {}".format(endpoint)
+            self._check_call_success(response, prefix=prefix)
+            return response.json()
+        return self._cached(endpoint, id, fetch)
 
     def list_resource_types(self, resource_type):
         """
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Incremental parsing of JSON array responses.
+
+list_buildings and list_preview_buildings return every building in one
+JSON array, parsed all at once. BESClient.iter_buildings and
+iter_preview_buildings instead read the response a chunk at a time and
+yield each building as it is parsed, optionally keeping only some of its
+fields, so memory use depends on the size of a building rather than of
+the portfolio::
+
+    for building in client.iter_buildings(
+            fields=('id', 'status_type_id', 'updated_at')):
+        ...
+
+ijson (pip install py-bes[stream]) is used if it is installed, otherwise
+the standard library json decoder.
+"""
+
+# Imports from Standard Library
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+try:
+    import ijson        # pylint: disable=import-error
+except ImportError:                                     # pragma: no cover
+    ijson = None        # pylint: disable=invalid-name
+
+# Constants
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# parser states
+_START, _FIRST, _VALUE, _NEXT = range(4)
+
+
+# Data Structure Definitions
+class _ChunkReader(object):
+    """File like object reading from an iterable of byte chunks"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, chunks):
+        # type: (Iterable[bytes]) -> None
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def read(self, size=-1):
+        # type: (int) -> bytes
+        """Read up to size bytes, all remaining if size is negative"""
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+# Private Functions
+def _project(item, fields):
+    # type: (Any, Optional[Sequence[str]]) -> Any
+    """item with only fields, if it is a dict and fields are given"""
+    if fields is None or not isinstance(item, dict):
+        return item
+    return {key: item[key] for key in fields if key in item}
+
+
+def _iter_ijson(chunks):
+    # type: (Iterable[bytes]) -> Iterator[Any]
+    """Items of the JSON array in chunks, parsed by ijson"""
+    return ijson.items(_ChunkReader(chunks), 'item', use_float=True)
+
+
+def _iter_stdlib(chunks):
+    # type: (Iterable[bytes]) -> Iterator[Any]
+    """
+    Items of the JSON array in chunks, parsed by json.JSONDecoder.
+
+    Only the unparsed part of the array is kept. An item that doesn't
+    decode is retried once the buffer has doubled, so large items don't
+    cost a decode per chunk.
+    """
+    # pylint: disable=too-many-branches
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buf, pos = '', 0
+    state = _START
+    eof = False
+    wanted = 0              # unparsed characters needed before decoding
+    while True:
+        pos = WHITESPACE.match(buf, pos).end()
+        if not eof and (pos == len(buf) or len(buf) - pos < wanted):
+            chunk = next(chunks, None)
+            eof = chunk is None
+            buf = buf[pos:] + utf8.decode(chunk or b'', final=eof)
+            pos = 0
+            continue
+        if pos == len(buf):
+            raise ValueError('Incomplete JSON array')
+        char = buf[pos]
+        if state == _START:
+            if char != '[':
+                raise ValueError('Expected a JSON array')
+            pos += 1
+            state = _FIRST
+        elif state != _VALUE and char == ']':
+            return
+        elif state == _NEXT:
+            if char != ',':
+                raise ValueError("Expected ',' or ']' in JSON array")
+            pos += 1
+            state = _VALUE
+        else:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+                wanted = 2 * (len(buf) - pos)
+                continue
+            if end == len(buf) and not eof:
+                # a number may continue in the next chunk
+                wanted = len(buf) - pos + 1
+                continue
+            wanted = 0
+            pos = end
+            state = _NEXT
+            yield item
+
+
+# Public Classes and Functions
+def iter_array(chunks, fields=None):
+    # type: (Iterable[bytes], Optional[Sequence[str]]) -> Iterator[Any]
+    """
+    Items of a JSON array, parsed incrementally.
+
+    :param chunks: the UTF-8 encoded array e.g. response.iter_content()
+    :param fields: keys to keep from each (dict) item, default all
+    :raises: ValueError if chunks are not a JSON array
+    """
+    items = _iter_ijson(chunks) if ijson else _iter_stdlib(chunks)
+    for item in items:
+        yield _project(item, fields)
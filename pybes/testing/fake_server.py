@@ -0,0 +1,1011 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Local stand-in for the BES API, for load testing and benchmarks.
+
+FakeBESApp implements the v1 and v2 endpoints used by BESClient against an
+in-memory store: authentication, users, preview_buildings, buildings,
+blocks, resources, block resources, resource types, validate/simulate and
+manage_buildings csv. Latency, rate limits, injected errors and how long a
+simulation takes are all configurable. FakeBESServer serves a FakeBESApp
+over HTTP on a local port::
+
+    preview, full = make_portfolio(100, 100)
+    with FakeBESServer(latency=lognormal(0.05), seed=1) as server:
+        server.app.seed(preview=preview, full=full)
+        client = BESClient(
+            access_token=DEFAULT_TOKEN, user_id=DEFAULT_USER_ID,
+            base_url=server.base_url
+        )
+        client.list_buildings()
+
+It can also be run stand alone: python -m pybes.testing.fake_server --help
+"""
+
+# Imports from Standard Library
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+# Local Imports
+from pybes.pybes import BES_RESOURCE_TYPES, BES_RESOURCES, BLOCK_RESOURCES
+from pybes.testing.synthetic import (
+    STATUS_IDS,
+    STATUS_TYPES,
+    USE_TYPES,
+    full_scores,
+    make_portfolio,
+    make_preview_building,
+    preview_scores,
+)
+from pybes.utils.bes_constants import FULL_SCORE_KEYS
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl, urlsplit
+except ImportError:                                     # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qsl, urlsplit
+
+# Constants
+DEFAULT_EMAIL = 'test@example.org'
+DEFAULT_PASSWORD = 'Passw0rd!'
+DEFAULT_ORG_TOKEN = 'org_token'
+DEFAULT_TOKEN = 'token'
+DEFAULT_USER_ID = 1
+
+BLOCK_RESOURCE_ENDPOINTS = set(BLOCK_RESOURCES.values())
+RESOURCE_ENDPOINTS = set(BES_RESOURCES).union(BLOCK_RESOURCE_ENDPOINTS)
+RESOURCE_TYPE_ENDPOINTS = set(BES_RESOURCE_TYPES.values())
+SHAPES = (
+    ('Rectangle', 2), ('L-Shape', 4), ('T-Shape', 4), ('U-Shape', 6),
+    ('H-Shape', 6), ('Cross', 6), ('Trapezoid', 3), ('Triangle', 3),
+)
+PDF = b'%PDF-1.4\n% fake BES report\n%%EOF\n'
+ID_RE = re.compile(r'^\d+$')
+
+
+# Latency distributions
+def constant(seconds):
+    # type: (float) -> Callable[[random.Random], float]
+    """Always seconds"""
+    return lambda rng: seconds
+
+
+def uniform(low, high):
+    # type: (float, float) -> Callable[[random.Random], float]
+    """Uniformly distributed between low and high seconds"""
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal(median, sigma=0.5):
+    # type: (float, float) -> Callable[[random.Random], float]
+    """Log-normally distributed with median seconds (long right tail)"""
+    return lambda rng: rng.lognormvariate(math.log(median), sigma)
+
+
+def _distribution(value):
+    # type: (Any) -> Optional[Callable[[random.Random], float]]
+    """Convert None/seconds/distribution to a distribution (or None)"""
+    if value is None or callable(value):
+        return value
+    return constant(float(value))
+
+
+# Data Structure Definitions
+class _HTTPError(Exception):
+    """Raised by handlers, converted to an error response"""
+
+    def __init__(self, status, error, headers=None):
+        super(_HTTPError, self).__init__(error)
+        self.status = status
+        self.error = error
+        self.headers = headers or {}
+
+
+class _Raw(object):
+    """Non-json response body"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, content, content_type):
+        # type: (bytes, str) -> None
+        self.content = content
+        self.content_type = content_type
+
+
+class _TokenBucket(object):
+    """Simple token bucket rate limiter"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, rate, burst):
+        # type: (float, float) -> None
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.time()
+
+    def take(self, now):
+        # type: (float) -> bool
+        """Take a token, returns False if none are available"""
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+# Public Classes and Functions
+class FakeBESApp(object):
+    """
+    In-memory implementation of the BES API.
+
+    Requests are handled by handle(), which returns status, headers and
+    body so it can be used directly or served by FakeBESServer.
+
+    calls counts requests by method and endpoint template (e.g.
+    'GET v1/buildings/{id}/score'), latencies records the time taken to
+    handle each request and max_in_flight the highest number of requests
+    handled at once.
+    """
+    # pylint: disable=too-many-instance-attributes,too-many-public-methods
+
+    def __init__(self, latency=None, endpoint_latency=None, rate_limit=None,
+                 burst=None, error_rate=0.0, endpoint_errors=None,
+                 error_status=500, simulation_time=0.0, seed=None,
+                 sleep=time.sleep):
+        """
+        :param latency: latency of every request: seconds or distribution
+        :param endpoint_latency: latency by endpoint template, overrides
+                                 latency e.g. {'GET v1/buildings': 2.0}
+        :param rate_limit: max requests per second per token (429 if over)
+        :param burst: rate limit bucket size, default rate_limit
+        :param error_rate: probability a request fails with error_status
+        :param endpoint_errors: error rate by endpoint template
+        :param error_status: status code of injected errors
+        :param simulation_time: time a simulation takes, seconds or
+                                distribution
+        :param seed: random seed, for deterministic runs
+        :param sleep: function used to wait for latency
+        """
+        # pylint: disable=too-many-arguments
+        self.latency = _distribution(latency)
+        self.endpoint_latency = {
+            key: _distribution(val)
+            for key, val in (endpoint_latency or {}).items()
+        }
+        self.rate_limit = rate_limit
+        self.burst = burst or rate_limit
+        self.error_rate = error_rate
+        self.endpoint_errors = endpoint_errors or {}
+        self.error_status = error_status
+        self.simulation_time = _distribution(simulation_time)
+        self.sleep = sleep
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.latencies = []             # type: List[float]
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.users = {}                 # type: Dict[int, Dict]
+        self.tokens = {}                # type: Dict[str, int]
+        self.buildings = {}             # type: Dict[int, Dict]
+        self.objects = {}               # type: Dict[Tuple[str, int], Dict]
+        self.resource_types = self._make_resource_types()
+        self._buckets = {}              # type: Dict[str, _TokenBucket]
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self.add_user(
+            DEFAULT_EMAIL, DEFAULT_PASSWORD, DEFAULT_ORG_TOKEN,
+            token=DEFAULT_TOKEN
+        )
+
+    # setup
+    @staticmethod
+    def _make_resource_types():
+        # type: () -> Dict[str, List[Dict]]
+        """Resource type listings"""
+        resource_types = {}
+        for endpoint in RESOURCE_TYPE_ENDPOINTS:
+            label = endpoint.replace('_types', '').replace('_', ' ').rstrip(
+                's'
+            ).title()
+            resource_types[endpoint] = [
+                {
+                    'id': idx, 'name': '{} {}'.format(label, idx).lower(),
+                    'display_name': '{} {}'.format(label, idx)
+                }
+                for idx in range(1, 4)
+            ]
+        resource_types['status_types'] = [
+            {'id': key, 'name': val.lower(), 'display_name': val}
+            for key, val in sorted(STATUS_TYPES.items())
+        ]
+        resource_types['use_types'] = [
+            {'id': idx, 'name': val.lower(), 'display_name': val}
+            for idx, val in enumerate(USE_TYPES, 1)
+        ]
+        resource_types['shapes'] = [
+            {
+                'id': idx, 'name': val.lower(), 'display_name': val,
+                'number_of_dimensions': dims
+            }
+            for idx, (val, dims) in enumerate(SHAPES, 1)
+        ]
+        return resource_types
+
+    def _new_id(self):
+        # type: () -> int
+        """Get next object id"""
+        with self._lock:
+            return next(self._ids)
+
+    def _reserve_ids(self, max_id):
+        # type: (int) -> None
+        """Make sure new ids are greater than max_id"""
+        with self._lock:
+            current = next(self._ids)
+            self._ids = itertools.count(max(current, max_id + 1))
+
+    def add_user(self, email, password, organization_token, token=None):
+        # type: (str, str, str, Optional[str]) -> Tuple[int, str]
+        """Add an api user, returns user_id, token"""
+        with self._lock:
+            user_id = self._new_id()
+            token = token or 'token-{}'.format(user_id)
+            self.users[user_id] = {
+                'id': user_id, 'email': email, 'password': password,
+                'organization_token': organization_token,
+                'organization_id': 1, 'role_id': 1, 'token': token,
+            }
+            self.tokens[token] = user_id
+        return user_id, token
+
+    def rotate_token(self, user_id):
+        # type: (int) -> str
+        """Expire user's token, authenticating gives the new one"""
+        with self._lock:
+            user = self.users[user_id]
+            self.tokens.pop(user['token'], None)
+            user['token'] = '{}-{}'.format(user['token'].split('-')[0],
+                                           self._new_id())
+            self.tokens[user['token']] = user_id
+            return user['token']
+
+    def seed(self, preview=None, full=None, owner=DEFAULT_USER_ID):
+        # type: (Optional[List[Dict]], Optional[List[Dict]], int) -> None
+        """
+        Add buildings (e.g. from make_portfolio) to the store.
+
+        :param preview: preview buildings in get_preview_building format
+        :param full: full buildings in get_building format
+        :param owner: user_id of owner
+        """
+        with self._lock:
+            max_id = 0
+            for data in preview or []:
+                building_id = data['building_id']
+                self.buildings[building_id] = {
+                    'id': building_id, 'preview': True, 'owner': owner,
+                    'status': data.get('status!', 'Editing'), 'rated_at': None,
+                    'data': dict(data),
+                }
+                for block in data.get('blocks', []):
+                    self.objects[('blocks', block['block_id'])] = {
+                        'id': block['block_id'], 'building_id': building_id
+                    }
+                    max_id = max(max_id, block['block_id'])
+                max_id = max(max_id, building_id)
+            for data in full or []:
+                building_id = data['id']
+                self.buildings[building_id] = {
+                    'id': building_id, 'preview': False, 'owner': owner,
+                    'status': STATUS_TYPES[data.get('status_type_id', 1)],
+                    'rated_at': None, 'data': dict(data),
+                }
+                for endpoint in RESOURCE_ENDPOINTS.union(['blocks']):
+                    for obj in data.get(endpoint, []):
+                        self.objects[(endpoint, obj['id'])] = dict(
+                            obj, building_id=building_id
+                        )
+                        max_id = max(max_id, obj['id'])
+                max_id = max(max_id, building_id)
+            self._reserve_ids(max_id)
+
+    # request handling
+    @staticmethod
+    def template(method, path):
+        # type: (str, str) -> str
+        """Endpoint template for path e.g. GET v1/buildings/{id}/score"""
+        parts = [
+            '{id}' if ID_RE.match(part) else part
+            for part in path.strip('/').split('/') if part
+        ]
+        if parts and parts[0] == 'api':
+            parts = parts[1:]
+        return '{} {}'.format(method.upper(), '/'.join(parts))
+
+    def _delay(self, template):
+        # type: (str) -> float
+        """Latency for template"""
+        dist = self.endpoint_latency.get(template, self.latency)
+        if not dist:
+            return 0.0
+        with self._lock:
+            return max(0.0, dist(self.rng))
+
+    def _check_limits(self, template, token):
+        # type: (str, Optional[str]) -> None
+        """Apply rate limit and error injection"""
+        with self._lock:
+            if self.rate_limit:
+                bucket = self._buckets.get(token)
+                if not bucket:
+                    bucket = self._buckets[token] = _TokenBucket(
+                        self.rate_limit, self.burst
+                    )
+                if not bucket.take(time.time()):
+                    retry_after = max(1, int(math.ceil(1.0 / self.rate_limit)))
+                    raise _HTTPError(
+                        429, 'Rate limit exceeded',
+                        headers={'Retry-After': str(retry_after)}
+                    )
+            error_rate = self.endpoint_errors.get(template, self.error_rate)
+            if error_rate and self.rng.random() < error_rate:
+                raise _HTTPError(self.error_status, 'Injected error')
+
+    def handle(self, method, path, params=None, body=None):
+        # type: (str, str, Optional[Mapping], Any) -> Tuple[int, Dict[str, str], bytes]
+        """
+        Handle a request.
+
+        :param method: http method
+        :param path: url path e.g. /api/v1/buildings/1
+        :param params: query parameters
+        :param body: decoded json body
+        :returns: status code, headers, content
+        """
+        params = dict(params or {})
+        body = body if isinstance(body, dict) else {}
+        template = self.template(method, path)
+        with self._lock:
+            self.calls[template] += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        headers = {}
+        start = time.time()
+        try:
+            delay = self._delay(template)
+            if delay:
+                self.sleep(delay)
+            data = dict(params)
+            data.update(body)
+            token = data.pop('token', None)
+            self._check_limits(template, token)
+            # handlers share the store, so run one at a time (latency is
+            # simulated above, outside the lock)
+            with self._lock:
+                status, payload = self._dispatch(
+                    method.upper(), path, data, token
+                )
+                content = self._encode(payload, headers)
+        except _HTTPError as err:
+            status = err.status
+            headers.update(err.headers)
+            content = self._encode({'error': err.error}, headers)
+        except (KeyError, TypeError, ValueError) as err:
+            # malformed input e.g. int('abc')
+            status = 400
+            content = self._encode({'error': str(err)}, headers)
+        except Exception as err:            # pylint: disable=broad-except
+            status = 500
+            content = self._encode({'error': repr(err)}, headers)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.latencies.append(time.time() - start)
+        return status, headers, content
+
+    @staticmethod
+    def _encode(payload, headers):
+        # type: (Any, Dict[str, str]) -> bytes
+        """Response content for payload, setting Content-Type"""
+        if isinstance(payload, _Raw):
+            headers['Content-Type'] = payload.content_type
+            return payload.content
+        headers['Content-Type'] = 'application/json'
+        return json.dumps(payload).encode('utf-8')
+
+    def _dispatch(self, method, path, data, token):
+        # type: (str, str, Dict, Optional[str]) -> Tuple[int, Any]
+        """Route request to handler"""
+        parts = [part for part in path.strip('/').split('/') if part]
+        if parts and parts[0] == 'api':
+            parts = parts[1:]
+        if len(parts) < 2 or parts[0] not in ('v1', 'v2'):
+            raise _HTTPError(404, 'Not Found')
+        version, endpoint, rest = parts[0], parts[1], parts[2:]
+        obj_id = int(rest[0]) if rest and ID_RE.match(rest[0]) else None
+        action = rest[1] if obj_id is not None and len(rest) > 1 else (
+            rest[0] if rest and obj_id is None else None
+        )
+        if endpoint == 'users':
+            return self._users(method, obj_id, action, data, token)
+        user_id = self._authenticated(token)
+        if version == 'v2' and endpoint == 'preview_buildings':
+            return self._preview_buildings(method, obj_id, action, data,
+                                           user_id)
+        if version == 'v1':
+            if endpoint == 'buildings':
+                return self._buildings(method, obj_id, action, data, user_id)
+            if endpoint == 'blocks':
+                return self._blocks(method, obj_id, action, data)
+            if endpoint == 'manage_buildings' and action == 'csv':
+                return self._csv(data, user_id)
+            if endpoint in RESOURCE_ENDPOINTS and obj_id is not None:
+                return self._resource(method, endpoint, obj_id, data)
+            if endpoint in RESOURCE_TYPE_ENDPOINTS and method == 'GET':
+                return self._resource_type(endpoint, obj_id)
+        raise _HTTPError(404, 'Not Found')
+
+    # helpers
+    def _authenticated(self, token):
+        # type: (Optional[str]) -> int
+        """Get user_id for token"""
+        user_id = self.tokens.get(token)
+        if user_id is None:
+            raise _HTTPError(401, 'Not Authorized')
+        return user_id
+
+    def _get_building(self, building_id, user_id, preview=None):
+        # type: (int, int, Optional[bool]) -> Dict
+        """Get building record, updating status if simulation finished"""
+        record = self.buildings.get(building_id)
+        if not record or record['owner'] != user_id:
+            raise _HTTPError(404, 'Not Found')
+        if preview is not None and record['preview'] != preview:
+            raise _HTTPError(500, 'Internal Server Error')
+        with self._lock:
+            if (record['status'] == 'Running' and record['rated_at']
+                    and time.time() >= record['rated_at']):
+                record['status'] = 'Rated'
+                self._touch(record)
+        return record
+
+    def _get_object(self, endpoint, obj_id):
+        # type: (str, int) -> Dict
+        """Get block, resource etc"""
+        obj = self.objects.get((endpoint, obj_id))
+        if obj is None:
+            raise _HTTPError(404, 'Not Found')
+        return obj
+
+    @staticmethod
+    def _touch(record):
+        # type: (Dict) -> None
+        """Set updated_at"""
+        record['data']['updated_at'] = time.strftime(
+            '%Y-%m-%dT%H:%M:%S+00:00', time.gmtime()
+        )
+
+    @staticmethod
+    def _v2_view(record):
+        # type: (Dict) -> Dict
+        """Preview building in get_preview_building format"""
+        view = dict(record['data'])
+        view['status!'] = record['status']
+        return view
+
+    @staticmethod
+    def _v1_view(record):
+        # type: (Dict) -> Dict
+        """Building in v1 get_building format"""
+        data = record['data']
+        if not record['preview']:
+            view = dict(data)
+        else:
+            view = {
+                'id': record['id'],
+                'name': data.get('name'),
+                'address': data.get('address'),
+                'city': data.get('city'),
+                'state': data.get('state'),
+                'zip_code': data.get('zip_code'),
+                'user_id': record['owner'],
+                'year_of_construction': data.get('year_of_construction'),
+                'total_floor_area': data.get('total_floor_area!'),
+                'updated_at': data.get('updated_at'),
+                'notes': data.get('notes'),
+                'blocks': [
+                    {'id': block['block_id']}
+                    for block in data.get('blocks', [])
+                ],
+                'use_types': [
+                    {'display_name': block.get('use_type:name!')}
+                    for block in data.get('blocks', [])[:1]
+                ],
+                'floors': [],
+            }
+        view['status_type_id'] = STATUS_IDS[record['status']]
+        return view
+
+    @staticmethod
+    def _simple_view(record):
+        # type: (Dict) -> Dict
+        """Preview building in list_preview_buildings format"""
+        data = record['data']
+        return {
+            'building_id': record['id'], 'name': data.get('name'),
+            'status!': record['status'], 'updated_at': data.get('updated_at'),
+        }
+
+    def _simulate(self, record):
+        # type: (Dict) -> None
+        """Start a simulation"""
+        duration = 0.0
+        if self.simulation_time:
+            with self._lock:
+                duration = max(0.0, self.simulation_time(self.rng))
+        record['status'] = 'Running'
+        record['rated_at'] = time.time() + duration
+        self._touch(record)
+
+    # handlers
+    def _users(self, method, obj_id, action, data, token):
+        # type: (str, Optional[int], Optional[str], Dict, Optional[str]) -> Tuple[int, Any]
+        """users, users/authenticate, users/:id"""
+        if method == 'POST' and action == 'authenticate':
+            for user in self.users.values():
+                if (user['email'] == data.get('email')
+                        and user['password'] == data.get('password')
+                        and user['organization_token'] ==
+                        data.get('organization_token')):
+                    return 200, {'user_id': user['id'], 'token': user['token']}
+            raise _HTTPError(401, 'Invalid email or password')
+        if method == 'POST' and obj_id is None and not action:
+            required = (
+                'organization_token', 'email', 'password', 'first_name',
+                'last_name'
+            )
+            missing = [key for key in required if not data.get(key)]
+            if missing:
+                raise _HTTPError(
+                    422, {key: ["can't be blank"] for key in missing}
+                )
+            user_id, _ = self.add_user(
+                data['email'], data['password'], data['organization_token']
+            )
+            return 201, {'id': user_id, 'organization_id': 1, 'role_id': 1}
+        user_id = self._authenticated(token)
+        if obj_id != user_id:
+            raise _HTTPError(404, 'Not Found')
+        user = self.users[user_id]
+        if method == 'GET':
+            return 200, {
+                key: val for key, val in user.items()
+                if key not in ('password', 'token')
+            }
+        if method == 'PUT':
+            data.pop('password_confirmation', None)
+            user.update(data)
+            return 200, {}
+        raise _HTTPError(404, 'Not Found')
+
+    def _preview_buildings(self, method, obj_id, action, data, user_id):
+        # type: (str, Optional[int], Optional[str], Dict, int) -> Tuple[int, Any]
+        """v2 preview_buildings"""
+        # pylint: disable=too-many-return-statements,too-many-branches
+        if obj_id is None:
+            if method == 'GET':
+                return 200, [
+                    self._simple_view(record)
+                    for record in self.buildings.values()
+                    if record['preview'] and record['owner'] == user_id
+                ]
+            if method == 'POST':
+                return 201, self._create_preview(
+                    data.get('building') or {}, user_id
+                )
+            raise _HTTPError(404, 'Not Found')
+        record = self._get_building(obj_id, user_id, preview=True)
+        if method == 'DELETE':
+            del self.buildings[obj_id]
+            return 200, {}
+        if method == 'PUT':
+            if action:
+                if action == 'edit_mode':
+                    record['status'] = 'Editing'
+                    self._touch(record)
+                return 200, {}
+            return 200, self._update_preview(
+                record, data.get('building') or {}
+            )
+        if method != 'GET':
+            raise _HTTPError(404, 'Not Found')
+        if not action:
+            return 200, self._v2_view(record)
+        if action == 'simple':
+            return 200, self._simple_view(record)
+        if action == 'duplicate':
+            data = dict(record['data'], name='Copy of {}'.format(
+                record['data'].get('name')
+            ))
+            clone = self._add_preview(data, user_id)
+            return 200, self._simple_view(clone)
+        if action == 'validate':
+            if not record['data'].get('blocks'):
+                raise _HTTPError(422, 'Building must have at least one block')
+            return 200, _Raw(b'valid', 'text/plain')
+        if action == 'simulate':
+            self._simulate(record)
+            return 200, {}
+        if action == 'report':
+            if record['status'] != 'Rated':
+                raise _HTTPError(422, 'Building has not been rated')
+            report = preview_scores(obj_id)
+            report.update({
+                'id': obj_id, 'name': record['data'].get('name'),
+                'pdf_url': 'http://localhost/buildings/{}/report.pdf'.format(
+                    obj_id
+                ),
+            })
+            return 200, report
+        raise _HTTPError(404, 'Not Found')
+
+    def _add_preview(self, data, user_id):
+        # type: (Dict, int) -> Dict
+        """Store preview building, with new building and block ids"""
+        building_id = self._new_id()
+        data = dict(data, building_id=building_id)
+        blocks = []
+        for block in data.get('blocks', []):
+            block = dict(block, block_id=self._new_id())
+            self.objects[('blocks', block['block_id'])] = {
+                'id': block['block_id'], 'building_id': building_id
+            }
+            blocks.append(block)
+        data['blocks'] = blocks
+        record = self.buildings[building_id] = {
+            'id': building_id, 'preview': True, 'owner': user_id,
+            'status': 'Editing', 'rated_at': None, 'data': data,
+        }
+        self._touch(record)
+        return record
+
+    def _create_preview(self, building, user_id):
+        # type: (Dict, int) -> Dict
+        """Create preview building"""
+        required = (
+            'building_name', 'year_completed', 'floor_area', 'street',
+            'city', 'state', 'postal_code', 'assessment_type', 'use_type',
+            'orientation',
+        )
+        missing = [key for key in required if not building.get(key)]
+        if missing:
+            raise _HTTPError(422, {key: ["can't be blank"] for key in missing})
+        data = make_preview_building(0, status='Editing')
+        data.update({
+            'name': building['building_name'],
+            'address': building['street'],
+            'city': building['city'],
+            'state': building['state'],
+            'zip_code': building['postal_code'],
+            'assessment_type': building['assessment_type'],
+            'year_of_construction': int(building['year_completed']),
+            'total_floor_area!': float(building['floor_area']),
+            'orientation!': building['orientation'],
+        })
+        for block in data['blocks']:
+            block['use_type:name!'] = building['use_type']
+        return self._v2_view(self._add_preview(data, user_id))
+
+    def _update_preview(self, record, building):
+        # type: (Dict, Dict) -> Dict
+        """Update preview building"""
+        building = dict(building)
+        block_id = int(building.pop('block_id', 0) or 0)
+        data = record['data']
+        for key, val in building.items():
+            if ':' in key:
+                for block in data.get('blocks', []):
+                    if block['block_id'] == block_id:
+                        block[key] = val
+                        block['{}_status!'.format(key)] = 'Edited'
+            else:
+                data[key] = val
+        self._touch(record)
+        return self._v2_view(record)
+
+    def _buildings(self, method, obj_id, action, data, user_id):
+        # type: (str, Optional[int], Optional[str], Dict, int) -> Tuple[int, Any]
+        """v1 buildings"""
+        # pylint: disable=too-many-return-statements,too-many-branches
+        if obj_id is None:
+            if method == 'GET':
+                return 200, [
+                    self._v1_view(record)
+                    for record in self.buildings.values()
+                    if record['owner'] == user_id
+                ]
+            if method == 'POST':
+                building_id = self._new_id()
+                data.pop('api_version', None)
+                data.update({
+                    'id': building_id, 'user_id': user_id,
+                    'total_floor_area': data.get('reported_floor_area'),
+                })
+                record = self.buildings[building_id] = {
+                    'id': building_id, 'preview': False, 'owner': user_id,
+                    'status': 'Editing', 'rated_at': None, 'data': data,
+                }
+                self._touch(record)
+                return 201, self._v1_view(record)
+            raise _HTTPError(404, 'Not Found')
+        record = self._get_building(obj_id, user_id)
+        if not action:
+            if method == 'GET':
+                return 200, self._v1_view(record)
+            if method == 'PUT':
+                record['data'].update(data)
+                self._touch(record)
+                return 200, {}
+            if method == 'DELETE':
+                del self.buildings[obj_id]
+                return 200, {}
+        elif action in ('simple', 'report') and method == 'GET':
+            if action == 'report':
+                return 200, _Raw(PDF, 'application/pdf')
+            return 200, self._v1_view(record)
+        elif action == 'validate' and method == 'GET':
+            errors = self._validation_errors(record)
+            return 200, {'valid': not errors, 'errors': errors}
+        elif action == 'simulate' and method == 'POST':
+            if self._validation_errors(record):
+                raise _HTTPError(404, 'Building is not valid')
+            self._simulate(record)
+            return 200, {}
+        elif action == 'score' and method == 'GET':
+            if record['preview']:
+                raise _HTTPError(500, 'Internal Server Error')
+            if record['status'] != 'Rated':
+                raise _HTTPError(404, 'Not Found')
+            return 200, {'score': full_scores(obj_id)}
+        elif action == 'blocks':
+            return self._children(method, 'blocks', 'building_id', obj_id,
+                                  data)
+        elif action in BES_RESOURCES:
+            return self._children(method, action, 'building_id', obj_id, data)
+        raise _HTTPError(404, 'Not Found')
+
+    def _validation_errors(self, record):
+        # type: (Dict) -> List[str]
+        """v1 validation"""
+        has_blocks = record['data'].get('blocks') or any(
+            obj.get('building_id') == record['id']
+            for (endpoint, _), obj in self.objects.items()
+            if endpoint == 'blocks'
+        )
+        return [] if has_blocks else ['Building must have at least one block']
+
+    def _children(self, method, endpoint, parent_key, parent_id, data):
+        # type: (str, str, str, int, Dict) -> Tuple[int, Any]
+        """List or create objects belonging to a building or block"""
+        if method == 'GET':
+            return 200, [
+                obj for (name, _), obj in sorted(self.objects.items())
+                if name == endpoint and obj.get(parent_key) == parent_id
+            ]
+        if method == 'POST':
+            data.pop('api_version', None)
+            obj_id = self._new_id()
+            obj = dict(data, id=obj_id)
+            obj[parent_key] = parent_id
+            self.objects[(endpoint, obj_id)] = obj
+            return 201, obj
+        raise _HTTPError(404, 'Not Found')
+
+    def _blocks(self, method, obj_id, action, data):
+        # type: (str, Optional[int], Optional[str], Dict) -> Tuple[int, Any]
+        """v1 blocks"""
+        if obj_id is None:
+            raise _HTTPError(404, 'Not Found')
+        self._get_object('blocks', obj_id)
+        if action in BLOCK_RESOURCE_ENDPOINTS:
+            return self._children(method, action, 'block_id', obj_id, data)
+        if action:
+            raise _HTTPError(404, 'Not Found')
+        return self._resource(method, 'blocks', obj_id, data)
+
+    def _resource(self, method, endpoint, obj_id, data):
+        # type: (str, str, int, Dict) -> Tuple[int, Any]
+        """Get, update or delete a block, resource or block resource"""
+        obj = self._get_object(endpoint, obj_id)
+        if method == 'GET':
+            return 200, obj
+        if method == 'PUT':
+            data.pop('api_version', None)
+            obj.update(data)
+            return 200, {}
+        if method == 'DELETE':
+            del self.objects[(endpoint, obj_id)]
+            return 200, {}
+        raise _HTTPError(404, 'Not Found')
+
+    def _resource_type(self, endpoint, obj_id):
+        # type: (str, Optional[int]) -> Tuple[int, Any]
+        """List or get resource types"""
+        types = self.resource_types[endpoint]
+        if obj_id is None:
+            return 200, types
+        for resource_type in types:
+            if resource_type['id'] == obj_id:
+                return 200, resource_type
+        raise _HTTPError(404, 'Not Found')
+
+    def _csv(self, data, user_id):
+        # type: (Dict, int) -> Tuple[int, Any]
+        """manage_buildings/csv"""
+        ids = [
+            int(val) for val in str(data.get('building_ids', '')).split(',')
+            if ID_RE.match(val.strip())
+        ]
+        rows = [','.join(('building_id', 'name', 'status') + FULL_SCORE_KEYS)]
+        for building_id in ids:
+            record = self._get_building(building_id, user_id)
+            scores = full_scores(building_id)
+            rows.append(','.join(
+                [str(building_id), '"{}"'.format(record['data'].get('name')),
+                 record['status']] +
+                [str(scores[key]) for key in FULL_SCORE_KEYS]
+            ))
+        content = '\n'.join(rows) + '\n'
+        return 200, _Raw(content.encode('utf-8'), 'text/csv')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serve FakeBESApp requests"""
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        """Decode request, pass to app and write response"""
+        split = urlsplit(self.path)
+        params = dict(parse_qsl(split.query, keep_blank_values=True))
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        body = {}
+        if raw:
+            try:
+                body = json.loads(raw.decode('utf-8'))
+            except ValueError:
+                body = dict(parse_qsl(raw.decode('utf-8')))
+        status, headers, content = self.server.app.handle(
+            self.command, split.path, params, body
+        )
+        self.send_response(status)
+        for key, val in headers.items():
+            self.send_header(key, val)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+    def log_message(self, *args):                       # pragma: no cover
+        """Silence request logging"""
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """Handle each request in a thread"""
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class FakeBESServer(object):
+    """
+    Serve a FakeBESApp on a local port, in a background thread.
+
+    Use as a context manager or call start() and stop(). base_url is
+    suitable for BESClient.
+    """
+
+    def __init__(self, app=None, host='127.0.0.1', port=0, **app_kwargs):
+        """
+        :param app: app to serve, default: FakeBESApp(**app_kwargs)
+        :type app: FakeBESApp
+        :param host: host to bind to
+        :param port: port to bind to, default: any free port
+        """
+        self.app = app or FakeBESApp(**app_kwargs)
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    @property
+    def base_url(self):
+        # type: () -> str
+        """BES base url"""
+        return 'http://{}:{}/api'.format(self.host, self.port)
+
+    def start(self):
+        # type: () -> FakeBESServer
+        """Start serving in a background thread"""
+        self.httpd = _ThreadingHTTPServer((self.host, self.port), _Handler)
+        self.httpd.app = self.app
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # type: () -> None
+        """Stop serving"""
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self._thread.join()
+            self.httpd = self._thread = None
+
+
+def main(args=None):                                    # pragma: no cover
+    # type: (Optional[List[str]]) -> None
+    """Run a fake BES server until interrupted"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--preview', type=int, default=0,
+                        help='number of preview buildings to create')
+    parser.add_argument('--full', type=int, default=0,
+                        help='number of full buildings to create')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='median latency in seconds (lognormal)')
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='requests per second per token')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--simulation-time', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    opts = parser.parse_args(args)
+    server = FakeBESServer(
+        host=opts.host, port=opts.port,
+        latency=lognormal(opts.latency) if opts.latency else None,
+        rate_limit=opts.rate_limit, error_rate=opts.error_rate,
+        simulation_time=opts.simulation_time, seed=opts.seed
+    )
+    preview, full = make_portfolio(opts.preview, opts.full, seed=opts.seed)
+    server.app.seed(preview=preview, full=full)
+    server.start()
+    print('Serving BES API at {} (token: {}, user_id: {})'.format(
+        server.base_url, DEFAULT_TOKEN, DEFAULT_USER_ID
+    ))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':                              # pragma: no cover
+    main()
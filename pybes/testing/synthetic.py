@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Synthetic BES buildings for tests, benchmarks and the fake BES server.
+
+The generated data follows the shape of real API responses: preview
+buildings use the v2 (key:subkey) format returned by get_preview_building,
+full buildings the v1 format returned by get_building. Size is controlled
+by the number of blocks and the number of lighting fixtures per block.
+"""
+
+# Imports from Standard Library
+import random
+from typing import Dict, List, Optional, Tuple
+
+# Local Imports
+from pybes.utils.bes_constants import FULL_SCORE_KEYS, PREVIEW_SCORE_KEYS
+
+# Constants
+STATUS_TYPES = {1: 'Editing', 2: 'Running', 3: 'Rated', 4: 'Submitted'}
+STATUS_IDS = {val: key for key, val in STATUS_TYPES.items()}
+
+USE_TYPES = (
+    'Office', 'Retail', 'Library', 'Education', 'Lodging', 'Medical Office',
+    'Warehouse non-refrigerated', 'Community Center',
+)
+STREETS = ('Main St', '1st St', 'Oak Ave', 'Broadway', 'Elm St', 'Park Ave')
+CITIES = (
+    ('Boring', 'OR', '97009'), ('Portland', 'OR', '97209'),
+    ('Seattle', 'WA', '98101'), ('Denver', 'CO', '80202'),
+)
+TIMESTAMP = '2017-06-07T09:05:30-07:00'
+
+
+# Private Functions
+def _unknown(dct, key, val):
+    # type: (Dict, str, object) -> None
+    """Set key and its 'Do not know' status"""
+    dct[key] = val
+    dct['{}_status!'.format(key)] = 'Do not know'
+
+
+def _address(building_id):
+    # type: (int) -> Tuple[str, str, str, str]
+    """Deterministic address for building_id"""
+    street = '{} {}'.format(
+        100 + building_id, STREETS[building_id % len(STREETS)]
+    )
+    city, state, zip_code = CITIES[building_id % len(CITIES)]
+    return street, city, state, zip_code
+
+
+# Public Functions
+def preview_scores(building_id):
+    # type: (int) -> Dict[str, float]
+    """Deterministic preview scores for building_id"""
+    rng = random.Random(building_id)
+    low = round(rng.uniform(1, 6), 1)
+    high = round(low + rng.uniform(0.5, 4), 1)
+    min_eui = rng.uniform(40, 120)
+    max_eui = min_eui + rng.uniform(50, 200)
+    scores = {
+        'low_score': low,
+        'high_score': high,
+        'potential_low_score': min(10.0, low + 2),
+        'potential_high_score': min(10.0, high + 2),
+        'min_eui': min_eui,
+        'max_eui': max_eui,
+        'mean_eui': (min_eui + max_eui) / 2,
+        'potential_energy_savings': rng.randint(5, 40),
+    }
+    return {key: scores[key] for key in PREVIEW_SCORE_KEYS}
+
+
+def full_scores(building_id):
+    # type: (int) -> Dict[str, float]
+    """Deterministic full building scores for building_id"""
+    rng = random.Random(building_id)
+    return {key: round(rng.uniform(10, 200), 2) for key in FULL_SCORE_KEYS}
+
+
+def make_preview_block(block_id, n_fixtures=2, use_type='Office'):
+    # type: (int, int, str) -> Dict
+    """Preview (v2) block with n_fixtures lighting fixtures"""
+    block = {'block_id': block_id, 'use_type:name!': use_type}
+    for key, val in (
+            ('floor:floor_type', 'Slab-on-Grade'),
+            ('hvac_system:fuel_type', 'Natural Gas'),
+            ('hvac_system:type', 'Packaged Rooftop Air Conditioner'),
+            ('roof:roof_type', 'Built-up w/ metal deck'),
+            ('surfaces:window_wall_ratio', '0.33'),
+            ('wall:wall_type', 'Brick/Stone on masonry'),
+            ('water_heater:fuel_type', 'Natural Gas'),
+            ('window:framing_type', 'Metal w/ Thermal Breaks'),
+            ('window:glass_type', 'Double Pane')):
+        _unknown(block, key, val)
+    lighting = []
+    for idx in range(n_fixtures):
+        fixture = {
+            'fixture_status!': 'Do not know',
+            'id': block_id * 1000 + idx,
+            'lamp_type': 'Fluorescent T12',
+            'mounting_type': 'Recessed',
+        }
+        _unknown(fixture, 'percent_served', 100.0 / max(n_fixtures, 1))
+        lighting.append(fixture)
+    block['lighting'] = lighting
+    return block
+
+
+def make_preview_building(building_id, n_blocks=1, n_fixtures=2,
+                          status='Rated'):
+    # type: (int, int, int, str) -> Dict
+    """
+    Preview building in the format returned by get_preview_building.
+
+    :param building_id: building id, block ids are derived from it
+    :param n_blocks: number of blocks
+    :param n_fixtures: number of lighting fixtures per block
+    :param status: value for 'status!'
+    """
+    street, city, state, zip_code = _address(building_id)
+    use_type = USE_TYPES[building_id % len(USE_TYPES)]
+    return {
+        'address': street,
+        'assessment_type': 'Test',
+        'blocks': [
+            make_preview_block(
+                building_id * 100 + idx, n_fixtures=n_fixtures,
+                use_type=use_type
+            )
+            for idx in range(n_blocks)
+        ],
+        'building_id': building_id,
+        'city': city,
+        'name': 'Preview Building {}'.format(building_id),
+        'notes': 'Built via V2 API',
+        'orientation!': 'North/South',
+        'state': state,
+        'status!': status,
+        'total_floor_area!': float(1000 * (building_id % 50 + 1)),
+        'updated_at': TIMESTAMP,
+        'year_of_construction': 1900 + building_id % 117,
+        'zip_code': zip_code,
+    }
+
+
+def make_full_building(building_id, n_blocks=1, n_fixtures=2,
+                       status='Rated', user_id=1):
+    # type: (int, int, int, str, int) -> Dict
+    """
+    Full building in the (v1) format returned by get_building.
+
+    :param building_id: building id, nested ids are derived from it
+    :param n_blocks: number of blocks (and floors, roofs, walls etc)
+    :param n_fixtures: number of lighting fixtures per block
+    :param status: status name, see STATUS_TYPES
+    """
+    street, city, state, zip_code = _address(building_id)
+    use_type = USE_TYPES[building_id % len(USE_TYPES)]
+    building = {
+        'address': street,
+        'city': city,
+        'state': state,
+        'zip_code': zip_code,
+        'id': building_id,
+        'name': 'Building {}'.format(building_id),
+        'user_id': user_id,
+        'status_type_id': STATUS_IDS[status],
+        'created_at': TIMESTAMP,
+        'updated_at': TIMESTAMP,
+        'year_of_construction': 1900 + building_id % 117,
+        'total_floor_area': 1000 * (building_id % 50 + 1),
+        'notes': None,
+        'ratings': [],
+        'use_types': [{
+            'id': USE_TYPES.index(use_type) + 1,
+            'display_name': use_type,
+            'service_name': use_type.lower().replace(' ', '_'),
+            'created_at': TIMESTAMP,
+            'updated_at': TIMESTAMP,
+        }],
+    }
+    blocks = []
+    for idx in range(n_blocks):
+        block_id = building_id * 100 + idx
+        blocks.append({
+            'id': block_id,
+            'building_id': building_id,
+            'name': 'Block {}'.format(idx + 1),
+            'shape_id': 1,
+            'floor_to_floor_height': 12.0,
+            'floor_to_ceiling_height': 9.0,
+            'is_above_ground': True,
+            'number_of_floors': 1 + idx % 5,
+            'orientation': 0,
+            'position': '0,0',
+            'vertices': '0,0 100,0 100,100 0,100',
+            'dimension_1': 100.0,
+            'dimension_2': 100.0,
+        })
+    building['blocks'] = blocks
+    for key in ('roofs', 'walls', 'floors', 'windows', 'skylights',
+                'water_heaters', 'air_handlers', 'zone_equipments',
+                'operations', 'plants'):
+        building[key] = [
+            {
+                'id': block['id'] * 10 + offset,
+                'building_id': building_id,
+                'name': '{} {}'.format(key.rstrip('s'), block['name']),
+                'created_at': TIMESTAMP,
+                'updated_at': TIMESTAMP,
+            }
+            for offset, block in enumerate(blocks)
+        ]
+    building['fixtures'] = [
+        {
+            'id': block['id'] * 1000 + idx,
+            'building_id': building_id,
+            'name': 'fixture {}'.format(idx),
+            'lamp_type_id': 1,
+            'mounting_type_id': 1,
+        }
+        for block in blocks for idx in range(n_fixtures)
+    ]
+    return building
+
+
+def make_portfolio(n_preview, n_full, n_blocks=1, n_fixtures=2,
+                   rated=1.0, seed=None, start_id=1):
+    # type: (int, int, int, int, float, Optional[int], int) -> Tuple[List[Dict], List[Dict]]
+    """
+    A portfolio of preview and full buildings.
+
+    :param n_preview: number of preview buildings
+    :param n_full: number of full buildings
+    :param n_blocks: blocks per building
+    :param n_fixtures: lighting fixtures per block
+    :param rated: fraction of buildings that are 'Rated' (rest are Editing)
+    :param seed: random seed used to choose which buildings are rated
+    :param start_id: id of first building
+    :returns: preview buildings, full buildings
+    """
+    # pylint: disable=too-many-arguments
+    rng = random.Random(seed)
+    ids = iter(range(start_id, start_id + n_preview + n_full))
+    preview = [
+        make_preview_building(
+            next(ids), n_blocks=n_blocks, n_fixtures=n_fixtures,
+            status='Rated' if rng.random() < rated else 'Editing'
+        )
+        for _ in range(n_preview)
+    ]
+    full = [
+        make_full_building(
+            next(ids), n_blocks=n_blocks, n_fixtures=n_fixtures,
+            status='Rated' if rng.random() < rated else 'Editing'
+        )
+        for _ in range(n_full)
+    ]
+    return preview, full
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.utils.bes_address
+"""
+
+# Imports from Standard Library
+import unittest
+
+# Local Imports
+from pybes.utils.bes_address import (
+    AddressIndex,
+    bes_address_key,
+    seed_address_key,
+)
+
+BUILDINGS = [
+    {'id': 1, 'address': '123 North Main Street', 'city': 'Portland',
+     'state': 'OR', 'zip_code': '97201'},
+    {'id': 2, 'address': '456 SE Oak Ave', 'city': 'Portland',
+     'state': 'OR', 'zip_code': '97214'},
+    {'id': 3, 'address': '456 SE Oak Ave', 'city': 'Salem',
+     'state': 'OR', 'zip_code': '97301'},
+    {'id': 4, 'address': '789 Elm Rd', 'city': 'Bend', 'state': 'OR',
+     'zip_code': '97701'},
+    {'id': 5, 'address': '789 Elm Rd', 'city': 'Bend', 'state': 'OR',
+     'zip_code': '97701'},
+    {'id': 6, 'address': None, 'city': 'Bend', 'state': 'OR',
+     'zip_code': '97701'},
+]
+
+
+def state(address_line_1, city, state_code, postal_code,
+          address_line_2=None):
+    """SEED property state"""
+    return {
+        'address_line_1': address_line_1, 'address_line_2': address_line_2,
+        'city': city, 'state': state_code, 'postal_code': postal_code,
+    }
+
+
+class AddressIndexTests(unittest.TestCase):
+    """Test AddressIndex"""
+
+    def setUp(self):
+        """setUp"""
+        self.index = AddressIndex(BUILDINGS)
+
+    def test_keys(self):
+        """Test SEED and BES keys normalize the same way"""
+        self.assertEqual(
+            seed_address_key(
+                state('123 N. Main St', 'PORTLAND', 'or', '97201-1234')
+            ),
+            bes_address_key(BUILDINGS[0])
+        )
+        self.assertEqual(len(self.index), 5)
+
+    def test_exact(self):
+        """Test hash index matches"""
+        match = self.index.match(
+            state('123 N. Main St', 'Portland', 'OR', '97201')
+        )
+        self.assertEqual((match.building_id, match.confidence), (1, 1.0))
+        match = self.index.match(
+            state('456 Southeast Oak Avenue', 'Salem', 'OR', '97302')
+        )
+        self.assertEqual(match.building_id, 3)
+        self.assertEqual(match.method, 'street_city_state')
+        match = self.index.match(
+            state('456 SE Oak Ave', 'Portland', 'OR', '97214')
+        )
+        self.assertEqual(match.building_id, 2)
+
+    def test_ambiguous(self):
+        """Test duplicate buildings lower confidence"""
+        match = self.index.match(state('789 Elm Rd', 'Bend', 'OR', '97701'))
+        self.assertEqual(match.candidates, [4, 5])
+        self.assertEqual(match.confidence, 0.5)
+
+    def test_fuzzy(self):
+        """Test trigram matches"""
+        match = self.index.match(
+            state('123 N Main St', 'Portland', 'OR', '97201',
+                  address_line_2='Suite 100')
+        )
+        self.assertEqual(match.building_id, 1)
+        self.assertEqual(match.method, 'fuzzy')
+        self.assertTrue(0.75 < match.confidence < 1)
+        self.assertIsNone(
+            self.index.match(state('1 Pine Ct', 'Bend', 'OR', '97701'))
+        )
+        self.assertIsNone(self.index.match(state(None, 'Bend', 'OR', '1')))
+
+    def test_match_many(self):
+        """Test bulk matching"""
+        states = [
+            state('123 N Main St', 'Portland', 'OR', '97201'),
+            state('1 Pine Ct', 'Bend', 'OR', '97701'),
+        ]
+        results = list(self.index.match_many(states))
+        self.assertEqual([result[0] for result in results], states)
+        self.assertEqual(results[0][1].building_id, 1)
+        self.assertIsNone(results[1][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.utils.bes_batch
+"""
+
+# Imports from Standard Library
+import sys
+from unittest import TestCase
+
+# Imports from Third Party Modules
+from requests import exceptions
+
+# Local Imports
+from pybes.pybes import APIError, BESClient, BESError
+from pybes.utils.bes_batch import BatchSession
+
+PY3 = sys.version_info[0] == 3
+if PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+# Tests
+class BatchSessionTests(TestCase):
+    """Unit tests for BatchSession"""
+
+    def setUp(self):
+        """setUp"""
+        self.client = mock.MagicMock(spec=BESClient)
+
+    def test_merges_calls_per_target(self):
+        """Test calls to the same target are merged into one"""
+        with BatchSession(self.client) as batch:
+            batch.update_resource(
+                'water_heater', 1, tank_insulation_r_value=11
+            )
+            batch.update_resource('water heaters', 1, fuel_type_id=3)
+            batch.update_resource('water_heater', 2, fuel_type_id=4)
+            self.assertEqual(len(batch), 2)
+            self.assertFalse(self.client.update_resource.called)
+
+        self.assertEqual(self.client.update_resource.call_count, 2)
+        self.client.update_resource.assert_any_call(
+            'water_heaters', 1, tank_insulation_r_value=11, fuel_type_id=3
+        )
+        self.client.update_resource.assert_any_call(
+            'water_heaters', 2, fuel_type_id=4
+        )
+
+    def test_later_values_win(self):
+        """Test fields set more than once take the last value"""
+        with BatchSession(self.client) as batch:
+            batch.update_block(10, 1, name='first', number_of_floors=2)
+            batch.update_block(10, 1, name='second')
+            batch.update_block_resource('water_heater', 5, 7, percent=10)
+            batch.update_block_resource('water_heater', 5, 8)
+        self.client.update_block.assert_called_once_with(
+            10, 1, name='second', number_of_floors=2
+        )
+        self.client.update_block_resource.assert_called_once_with(
+            'water_heater', 5, 8, percent=10
+        )
+
+    def test_merges_preview_extras(self):
+        """Test extras are merged for update_preview_building"""
+        with BatchSession(self.client) as batch:
+            batch.update_preview_building(
+                1, 2, name='test', extras={'floor:floor_type': 'a'}
+            )
+            batch.update_preview_building(
+                1, 2, extras={'roof:roof_type': 'b'}
+            )
+        self.client.update_preview_building.assert_called_once_with(
+            1, 2, name='test',
+            extras={'floor:floor_type': 'a', 'roof:roof_type': 'b'}
+        )
+
+    def test_invalid_resource_name(self):
+        """Test invalid names are rejected when buffered"""
+        batch = BatchSession(self.client)
+        self.assertRaises(BESError, batch.update_resource, 'nope', 1)
+        self.assertRaises(
+            BESError, batch.update_block_resource, 'nope', 1, 1
+        )
+
+    def test_discard_on_exception(self):
+        """Test buffered calls are dropped if the block raises"""
+        with self.assertRaises(ValueError):
+            with BatchSession(self.client) as batch:
+                batch.update_block(10, 1, name='test')
+                raise ValueError
+        self.assertFalse(self.client.update_block.called)
+
+    def test_flush_errors(self):
+        """Test flush collects errors from failed targets"""
+        self.client.update_resource.side_effect = [
+            None, APIError('404 Not Found', status_code=404)
+        ]
+        batch = BatchSession(self.client, max_workers=1)
+        batch.update_resource('roof', 1, name='a')
+        batch.update_resource('roof', 2, name='b')
+        with self.assertRaises(BESError) as conm:
+            batch.flush()
+        error = conm.exception
+        self.assertEqual(list(error.results.keys()), [
+            ('update_resource', 'roofs', '1')
+        ])
+        self.assertEqual(list(error.errors.keys()), [
+            ('update_resource', 'roofs', '2')
+        ])
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(batch.flush(), {})
+
+    def test_flush_request_errors(self):
+        """Test flush collects requests errors and sends every target"""
+        self.client.update_resource.side_effect = [
+            exceptions.ReadTimeout('timed out'),
+            exceptions.ConnectionError('reset'), 'ok'
+        ]
+        batch = BatchSession(self.client, max_workers=1)
+        for idx in range(3):
+            batch.update_resource('roof', idx, name='a')
+        with self.assertRaises(BESError) as conm:
+            batch.flush()
+        error = conm.exception
+        self.assertEqual(self.client.update_resource.call_count, 3)
+        self.assertEqual(list(error.results.values()), ['ok'])
+        self.assertIsInstance(
+            error.errors[('update_resource', 'roofs', '0')],
+            exceptions.ReadTimeout
+        )
+        self.assertIsInstance(
+            error.errors[('update_resource', 'roofs', '1')],
+            exceptions.ConnectionError
+        )
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.utils.bes_builder
+"""
+
+# Imports from Standard Library
+import sys
+from unittest import TestCase
+
+# Imports from Third Party Modules
+from requests import exceptions
+
+# Local Imports
+from pybes.pybes import APIError, BESClient, BESError
+from pybes.utils.bes_builder import BuildingBuilder, Ref
+
+PY3 = sys.version_info[0] == 3
+if PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+# Tests
+class BuildingBuilderTests(TestCase):
+    """Unit tests for BuildingBuilder"""
+
+    def setUp(self):
+        """setUp"""
+        self.client = mock.MagicMock(spec=BESClient)
+        self.client.create_building.return_value = {'id': 1}
+        self.client.create_block.side_effect = lambda **kwargs: {
+            'id': 10 + kwargs['number_of_floors']
+        }
+        self.client.create_resource.return_value = {'id': 100}
+        self.client.attach_block_resource.return_value = {'id': 1000}
+        self.builder = BuildingBuilder(self.client)
+        bldg = self.builder.building('building', name='test')
+        block1 = self.builder.block(
+            'block1', building_id=bldg, number_of_floors=1
+        )
+        self.builder.block('block2', building_id=bldg, number_of_floors=2)
+        heater = self.builder.resource(
+            'heater', 'water_heater', building_id=bldg
+        )
+        self.builder.attach(
+            'block1_heater', 'water_heater', block_id=block1,
+            resource_id=heater
+        )
+
+    def test_plan(self):
+        """Test steps are ordered by dependency"""
+        expected = [
+            ['building'], ['block1', 'block2', 'heater'], ['block1_heater']
+        ]
+        self.assertEqual(self.builder.plan(), expected)
+
+        self.builder.block('bad', building_id=Ref('missing'))
+        self.assertRaises(BESError, self.builder.plan)
+
+    def test_plan_cycle(self):
+        """Test dependency cycles are detected"""
+        builder = BuildingBuilder(self.client)
+        builder.block('a', building_id=Ref('b'))
+        builder.block('b', building_id=Ref('a'))
+        with self.assertRaises(BESError) as conm:
+            builder.plan()
+        self.assertIn('cycle', conm.exception.message)
+
+    def test_duplicate_label(self):
+        """Test labels must be unique"""
+        self.assertRaises(BESError, self.builder.building, 'building')
+
+    def test_build(self):
+        """Test ids flow to dependent steps"""
+        results = self.builder.build()
+        self.assertEqual(results['building'], {'id': 1})
+        self.client.create_block.assert_any_call(
+            building_id=1, number_of_floors=1
+        )
+        self.client.create_block.assert_any_call(
+            building_id=1, number_of_floors=2
+        )
+        self.client.create_resource.assert_called_once_with(
+            'water_heater', building_id=1
+        )
+        self.client.attach_block_resource.assert_called_once_with(
+            'water_heater', block_id=11, resource_id=100
+        )
+        self.assertEqual(results['block1_heater'], {'id': 1000})
+
+    def test_build_rollback(self):
+        """Test created objects are deleted if a step fails"""
+        self.client.attach_block_resource.side_effect = APIError(
+            'Unable to attach', status_code=500
+        )
+        with self.assertRaises(BESError) as conm:
+            self.builder.build()
+        error = conm.exception
+        self.assertEqual(list(error.failures.keys()), ['block1_heater'])
+        self.assertEqual(error.rollback_errors, {})
+        self.client.delete_resource.assert_called_once_with(
+            'water_heater', 100
+        )
+        self.assertEqual(self.client.delete_block.call_count, 2)
+        self.client.delete_building.assert_called_once_with(1)
+        self.assertFalse(self.client.delete_block_resource.called)
+
+    def test_rollback_request_errors(self):
+        """Test a delete failing with a requests error doesn't stop rollback"""
+        self.client.attach_block_resource.side_effect = APIError(
+            'Unable to attach', status_code=500
+        )
+        self.client.delete_resource.side_effect = exceptions.ConnectionError(
+            'reset'
+        )
+        with self.assertRaises(BESError) as conm:
+            self.builder.build()
+        error = conm.exception
+        self.assertEqual(list(error.failures.keys()), ['block1_heater'])
+        self.assertEqual(list(error.rollback_errors.keys()), ['heater'])
+        self.assertEqual(self.client.delete_block.call_count, 2)
+        self.client.delete_building.assert_called_once_with(1)
+
+    def test_build_stops_on_failure(self):
+        """Test dependent steps are not started after a failure"""
+        self.client.create_building.side_effect = APIError(
+            'Unable to create', status_code=500
+        )
+        with self.assertRaises(BESError):
+            self.builder.build()
+        self.assertFalse(self.client.create_block.called)
+        self.assertFalse(self.client.delete_building.called)
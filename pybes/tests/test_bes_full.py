@@ -10,10 +10,18 @@ Unit tests for pybes.utils/bes_full.py
 
 # Imports from Standard Library
 import sys
+import time
 from unittest import TestCase
 
 # Local Imports
-from pybes.pybes import BESClient
+from pybes.pybes import APIError, BESClient
+from pybes.testing.fake_server import (
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESServer,
+)
+from pybes.testing.synthetic import make_portfolio
+from pybes.utils.bes_preview import get_bes_preview_report
 from pybes.utils.bes_full import (
     _get_full_bldg_pdf_url,
     _get_property_type,
@@ -186,3 +194,194 @@ class BESFullTests(TestCase):
         ))
         self.assertTrue(len(incomplete) > 0)
         self.assertEqual(incomplete[0].bldg_id, 1112)
+
+    @mock.patch('pybes.utils.bes_full.BESClient.list_buildings')
+    @mock.patch('pybes.utils.bes_full.BESClient.list_preview_buildings')
+    @mock.patch('pybes.utils.bes_full.get_bes_full_report')
+    def test_get_bes_buildings_threaded(self, mock_full_report,
+                                        mock_list_preview, mock_list):
+        """Test get_bes_buildings with max_workers keeps building order"""
+        buildings = [
+            {'id': bldg_id, 'status_type_id': 3} for bldg_id in range(20)
+        ]
+        mock_list.return_value = buildings
+        mock_list_preview.return_value = []
+        mock_full_report.side_effect = lambda client, bldg, **kwargs: (
+            (bldg, 'Rated') if bldg['id'] % 2 else (None, 'Editing')
+        )
+        incomplete = []
+        result = list(get_bes_buildings(
+            incomplete, status_map=self.status_map, max_workers=4,
+            base_url=BASE_URL
+        ))
+        self.assertEqual(
+            [bldg['id'] for bldg, _ in result], list(range(1, 20, 2))
+        )
+        self.assertEqual(
+            [bldg.bldg_id for bldg in incomplete], list(range(0, 20, 2))
+        )
+
+
+class CallCountTests(TestCase):
+    """Test get_bes_buildings makes only the calls each building needs"""
+
+    def calls(self, n_blocks, status):
+        """Calls per building for one preview and one full building"""
+        rated = 1.0 if status == 'Rated' else 0.0
+        preview, full = make_portfolio(
+            1, 1, n_blocks=n_blocks, rated=rated, start_id=100
+        )
+        if status == 'Running':
+            preview[0]['status!'] = 'Running'
+            full[0]['status_type_id'] = 2
+        with FakeBESServer() as server:
+            server.app.seed(preview=preview, full=full)
+            list(get_bes_buildings(
+                [], base_url=server.base_url, access_token=DEFAULT_TOKEN,
+                user_id=DEFAULT_USER_ID
+            ))
+            return sorted(
+                call for call, count in server.app.calls.items()
+                for _ in range(count) if '{id}' in call
+            )
+
+    def test_rated(self):
+        """Test rated buildings only fetch their reports"""
+        self.assertEqual(self.calls(1, 'Rated'), [
+            'GET v1/buildings/{id}', 'GET v1/buildings/{id}/score',
+            'GET v2/preview_buildings/{id}/report',
+        ])
+
+    def test_running(self):
+        """Test running buildings cost no calls"""
+        self.assertEqual(self.calls(1, 'Running'), [])
+
+    def test_invalid(self):
+        """Test invalid buildings aren't fetched after validation"""
+        self.assertEqual(self.calls(0, 'Editing'), [
+            'GET v1/buildings/{id}/validate',
+            'GET v2/preview_buildings/{id}/validate',
+        ])
+
+
+class StreamTests(TestCase):
+    """Test get_bes_buildings with stream set"""
+
+    def test_stream(self):
+        """Test streamed listing gives the same reports"""
+        preview, full = make_portfolio(
+            5, 15, rated=0.7, seed=3, start_id=100
+        )
+        with FakeBESServer() as server:
+            server.app.seed(preview=preview, full=full)
+            kwargs = {
+                'base_url': server.base_url, 'access_token': DEFAULT_TOKEN,
+                'user_id': DEFAULT_USER_ID,
+            }
+            results = {}
+            for stream in (False, True):
+                incomplete = []
+                reports = {
+                    report['bes_building_id']: (dict(report), bes_type)
+                    for report, bes_type in get_bes_buildings(
+                        incomplete, max_workers=2, stream=stream, **kwargs
+                    )
+                }
+                for report, _ in reports.values():
+                    # changed by simulations started while reporting, so
+                    # only current when details are fetched (streamed)
+                    report.pop('updated_at')
+                    report.pop('status_type_id')
+                results[stream] = reports, sorted(incomplete)
+                server.app.seed(preview=preview, full=full)
+        self.assertTrue(results[False][0])
+        self.assertEqual(results[True], results[False])
+
+    def test_stream_listing_read_first(self):
+        """Test the listing is read in full before reports are fetched"""
+        _, full = make_portfolio(0, 6, start_id=100)
+        events = []
+        truncate = []
+        iter_buildings = BESClient.iter_buildings
+
+        def listing(client, **kwargs):
+            """Listing, recording when it has been read"""
+            for idx, bldg in enumerate(iter_buildings(client, **kwargs)):
+                if truncate and idx == 2:
+                    raise APIError('Incomplete JSON array')
+                yield bldg
+            events.append('listed')
+
+        def report(*args, **kwargs):
+            """Record report calls"""
+            events.append('report')
+            return None, 'Editing'
+
+        with FakeBESServer() as server:
+            server.app.seed(full=full)
+            kwargs = {
+                'base_url': server.base_url, 'access_token': DEFAULT_TOKEN,
+                'user_id': DEFAULT_USER_ID,
+            }
+            with mock.patch(
+                    'pybes.utils.bes_full.get_bes_full_report',
+                    side_effect=report), mock.patch.object(
+                        BESClient, 'iter_buildings', listing):
+                list(get_bes_buildings(
+                    [], max_workers=2, stream=True, **kwargs
+                ))
+                self.assertEqual(events, ['listed'] + ['report'] * 6)
+                del events[:]
+                truncate.append(True)
+                list(get_bes_buildings(
+                    [], max_workers=2, stream=True, **kwargs
+                ))
+                # a cut off listing is an error, not a partial run
+                self.assertEqual(events, [])
+
+
+class ReportLatencyTests(TestCase):
+    """Test independent report calls are made concurrently"""
+
+    latency = 0.3
+
+    def setUp(self):
+        """setUp"""
+        self.server = FakeBESServer(endpoint_latency={
+            'GET v1/buildings/{id}': self.latency,
+            'GET v1/buildings/{id}/score': self.latency,
+            'GET v2/preview_buildings/{id}/report': self.latency,
+        }).start()
+        preview, full = make_portfolio(1, 1, start_id=100)
+        self.server.app.seed(preview=preview, full=full)
+        self.client = BESClient(
+            base_url=self.server.base_url, access_token=DEFAULT_TOKEN,
+            user_id=DEFAULT_USER_ID
+        )
+
+    def tearDown(self):
+        """tearDown"""
+        self.server.stop()
+
+    def test_preview(self):
+        """Test preview report and building are fetched together"""
+        start = time.time()
+        report, status = get_bes_preview_report(
+            self.client, 100, status='Rated'
+        )
+        self.assertLess(time.time() - start, 1.6 * self.latency)
+        self.assertEqual(status, 'Rated')
+        self.assertEqual(report['bes_building_id'], 100)
+        self.assertIn('pdf_url', report)
+
+    def test_full(self):
+        """Test full building details are fetched with the score"""
+        start = time.time()
+        report, status = get_bes_full_report(
+            self.client, {'id': 101, 'status_type_id': 3},
+            status_map={3: 'Rated'}, base_url=self.server.base_url
+        )
+        self.assertLess(time.time() - start, 1.6 * self.latency)
+        self.assertEqual(status, 'Rated')
+        self.assertEqual(report['bes_building_id'], 101)
+        self.assertIn('number_floors', report)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.utils.bes_idempotent
+"""
+
+# Imports from Standard Library
+import os
+import shutil
+import tempfile
+import unittest
+
+# Imports from Third Party Modules
+import requests
+from requests.exceptions import ReadTimeout
+
+# Local Imports
+from pybes.pybes import BESClient, BESError
+from pybes.testing.fake_server import (
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESServer,
+)
+from pybes.utils.bes_idempotent import (
+    CREATED,
+    CreationIndex,
+    create_preview_building,
+    creation_key,
+)
+from pybes.utils.bes_utils import normalize_address
+
+BUILDING = {
+    'building_name': 'Test Building',
+    'year_completed': 1990,
+    'floor_area': 10000,
+    'street': '123 North Main Street',
+    'city': 'Portland',
+    'state': 'OR',
+    'postal_code': '97201',
+    'use_type': 'Office',
+    'orientation': 'North/South',
+    'number_floors': 2,
+}
+
+
+# Helper Functions & Classes
+class TimeoutAfterSending(object):
+    """Transport that sends POSTs, then raises ReadTimeout for the first n"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, n=1):
+        self.n = n
+
+    def request(self, method, url, **kwargs):
+        """Make request"""
+        response = requests.request(method.upper(), url, **kwargs)
+        if method == 'post' and self.n:
+            self.n -= 1
+            raise ReadTimeout('read timed out')
+        return response
+
+
+# Tests
+class CreationKeyTests(unittest.TestCase):
+    """Test creation_key"""
+
+    def test_normalize_address(self):
+        """Test addresses are normalized for comparison"""
+        self.assertEqual(
+            normalize_address('123 North Main Street.'),
+            normalize_address('123  n. MAIN st')
+        )
+        self.assertEqual(normalize_address(None), '')
+
+    def test_creation_key(self):
+        """Test equivalent buildings have the same key"""
+        key = creation_key('Bldg', '1 Main Street', 'Portland', 'OR',
+                           '97201', '1990')
+        self.assertEqual(
+            key,
+            creation_key('bldg ', '1 main st', 'PORTLAND', 'or',
+                         '97201-1234', 1990)
+        )
+        self.assertNotEqual(
+            key,
+            creation_key('Bldg', '1 Main Street', 'Portland', 'OR',
+                         '97201', 1991)
+        )
+
+
+class CreatePreviewBuildingTests(unittest.TestCase):
+    """Test create_preview_building against FakeBESServer"""
+
+    def setUp(self):
+        """setUp"""
+        self.server = FakeBESServer().start()
+        self.tmpdir = tempfile.mkdtemp()
+        self.index = CreationIndex(os.path.join(self.tmpdir, 'index.db'))
+
+    def tearDown(self):
+        """tearDown"""
+        self.index.close()
+        shutil.rmtree(self.tmpdir)
+        self.server.stop()
+
+    def client(self, transport=None):
+        """BESClient for the fake server"""
+        return BESClient(
+            base_url=self.server.base_url, access_token=DEFAULT_TOKEN,
+            user_id=DEFAULT_USER_ID, transport=transport
+        )
+
+    def count(self):
+        """Number of preview buildings on the server"""
+        return len(self.client().list_preview_buildings())
+
+    def test_create_once(self):
+        """Test a building is only created once"""
+        first = create_preview_building(self.client(), self.index, **BUILDING)
+        second = create_preview_building(
+            self.client(), self.index,
+            **dict(BUILDING, street='123 N Main St')
+        )
+        self.assertEqual(first, second)
+        self.assertEqual(self.count(), 1)
+        self.assertEqual(self.index.building_ids(), {first['building_id']})
+
+    def test_timeout_reconciled(self):
+        """Test a create that timed out is found rather than repeated"""
+        client = self.client(TimeoutAfterSending(1))
+        # an unrelated building with the same name is ignored
+        self.client().create_preview_building(
+            **dict(BUILDING, street='9 Other Rd')
+        )
+        building = create_preview_building(client, self.index, **BUILDING)
+        self.assertEqual(self.count(), 2)
+        self.assertEqual(building['address'], BUILDING['street'])
+
+    def test_unknown_outcome_checked_next_time(self):
+        """Test a creation whose outcome is unknown is checked next call"""
+        client = self.client(TimeoutAfterSending(1))
+        with self.assertRaises(ReadTimeout):
+            create_preview_building(client, self.index, retries=0, **BUILDING)
+        building = create_preview_building(
+            self.client(), self.index, **BUILDING
+        )
+        self.assertEqual(self.count(), 1)
+        entry = self.index.get(
+            creation_key('Test Building', '123 North Main Street',
+                         'Portland', 'OR', '97201', 1990)
+        )
+        self.assertEqual(entry['state'], CREATED)
+        self.assertEqual(entry['building_id'], building['building_id'])
+
+    def test_error_released(self):
+        """Test definite failures release the claim"""
+        with self.assertRaises(BESError):
+            create_preview_building(
+                self.client(), self.index, **dict(BUILDING, use_type='')
+            )
+        self.assertEqual(self.index.building_ids(), set())
+        create_preview_building(
+            self.client(), self.index, **dict(BUILDING, use_type='Office')
+        )
+        self.assertEqual(self.count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
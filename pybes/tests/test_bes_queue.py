@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.utils.bes_queue
+"""
+
+# Imports from Standard Library
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# Local Imports
+from pybes.breaker import CircuitOpenError
+from pybes.pybes import BESClient
+from pybes.testing.fake_server import (
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESServer,
+)
+from pybes.testing.synthetic import make_portfolio
+from pybes.utils.bes_queue import (
+    CLAIMED,
+    DONE,
+    FAILED,
+    PENDING,
+    LeaseLost,
+    WorkQueue,
+    enqueue_buildings,
+    report_handler,
+)
+
+PY3 = sys.version_info[0] == 3
+if PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+# Helper Functions & Classes
+class Clock(object):
+    """Fake clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+# Tests
+class WorkQueueTests(unittest.TestCase):
+    """Test WorkQueue"""
+
+    def setUp(self):
+        """setUp"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'queue.db')
+        self.clock = Clock()
+        self.queue = WorkQueue(
+            self.path, lease=60, max_attempts=2, retry_delay=10,
+            clock=self.clock
+        )
+
+    def tearDown(self):
+        """tearDown"""
+        self.queue.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_put_claim_complete(self):
+        """Test items are claimed once and completed"""
+        self.assertEqual(self.queue.put_many([1, 2, (3, {'a': 1})], 'a'), 3)
+        self.assertFalse(self.queue.put(1, 'a'))
+        items = self.queue.claim('w1', limit=2)
+        self.assertEqual([item.building_id for item in items], [1, 2])
+        self.assertEqual(items[0].attempts, 1)
+        item = self.queue.claim('w2')[0]
+        self.assertEqual((item.building_id, item.payload), (3, {'a': 1}))
+        self.assertEqual(self.queue.claim('w2'), [])
+        self.queue.complete(items[0], result={'score': 1}, next_stage='b')
+        self.assertEqual(list(self.queue.results('a')), [{'score': 1}])
+        self.assertEqual(
+            self.queue.counts(),
+            {'a': {DONE: 1, CLAIMED: 2}, 'b': {PENDING: 1}}
+        )
+        item = self.queue.claim('w1', stages=['b'])[0]
+        self.assertEqual(item.payload, {'score': 1})
+
+    def test_lease_expiry(self):
+        """Test expired leases are requeued and the old worker loses them"""
+        self.queue.put(1, 'a')
+        item = self.queue.claim('w1')[0]
+        self.clock.now += 40
+        self.queue.heartbeat(item)
+        self.clock.now += 40
+        self.assertEqual(self.queue.claim('w2'), [])
+        self.clock.now += 40
+        stolen = self.queue.claim('w2')[0]
+        self.assertEqual(stolen.attempts, 2)
+        with self.assertRaises(LeaseLost):
+            self.queue.heartbeat(item)
+        with self.assertRaises(LeaseLost):
+            self.queue.complete(item)
+        self.queue.complete(stolen)
+
+    def test_fail(self):
+        """Test failures are retried after a delay, up to max_attempts"""
+        self.queue.put(1, 'a')
+        item = self.queue.claim('w1')[0]
+        self.assertTrue(self.queue.fail(item, 'oops'))
+        self.assertEqual(self.queue.claim('w1'), [])
+        self.clock.now += 10
+        item = self.queue.claim('w1')[0]
+        self.assertFalse(self.queue.fail(item, 'oops'))
+        self.assertEqual(self.queue.remaining(), 0)
+        self.assertEqual(
+            self.queue.failures(),
+            [{'building_id': 1, 'stage': 'a', 'attempts': 2,
+              'error': 'oops'}]
+        )
+        self.assertEqual(self.queue.counts(), {'a': {FAILED: 1}})
+
+    def test_defer(self):
+        """Test deferred items are retried later without using an attempt"""
+        self.queue.put(1, 'a')
+        item = self.queue.claim('w1')[0]
+        self.queue.defer(item, 30)
+        self.assertEqual(self.queue.claim('w1'), [])
+        self.clock.now += 30
+        self.assertEqual(self.queue.claim('w1')[0].attempts, 1)
+
+    def test_work_deferred(self):
+        """Test items hitting an open circuit are deferred"""
+        self.queue.put(1, 'a')
+        errors = [CircuitOpenError('open', retry_after=5)] * 3
+
+        def handler(_):
+            """Fail while circuit is open"""
+            if errors:
+                raise errors.pop()
+            return 'ok'
+
+        def sleep(seconds):
+            """Advance clock"""
+            self.clock.now += seconds
+
+        self.queue.work({'a': handler}, poll_interval=1, sleep=sleep)
+        self.assertEqual(list(self.queue.results('a')), ['ok'])
+        self.assertEqual(self.clock.now, 1015)
+
+    def test_work_heartbeat(self):
+        """Test leases of processed items in a batch are not renewed"""
+        queue = WorkQueue(self.path, lease=0.3)
+        queue.put_many(range(3), 'a')
+        heartbeats = []
+        heartbeat = queue.heartbeat
+
+        def record(item):
+            """Record heartbeats"""
+            heartbeats.append(item.building_id)
+            return heartbeat(item)
+
+        def handler(item):
+            """Slow for the last item"""
+            if item.building_id == 2:
+                time.sleep(0.5)
+            return item.building_id
+
+        try:
+            with mock.patch.object(queue, 'heartbeat', side_effect=record), \
+                    mock.patch('pybes.utils.bes_queue.log') as mock_log:
+                queue.work({'a': handler}, batch=3)
+        finally:
+            queue.close()
+        self.assertIn(2, heartbeats)
+        self.assertNotIn(0, heartbeats)
+        self.assertNotIn(1, heartbeats)
+        self.assertFalse(mock_log.warning.called)
+        self.assertEqual(self.queue.counts()['a'], {DONE: 3})
+
+    def test_work(self):
+        """Test workers in several threads drain a pipeline"""
+        self.queue.put_many(range(50), 'double')
+        seen = []
+
+        def double(item):
+            """First stage"""
+            seen.append(item.building_id)
+            if item.building_id == 7:
+                raise ValueError('bad')
+            return item.building_id * 2
+
+        handlers = {'double': double, 'add': lambda item: item.payload + 1}
+
+        def worker():
+            """Worker thread"""
+            queue = WorkQueue(self.path, retry_delay=0, max_attempts=2)
+            queue.work(handlers, pipeline=['double', 'add'], batch=5,
+                       poll_interval=0.01)
+            queue.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(seen), 51)
+        self.assertEqual(
+            list(self.queue.results('add')),
+            [idx * 2 + 1 for idx in range(50) if idx != 7]
+        )
+        self.assertEqual(self.queue.counts()['double'], {DONE: 49, FAILED: 1})
+
+
+class BESPipelineTests(unittest.TestCase):
+    """Test enqueue_buildings and report_handler against FakeBESServer"""
+
+    def setUp(self):
+        """setUp"""
+        self.server = FakeBESServer().start()
+        preview, full = make_portfolio(3, 2, start_id=100)
+        self.server.app.seed(preview=preview, full=full)
+        self.bes_kwargs = {
+            'base_url': self.server.base_url,
+            'access_token': DEFAULT_TOKEN,
+            'user_id': DEFAULT_USER_ID,
+        }
+        self.tmpdir = tempfile.mkdtemp()
+        self.queue = WorkQueue(os.path.join(self.tmpdir, 'queue.db'))
+
+    def tearDown(self):
+        """tearDown"""
+        self.queue.close()
+        shutil.rmtree(self.tmpdir)
+        self.server.stop()
+
+    def test_pipeline(self):
+        """Test reports are fetched for every rated building"""
+        added = enqueue_buildings(self.queue, BESClient(**self.bes_kwargs))
+        self.assertEqual(added, 5)
+        self.queue.work({'report': report_handler(self.bes_kwargs)})
+        reports = list(self.queue.results('report'))
+        self.assertEqual(len(reports), 5)
+        self.assertEqual(self.queue.failures(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.utils.bes_sweep
+"""
+
+# Imports from Standard Library
+import itertools
+import sys
+import unittest
+
+# Imports from Third Party Modules
+from requests import exceptions
+
+# Local Imports
+from pybes.pybes import APIError, BESClient
+from pybes.utils.bes_constants import PREVIEW_SCORE_KEYS
+from pybes.utils.bes_sweep import (
+    ScenarioSweep,
+    expand_grid,
+    results_to_array,
+    results_to_dataframe,
+)
+
+PY3 = sys.version_info[0] == 3
+if PY3:
+    from unittest import mock
+else:
+    import mock
+
+try:
+    import pandas                   # noqa pylint: disable=unused-import
+    HAS_PANDAS = True
+except ImportError:
+    HAS_PANDAS = False
+
+# Constants
+GRID = {
+    'floor:floor_type': ['Slab-on-Grade', 'Wood framed'],
+    'roof:roof_type': ['Built-up w/ metal deck'],
+}
+
+
+# Helper Functions & Classes
+def get_preview_building(building_id, report_type=None):
+    """Mock get_preview_building"""
+    if report_type:
+        return {key: building_id for key in PREVIEW_SCORE_KEYS}
+    return {
+        'building_id': building_id, 'status!': 'Rated',
+        'blocks': [{'block_id': building_id * 10}]
+    }
+
+
+# Tests
+class ScenarioSweepTests(unittest.TestCase):
+    """Unit tests for ScenarioSweep"""
+
+    def setUp(self):
+        """setUp"""
+        self.client = mock.MagicMock(spec=BESClient)
+        self.clone_ids = itertools.count(100)
+        self.client.duplicate_preview_building.side_effect = (
+            lambda building_id: {'building_id': next(self.clone_ids)}
+        )
+        self.client.get_preview_building.side_effect = get_preview_building
+
+    def test_expand_grid(self):
+        """Test expand_grid"""
+        result = expand_grid(GRID)
+        self.assertEqual(len(result), 2)
+        self.assertEqual(
+            [dict(scenario) for scenario in result],
+            [
+                {
+                    'floor:floor_type': 'Slab-on-Grade',
+                    'roof:roof_type': 'Built-up w/ metal deck'
+                },
+                {
+                    'floor:floor_type': 'Wood framed',
+                    'roof:roof_type': 'Built-up w/ metal deck'
+                },
+            ]
+        )
+
+    def test_run(self):
+        """Test each scenario is cloned, updated, simulated and removed"""
+        sweep = ScenarioSweep(self.client, 1, GRID, poll_interval=0)
+        results = sweep.run()
+        self.assertEqual(len(results), 2)
+        self.assertEqual(
+            self.client.duplicate_preview_building.call_count, 2
+        )
+        self.client.update_preview_building.assert_any_call(
+            100, 1000, extras={
+                'floor:floor_type': 'Slab-on-Grade',
+                'roof:roof_type': 'Built-up w/ metal deck'
+            }
+        )
+        self.assertEqual(self.client.simulate_preview_building.call_count, 2)
+        for result in results:
+            self.assertEqual(result['status'], 'Rated')
+            self.assertIsNone(result['error'])
+            self.assertEqual(result['mean_eui'], result['building_id'])
+        self.client.delete_preview_building.assert_any_call(100)
+        self.client.delete_preview_building.assert_any_call(101)
+        self.assertEqual(sweep.clones, [])
+
+    def test_run_error(self):
+        """Test failed scenarios are recorded and still cleaned up"""
+        self.client.validate_preview_building.side_effect = APIError(
+            'Unable to validate preview building: 422 invalid',
+            status_code=422
+        )
+        sweep = ScenarioSweep(
+            self.client, 1, GRID, max_workers=1, poll_interval=0
+        )
+        results = sweep.run()
+        self.assertTrue(all(result['error'] for result in results))
+        self.assertFalse(self.client.simulate_preview_building.called)
+        self.assertEqual(self.client.delete_preview_building.call_count, 2)
+
+    def test_run_request_error(self):
+        """Test a scenario timing out doesn't lose the other results"""
+        self.client.simulate_preview_building.side_effect = [
+            exceptions.ReadTimeout('timed out'), None
+        ]
+        self.client.delete_preview_building.side_effect = [
+            exceptions.ConnectionError('reset'), None
+        ]
+        sweep = ScenarioSweep(
+            self.client, 1, GRID, max_workers=1, poll_interval=0
+        )
+        results = sweep.run()
+        self.assertEqual(len(results), 2)
+        self.assertIn('timed out', results[0]['error'])
+        self.assertIsNone(results[0]['mean_eui'])
+        self.assertIsNone(results[1]['error'])
+        self.assertEqual(results[1]['status'], 'Rated')
+        self.assertEqual(self.client.delete_preview_building.call_count, 2)
+
+    def test_wait_for_rating(self):
+        """Test status is polled until simulation finishes"""
+        self.client.get_preview_building.side_effect = [
+            {'status!': 'Running'}, {'status!': 'Running'},
+            {'status!': 'Rated'}
+        ]
+        sweep = ScenarioSweep(self.client, 1, GRID, poll_interval=0)
+        self.assertEqual(sweep._wait_for_rating(1), 'Rated')
+        self.assertEqual(self.client.get_preview_building.call_count, 3)
+
+    @unittest.skipUnless(HAS_PANDAS, 'requires pandas')
+    def test_results_to_grid(self):
+        """Test results_to_array and results_to_dataframe"""
+        results = ScenarioSweep(
+            self.client, 1, GRID, poll_interval=0
+        ).run()
+        frame = results_to_dataframe(results, GRID)
+        self.assertEqual(list(frame.index.names), list(GRID.keys()))
+        self.assertEqual(len(frame), 2)
+        array = results_to_array(results, GRID, 'high_score')
+        self.assertEqual(array.shape, (2, 1))
+        self.assertEqual(sorted(array.flatten().tolist()), [100, 101])
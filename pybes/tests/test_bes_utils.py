@@ -10,10 +10,12 @@ Unit tests for pybes.utils.bes_utils functions
 
 # Imports from Standard Library
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
 
 # Local Imports
-from pybes.utils.bes_utils import convert_bes_year
+from pybes.utils.bes_utils import convert_bes_year, fetch_concurrently
 
 PY3 = sys.version_info[0] == 3
 if PY3:
@@ -69,3 +71,42 @@ class BESUtilTests(TestCase):
         for value in values:
             result = convert_bes_year(value)
             self.assertEqual(value, result)
+
+    def test_fetch_concurrently(self):
+        """Test fetch_concurrently makes calls at the same time"""
+        started = threading.Event()
+
+        def first():
+            """Only returns if second is running"""
+            return started.wait(5)
+
+        def second():
+            """Signal first"""
+            started.set()
+            return 2
+
+        self.assertEqual(fetch_concurrently([first, second]), [True, 2])
+        started.clear()
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.assertEqual(
+            fetch_concurrently([first, second], executor=executor), [True, 2]
+        )
+        executor.shutdown()
+        self.assertEqual(fetch_concurrently([lambda: 1]), [1])
+
+        finished = []
+
+        def fail():
+            """Raise once the other call has finished"""
+            started.wait(5)
+            raise ValueError('fail')
+
+        def slow():
+            """Finish after fail starts waiting"""
+            started.set()
+            finished.append(True)
+
+        started.clear()
+        with self.assertRaises(ValueError):
+            fetch_concurrently([fail, slow])
+        self.assertEqual(finished, [True])
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.utils.bes_validation
+"""
+
+# Imports from Standard Library
+import unittest
+
+# Local Imports
+from pybes.pybes import BESClient
+from pybes.testing.fake_server import (
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESServer,
+)
+from pybes.utils.bes_validation import PayloadValidator, ValidationError
+
+PREVIEW = {
+    'building_name': 'Test Building',
+    'year_completed': '1990',
+    'floor_area': 10000,
+    'street': '123 Main St',
+    'city': 'Portland',
+    'state': 'OR',
+    'postal_code': '97201',
+    'assessment_type': 'Real',
+    'use_type': 'Office',
+    'orientation': 'North/South',
+    'number_floors': 2,
+}
+BLOCK = {
+    'shape_id': 1,
+    'name': 'Block 1',
+    'floor_to_floor_height': 12,
+    'floor_to_ceiling_height': 9,
+    'is_above_ground': True,
+    'number_of_floors': 2,
+    'orientation': 0,
+    'position': '0,0',
+    'vertices': '0,0 100,0 100,100 0,100',
+    'dimension_1': 100,
+    'dimension_2': 100,
+}
+RESOURCE_TYPES = {
+    'use_types': [
+        {'id': 1, 'name': 'office', 'display_name': 'Office'},
+        {'id': 2, 'name': 'retail', 'display_name': 'Retail'},
+    ],
+    'shapes': [
+        {'id': 1, 'display_name': 'Rectangle', 'number_of_dimensions': 2},
+        {'id': 2, 'display_name': 'L-Shape', 'number_of_dimensions': 4},
+    ],
+}
+
+
+class PayloadValidatorTests(unittest.TestCase):
+    """Test PayloadValidator"""
+
+    def setUp(self):
+        """setUp"""
+        self.validator = PayloadValidator(RESOURCE_TYPES, max_year=2017)
+
+    def test_valid(self):
+        """Test valid payloads have no errors"""
+        self.assertEqual(self.validator.validate_preview(PREVIEW), {})
+        self.assertEqual(self.validator.validate_block(BLOCK), {})
+        self.validator.check_preview(PREVIEW)
+        self.validator.check_block({'shape_id': 2}, partial=True)
+
+    def test_preview_errors(self):
+        """Test preview payload rules"""
+        errors = self.validator.validate_preview(dict(
+            PREVIEW, year_completed='1850', floor_area='big', street=' ',
+            postal_code='972', use_type='Hangar', orientation='Up',
+            number_floors=2.5, storeys=2,
+        ))
+        self.assertEqual(
+            sorted(errors),
+            ['floor_area', 'number_floors', 'orientation', 'postal_code',
+             'storeys', 'street', 'use_type', 'year_completed']
+        )
+        self.assertEqual(errors['street'], "can't be blank")
+        self.assertEqual(errors['use_type'], 'is not a valid use type')
+        self.assertIn(
+            'year_completed',
+            self.validator.validate_preview(dict(PREVIEW, year_completed=2030))
+        )
+        with self.assertRaises(ValidationError) as conm:
+            self.validator.check_preview(dict(PREVIEW, floor_area=0))
+        self.assertEqual(
+            conm.exception.errors,
+            {'floor_area': 'must be greater than 0'}
+        )
+
+    def test_block_errors(self):
+        """Test block rules, inc dimensions required by shape"""
+        errors = self.validator.validate_block(dict(
+            BLOCK, floor_to_floor_height=9, is_above_ground='maybe',
+            orientation=360, vertices='0,0 100', building_use_type_id=9,
+        ))
+        self.assertEqual(
+            sorted(errors),
+            ['building_use_type_id', 'floor_to_floor_height',
+             'is_above_ground', 'orientation', 'vertices']
+        )
+        errors = self.validator.validate_block(
+            dict(BLOCK, shape_id=2, dimension_3=10)
+        )
+        self.assertEqual(errors, {'dimension_4': "can't be blank for this shape"})
+        errors = self.validator.validate_block(
+            dict(BLOCK, floor_to_ceiling_height=14)
+        )
+        self.assertEqual(list(errors), ['floor_to_ceiling_height'])
+        self.assertEqual(
+            list(self.validator.validate_block({'shape_id': 3}, partial=True)),
+            ['shape_id']
+        )
+
+    def test_without_resource_types(self):
+        """Test enums from the api are not checked without resource types"""
+        validator = PayloadValidator()
+        self.assertEqual(
+            validator.validate_preview(dict(PREVIEW, use_type='Hangar')), {}
+        )
+
+    def test_from_client(self):
+        """Test resource types are fetched from the api"""
+        server = FakeBESServer().start()
+        try:
+            client = BESClient(
+                base_url=server.base_url, access_token=DEFAULT_TOKEN,
+                user_id=DEFAULT_USER_ID
+            )
+            validator = PayloadValidator.from_client(client)
+        finally:
+            server.stop()
+        self.assertEqual(validator.validate_preview(PREVIEW), {})
+        self.assertEqual(validator.dimensions[2], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
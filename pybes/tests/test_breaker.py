@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.breaker
+"""
+
+# Imports from Standard Library
+import sys
+import unittest
+
+# Local Imports
+from pybes.breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    endpoint_family,
+)
+from pybes.testing.fake_server import (
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESServer,
+)
+from pybes.testing.synthetic import make_portfolio
+from pybes.transports import CircuitBreakerTransport
+from pybes.utils.bes_constants import DEFERRED
+from pybes.utils.bes_full import get_bes_buildings
+
+PY3 = sys.version_info[0] == 3
+if PY3:
+    from unittest import mock
+else:
+    import mock
+
+SCORE = 'v1/buildings/{id}/score'
+
+
+# Helper Functions & Classes
+class Clock(object):
+    """Fake clock"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# Tests
+class CircuitBreakerTests(unittest.TestCase):
+    """Unit tests for CircuitBreaker"""
+
+    def setUp(self):
+        """setUp"""
+        self.clock = Clock()
+        self.breaker = CircuitBreaker(
+            failure_threshold=3, error_rate=0.5, window=10, reset_timeout=30,
+            clock=self.clock
+        )
+
+    def call(self, success, family=SCORE):
+        """Record a call"""
+        probe = self.breaker.before(family)
+        self.breaker.record(family, success, probe=probe)
+        return probe
+
+    def test_endpoint_family(self):
+        """Test urls are reduced to templates"""
+        self.assertEqual(
+            endpoint_family('https://api.labworks.org/api/v1/buildings/12/'
+                            'score?token=x'),
+            SCORE
+        )
+        self.assertEqual(
+            endpoint_family('http://127.0.0.1:80/api/v2/preview_buildings'),
+            'v2/preview_buildings'
+        )
+
+    def test_open(self):
+        """Test circuit opens on enough failures and fails fast"""
+        for success in (True, False, True, False, True, True):
+            self.call(success)
+        self.assertEqual(self.breaker.state(SCORE), CLOSED)
+        # 3 failures but less than half the window
+        self.call(False)
+        self.assertEqual(self.breaker.state(SCORE), CLOSED)
+        self.call(False)
+        self.assertEqual(self.breaker.state(SCORE), OPEN)
+        self.clock.now = 10
+        with self.assertRaises(CircuitOpenError) as conm:
+            self.breaker.before(SCORE)
+        self.assertEqual(conm.exception.family, SCORE)
+        self.assertEqual(conm.exception.retry_after, 20)
+        self.assertEqual(self.breaker.retry_after(SCORE), 20)
+        # other families are unaffected
+        self.assertFalse(self.call(False, family='v1/blocks/{id}'))
+        self.assertEqual(self.breaker.states(), {SCORE: OPEN})
+        self.assertEqual((self.breaker.opened, self.breaker.rejected), (1, 1))
+
+    def test_half_open(self):
+        """Test one probe is let through after reset_timeout"""
+        for _ in range(3):
+            self.call(False)
+        self.clock.now = 30
+        self.assertEqual(self.breaker.state(SCORE), HALF_OPEN)
+        self.assertTrue(self.breaker.before(SCORE))
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before(SCORE)
+        # a call from before the circuit opened doesn't count
+        self.breaker.record(SCORE, True)
+        self.breaker.record(SCORE, False, probe=True)
+        self.assertEqual(self.breaker.state(SCORE), OPEN)
+        # reopened by the failed probe
+        self.assertEqual(self.breaker.opened, 2)
+        self.clock.now = 60
+        self.assertTrue(self.call(True))
+        self.assertEqual(self.breaker.state(SCORE), CLOSED)
+        self.assertIsNone(self.breaker.retry_after(SCORE))
+        self.call(False)
+        self.assertEqual(self.breaker.state(SCORE), CLOSED)
+
+    def test_transport(self):
+        """Test CircuitBreakerTransport records 5xx and errors"""
+        transport = mock.MagicMock()
+        transport.request.return_value.status_code = 500
+        protected = CircuitBreakerTransport(self.breaker, transport)
+        url = 'http://bes/api/v1/buildings/1/score'
+        protected.request('get', url, timeout=1)
+        transport.request.assert_called_with('get', url, timeout=1)
+        transport.request.return_value.status_code = 404
+        protected.request('get', url)
+        transport.request.side_effect = IOError('reset')
+        for _ in range(2):
+            with self.assertRaises(IOError):
+                protected.request('get', url)
+        self.assertEqual(self.breaker.state(SCORE), OPEN)
+        with self.assertRaises(CircuitOpenError):
+            protected.request('get', url)
+        self.assertEqual(transport.request.call_count, 4)
+
+    def test_get_bes_buildings(self):
+        """Test buildings are deferred while the score endpoint fails"""
+        preview, full = make_portfolio(2, 10, start_id=100)
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        server = FakeBESServer(endpoint_errors={'GET ' + SCORE: 1.0})
+        with server:
+            server.app.seed(preview=preview, full=full)
+            incomplete = []
+            buildings = list(get_bes_buildings(
+                incomplete, base_url=server.base_url,
+                access_token=DEFAULT_TOKEN, user_id=DEFAULT_USER_ID,
+                transport=CircuitBreakerTransport(breaker)
+            ))
+            calls = server.app.calls['GET ' + SCORE]
+        self.assertEqual(
+            sorted(bes_type for _, bes_type in buildings), ['Preview'] * 2
+        )
+        self.assertEqual(calls, 3)
+        self.assertEqual(len(incomplete), 10)
+        self.assertEqual(
+            len([bldg for bldg in incomplete if bldg.status == DEFERRED]), 7
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
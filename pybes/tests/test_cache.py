@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.cache
+"""
+
+# Imports from Standard Library
+import pickle
+import unittest
+
+# Local Imports
+from pybes.cache import CacheStats, LRUCache, NegativeCache, is_negative
+from pybes.pybes import APIError, BESClient
+from pybes.testing.fake_server import (
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESServer,
+)
+from pybes.testing.synthetic import make_portfolio
+from pybes.utils.bes_full import get_bes_buildings
+
+
+class Clock(object):
+    """Fake clock"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LRUCacheTests(unittest.TestCase):
+    """Test LRUCache"""
+
+    def test_lru(self):
+        """Test least recently used entries are evicted"""
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('b', 'missing'), 'missing')
+        self.assertEqual(
+            cache.stats(),
+            CacheStats(hits=1, misses=1, evictions=1, invalidations=0,
+                       size=2, maxsize=2)
+        )
+        self.assertEqual(cache.hit_rate, 0.5)
+        self.assertTrue(cache.invalidate('a'))
+        self.assertFalse(cache.invalidate('a'))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats().invalidations, 2)
+        with self.assertRaises(ValueError):
+            LRUCache(0)
+
+    def test_copies(self):
+        """Test cached values can't be modified by callers"""
+        cache = LRUCache()
+        value = {'a': [1]}
+        cache.set('key', value)
+        value['a'].append(2)
+        cache.get('key')['a'].append(3)
+        self.assertEqual(cache.get('key'), {'a': [1]})
+
+    def test_children(self):
+        """Test entries set with a parent are invalidated with it"""
+        cache = LRUCache(maxsize=3)
+        cache.set('a', 1, parent='block')
+        cache.set('b', 2, parent='block')
+        cache.set('c', 3, parent='other')
+        self.assertTrue(cache.invalidate('a'))
+        self.assertEqual(cache.invalidate_children('block'), 1)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.invalidate_children('block'), 0)
+        for key in 'defg':
+            cache.set(key, key)
+        self.assertNotIn('c', cache)
+        self.assertEqual(cache.invalidate_children('other'), 0)
+        self.assertEqual(cache.stats().invalidations, 2)
+        self.assertEqual((cache._parents, cache._children), ({}, {}))
+        value = cache.get_or_fetch(
+            'h', lambda: {'p': 'x'}, parent=lambda value: value['p']
+        )
+        self.assertEqual(value, {'p': 'x'})
+        self.assertEqual(cache.parent('h'), 'x')
+        self.assertIsNone(cache.parent('d'))
+
+    def test_get_or_fetch(self):
+        """Test fetch is only called on a miss and errors aren't cached"""
+        cache = LRUCache()
+        calls = []
+
+        def fetch():
+            """Fetch"""
+            calls.append(1)
+            return {'id': 1}
+
+        self.assertEqual(cache.get_or_fetch('key', fetch), {'id': 1})
+        self.assertEqual(cache.get_or_fetch('key', fetch), {'id': 1})
+        self.assertEqual(len(calls), 1)
+
+        def fail():
+            """Fetch failing"""
+            raise APIError('404 Not Found')
+
+        with self.assertRaises(APIError):
+            cache.get_or_fetch('other', fail)
+        self.assertNotIn('other', cache)
+
+    def test_write_during_fetch(self):
+        """Test a fetch overlapping an invalidation is not cached"""
+        cache = LRUCache()
+
+        def fetch():
+            """Fetch, while another thread updates the object"""
+            cache.invalidate('key')
+            return 'stale'
+
+        self.assertEqual(cache.get_or_fetch('key', fetch), 'stale')
+        self.assertNotIn('key', cache)
+
+
+class ClientCacheTests(unittest.TestCase):
+    """Test BESClient reads through and writes to the cache"""
+
+    def setUp(self):
+        """setUp"""
+        self.server = FakeBESServer().start()
+        _, full = make_portfolio(0, 1, start_id=100)
+        self.server.app.seed(full=full)
+        self.block_id = full[0]['blocks'][0]['id']
+        self.cache = LRUCache()
+        self.client = BESClient(
+            base_url=self.server.base_url, access_token=DEFAULT_TOKEN,
+            user_id=DEFAULT_USER_ID, cache=self.cache
+        )
+        self.calls = self.server.app.calls
+
+    def tearDown(self):
+        """tearDown"""
+        self.server.stop()
+
+    def test_block(self):
+        """Test get_block is cached and updates invalidate it"""
+        block = self.client.get_block(self.block_id)
+        self.assertEqual(self.client.get_block(str(self.block_id)), block)
+        self.assertEqual(self.calls['GET v1/blocks/{id}'], 1)
+        self.client.update_block(self.block_id, 1, name='Renamed')
+        self.assertEqual(
+            self.client.get_block(self.block_id)['name'], 'Renamed'
+        )
+        self.assertEqual(self.calls['GET v1/blocks/{id}'], 2)
+        self.client.delete_block(self.block_id)
+        with self.assertRaises(APIError):
+            self.client.get_block(self.block_id)
+
+    def test_resources(self):
+        """Test created resources are written through"""
+        resource = self.client.create_block_resource(
+            'surface', self.block_id, 'North wall'
+        )
+        self.assertEqual(
+            self.client.get_block_resource('surface', resource['id']),
+            resource
+        )
+        self.assertEqual(self.calls['GET v1/surfaces/{id}'], 0)
+        self.client.update_block_resource(
+            'surface', resource['id'], 1, name='South wall'
+        )
+        self.assertEqual(
+            self.client.get_block_resource('surface', resource['id'])['name'],
+            'South wall'
+        )
+        roof = self.client.create_resource('roof', 100, name='Roof')
+        self.assertEqual(self.client.get_resource('roofs', roof['id']), roof)
+        self.client.delete_resource('roof', roof['id'])
+        with self.assertRaises(APIError):
+            self.client.get_resource('roof', roof['id'])
+
+    def test_delete_block(self):
+        """Test deleting a block invalidates its cached resources"""
+        surface = self.client.create_block_resource(
+            'surface', self.block_id, 'North wall'
+        )
+        roof = self.client.create_resource('roof', 100, name='Roof')
+        self.client.delete_block(self.block_id)
+        self.assertNotIn(('surfaces', str(surface['id'])), self.cache)
+        self.assertIn(('roofs', str(roof['id'])), self.cache)
+        self.client.get_block_resource('surface', surface['id'])
+        self.assertEqual(self.calls['GET v1/surfaces/{id}'], 1)
+
+    def test_block_resource_changes(self):
+        """Test updating or deleting a block resource invalidates its block"""
+        surface = self.client.create_block_resource(
+            'surface', self.block_id, 'North wall'
+        )
+        key = ('surfaces', str(surface['id']))
+        block = ('blocks', str(self.block_id))
+        self.assertEqual(self.cache.parent(key), block)
+        self.client.get_block(self.block_id)
+        self.client.update_block_resource(
+            'surface', surface['id'], 1, name='South wall'
+        )
+        self.assertNotIn(block, self.cache)
+        # read through, linked by the response's block_id
+        self.client.get_block_resource('surface', surface['id'])
+        self.assertEqual(self.cache.parent(key), block)
+        self.client.get_block(self.block_id)
+        self.client.delete_block_resource('surface', surface['id'])
+        self.assertNotIn(block, self.cache)
+        self.assertNotIn(key, self.cache)
+        self.assertEqual(self.calls['GET v1/blocks/{id}'], 2)
+
+    def test_delete_block_read_through(self):
+        """Test resources read through are invalidated with their block"""
+        surface = self.client.create_block_resource(
+            'surface', self.block_id, 'North wall'
+        )
+        self.cache.clear()
+        self.client.get_block_resource('surface', surface['id'])
+        self.client.delete_block(self.block_id)
+        self.assertNotIn(('surfaces', str(surface['id'])), self.cache)
+
+    def test_resource_types(self):
+        """Test resource types are cached"""
+        for _ in range(3):
+            self.client.get_resource_type('shape', 1)
+        self.assertEqual(self.calls['GET v1/shapes/{id}'], 1)
+        stats = self.cache.stats()
+        self.assertEqual((stats.hits, stats.misses), (2, 1))
+
+
+class NegativeCacheTests(unittest.TestCase):
+    """Test NegativeCache"""
+
+    def setUp(self):
+        """setUp"""
+        self.clock = Clock()
+        self.cache = NegativeCache(ttl=60, clock=self.clock)
+
+    def test_is_negative(self):
+        """Test only definite failures are negative"""
+        self.assertTrue(is_negative(APIError('invalid')))
+        self.assertTrue(is_negative(APIError('missing', status_code=404)))
+        self.assertTrue(is_negative(APIError('invalid', status_code=422)))
+        self.assertFalse(is_negative(APIError('error', status_code=500)))
+        self.assertFalse(is_negative(APIError('limited', status_code=429)))
+        self.assertFalse(is_negative(IOError('reset')))
+
+    def test_get(self):
+        """Test entries are keyed by updated_at and expire"""
+        self.assertTrue(self.cache.record(
+            'score', 1, 'a', APIError('Not Found', status_code=404)
+        ))
+        self.assertFalse(self.cache.record(
+            'score', 2, 'a', APIError('error', status_code=500)
+        ))
+        self.assertEqual(self.cache.get('score', 1, 'a'), 'Not Found')
+        self.assertEqual(self.cache.get('score', '1', 'a'), 'Not Found')
+        self.assertIsNone(self.cache.get('simulate', 1, 'a'))
+        self.assertIsNone(self.cache.get('score', 1, 'b'))
+        self.assertIsNone(self.cache.get('score', 2, 'a'))
+        self.clock.now = 60
+        self.assertIsNone(self.cache.get('score', 1, 'a'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_pickle(self):
+        """Test a pickled copy starts empty"""
+        self.cache.add('score', 1, 'a', 'Not Found')
+        cache = pickle.loads(pickle.dumps(NegativeCache(ttl=5)))
+        self.assertEqual(cache.ttl, 5)
+        self.assertEqual(len(cache), 0)
+
+    def test_get_bes_buildings(self):
+        """Test unchanged invalid buildings cost no calls"""
+        preview, full = make_portfolio(2, 3, n_blocks=0, rated=0,
+                                       start_id=100)
+        cache = NegativeCache()
+        with FakeBESServer() as server:
+            server.app.seed(preview=preview, full=full)
+            calls = server.app.calls
+
+            def run():
+                """Get buildings, returns validate calls made"""
+                before = sum(
+                    count for call, count in calls.items()
+                    if call.endswith('/validate')
+                )
+                incomplete = []
+                list(get_bes_buildings(
+                    incomplete, base_url=server.base_url,
+                    access_token=DEFAULT_TOKEN, user_id=DEFAULT_USER_ID,
+                    negative_cache=cache
+                ))
+                self.assertEqual(len(incomplete), 5)
+                return sum(
+                    count for call, count in calls.items()
+                    if call.endswith('/validate')
+                ) - before
+
+            self.assertEqual(run(), 5)
+            self.assertEqual(len(cache), 5)
+            self.assertEqual(run(), 0)
+            server.app.buildings[102]['data']['updated_at'] = 'changed'
+            self.assertEqual(run(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
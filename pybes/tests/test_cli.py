@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.cli
+"""
+
+# Imports from Standard Library
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Local Imports
+from pybes.cli import main
+from pybes.testing.fake_server import (
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESServer,
+)
+from pybes.testing.synthetic import make_portfolio
+
+PY3 = sys.version_info[0] == 3
+if PY3:
+    from unittest import mock
+else:
+    import mock
+
+# Constants
+PROPERTY_VIEW = {
+    'id': 7,
+    'state': {
+        'property_name': 'SEED Building',
+        'year_built': 1990,
+        'gross_floor_area': 10000,
+        'address_line_1': '123 Main St',
+        'address_line_2': None,
+        'city': 'Boring',
+        'state': 'OR',
+        'postal_code': '97009',
+        'property_type': 'Office',
+        'extra_data': {'number_floors': 2},
+    },
+}
+
+
+# Tests
+class CLITests(unittest.TestCase):
+    """Run subcommands against FakeBESServer"""
+
+    def setUp(self):
+        """setUp"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.server = FakeBESServer().start()
+        preview, full = make_portfolio(3, 3, rated=0.5, seed=1)
+        self.server.app.seed(preview=preview, full=full)
+        self.args = [
+            '--base-url', self.server.base_url, '--token', DEFAULT_TOKEN,
+            '--user-id', str(DEFAULT_USER_ID), '--workers', '2',
+        ]
+        self.stderr = mock.patch('sys.stderr').start()
+        self.stdout = mock.patch('sys.stdout').start()
+
+    def tearDown(self):
+        """tearDown"""
+        mock.patch.stopall()
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, name):
+        """Path in tmpdir"""
+        return os.path.join(self.tmpdir, name)
+
+    def summary(self):
+        """Summary written to stderr"""
+        return self.stderr.write.call_args[0][0]
+
+    def test_sync(self):
+        """Test sync writes reports, uses cache and checkpoint"""
+        args = ['sync'] + self.args + [
+            '-o', self.path('reports.jsonl'),
+            '--cache-dir', self.path('cache'),
+        ]
+        self.assertEqual(main(args), 0)
+        with open(self.path('reports.jsonl')) as fil:
+            reports = [json.loads(line) for line in fil]
+        self.assertEqual(len(reports), 6)
+        self.assertEqual(
+            set(report['bes_type'] for report in reports),
+            set(['Preview', 'Full'])
+        )
+        self.assertIn('sync: 6 done (0 cached)', self.summary())
+
+        calls = sum(self.server.app.calls.values())
+        self.assertEqual(main(args), 0)
+        self.assertIn('sync: 6 done (6 cached)', self.summary())
+        # only the listing calls are made again
+        self.assertEqual(sum(self.server.app.calls.values()) - calls, 3)
+
+        args = ['sync'] + self.args + [
+            '-o', self.path('reports.jsonl'),
+            '--checkpoint', self.path('checkpoint'),
+            '--rate-limit', '1000',
+        ]
+        main(args)
+        main(args)
+        self.assertIn('0 done (0 cached), 0 failed, 6 skipped',
+                      self.summary())
+
+    def test_simulate_and_validate(self):
+        """Test simulate and validate"""
+        self.assertEqual(main(['validate'] + self.args + ['1', '2']), 0)
+        self.assertEqual(main(['simulate'] + self.args), 0)
+        self.assertIn('simulate: 3 done', self.summary())
+        self.assertEqual(main(['simulate', '--full'] + self.args), 0)
+        self.assertIn('simulate: 3 done', self.summary())
+
+    def test_download_pdfs(self):
+        """Test download-pdfs"""
+        args = ['download-pdfs'] + self.args + [
+            '-d', self.path('pdfs'), '1', '2'
+        ]
+        self.assertEqual(main(args), 0)
+        self.assertEqual(
+            sorted(os.listdir(self.path('pdfs'))), ['1.pdf', '2.pdf']
+        )
+
+    def test_export_scores(self):
+        """Test export-scores writes a single header"""
+        args = ['export-scores'] + self.args + [
+            '-o', self.path('scores.csv'), '--chunk-size', '2'
+        ]
+        self.assertEqual(main(args), 0)
+        with open(self.path('scores.csv')) as fil:
+            lines = fil.read().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('building_id'))
+
+    def test_import_seed(self):
+        """Test import-seed creates preview buildings"""
+        with open(self.path('views.json'), 'w') as fil:
+            json.dump({'results': [PROPERTY_VIEW]}, fil)
+        with mock.patch(
+                'pybes.utils.bes_preview.get_bes_property_type',
+                return_value='Office'):
+            self.assertEqual(
+                main(['import-seed'] + self.args + [self.path('views.json')]),
+                0
+            )
+        self.assertIn('import-seed: 1 done', self.summary())
+        self.assertEqual(
+            len([
+                bldg for bldg in self.server.app.buildings.values()
+                if bldg['preview']
+            ]),
+            4
+        )
+
+    def test_import_seed_invalid(self):
+        """Test import-seed rejects invalid rows without an api call"""
+        view = dict(
+            PROPERTY_VIEW, state=dict(PROPERTY_VIEW['state'], city=' ')
+        )
+        with open(self.path('views.json'), 'w') as fil:
+            json.dump([view], fil)
+        with mock.patch(
+                'pybes.utils.bes_preview.get_bes_property_type',
+                return_value='Office'):
+            self.assertEqual(
+                main(['import-seed'] + self.args + [self.path('views.json')]),
+                1
+            )
+        self.assertEqual(
+            self.server.app.calls['POST v2/preview_buildings'], 0
+        )
+
+    def test_failures(self):
+        """Test failures are counted and give a non zero exit code"""
+        self.assertEqual(main(['validate'] + self.args + ['999']), 1)
+        self.assertIn('1 failed', self.summary())
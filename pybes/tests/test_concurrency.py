@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for sharing a pybes.pybes.BESClient between threads and
+processes
+"""
+
+# Imports from Standard Library
+import pickle
+import random
+import sys
+import threading
+import unittest
+
+# Local Imports
+from pybes.cache import LRUCache
+from pybes.limiter import RateLimiter
+from pybes.metrics import HistogramCollector
+from pybes.pybes import APIError, BESClient
+from pybes.testing.fake_server import (
+    DEFAULT_EMAIL,
+    DEFAULT_ORG_TOKEN,
+    DEFAULT_PASSWORD,
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESServer,
+)
+from pybes.testing.synthetic import make_portfolio
+from pybes.transports import RateLimitedTransport, SessionTransport
+
+PY3 = sys.version_info[0] == 3
+if PY3:
+    from concurrent.futures import ProcessPoolExecutor
+    from unittest import mock
+else:
+    import mock
+
+# Constants
+AUTHENTICATE = 'POST v2/users/authenticate'
+THREADS = 64
+CALLS_PER_THREAD = 40
+
+
+def _get_shape(client, shape_id):
+    """Get shape in a worker process"""
+    return client.get_resource_type('shape', shape_id)['id']
+
+
+class TokenRefreshTests(unittest.TestCase):
+    """Test expired tokens are refreshed"""
+
+    def setUp(self):
+        """setUp"""
+        self.server = FakeBESServer().start()
+        self.app = self.server.app
+        self.client = BESClient(
+            base_url=self.server.base_url, email=DEFAULT_EMAIL,
+            password=DEFAULT_PASSWORD, organization_token=DEFAULT_ORG_TOKEN
+        )
+
+    def tearDown(self):
+        """tearDown"""
+        self.server.stop()
+
+    def test_refresh_on_401(self):
+        """Test a call rejected with 401 is retried with a new token"""
+        token = self.app.rotate_token(DEFAULT_USER_ID)
+        self.assertNotEqual(self.client.token, token)
+        self.client.get_resource_type('shape', 1)
+        self.assertEqual(self.client.token, token)
+        self.assertEqual(self.app.calls[AUTHENTICATE], 2)
+        self.assertEqual(self.app.calls['GET v1/shapes/{id}'], 2)
+
+    def test_refresh_once(self):
+        """Test a stale token is only replaced once"""
+        stale = self.client.token
+        self.app.rotate_token(DEFAULT_USER_ID)
+        token = self.client.refresh_token(stale=stale)
+        self.assertNotEqual(token, stale)
+        self.assertEqual(self.client.refresh_token(stale=stale), token)
+        self.assertEqual(self.app.calls[AUTHENTICATE], 2)
+
+    def test_no_credentials(self):
+        """Test 401 is raised if the client can't re-authenticate"""
+        client = BESClient(
+            base_url=self.server.base_url, access_token=DEFAULT_TOKEN,
+            user_id=DEFAULT_USER_ID
+        )
+        self.app.rotate_token(DEFAULT_USER_ID)
+        with self.assertRaises(APIError) as conm:
+            client.get_resource_type('shape', 1)
+        self.assertEqual(conm.exception.status_code, 401)
+        with self.assertRaises(APIError):
+            client.refresh_token()
+
+
+class StressTests(unittest.TestCase):
+    """Test one client used by many threads"""
+
+    def test_shared_client(self):
+        """Test mixed calls from 64 threads while the token is rotated"""
+        # pylint: disable=too-many-locals
+        preview, full = make_portfolio(20, 20, start_id=100)
+        with FakeBESServer() as server:
+            server.app.seed(preview=preview, full=full)
+            client = BESClient(
+                base_url=server.base_url, email=DEFAULT_EMAIL,
+                password=DEFAULT_PASSWORD,
+                organization_token=DEFAULT_ORG_TOKEN,
+                session_per_thread=True
+            )
+            blocks = [block['id'] for bldg in full for block in bldg['blocks']]
+            calls = [
+                lambda rng: client.get_preview_building(
+                    rng.choice(preview)['building_id']
+                ),
+                lambda rng: client.get_building(rng.choice(full)['id']),
+                lambda rng: client.get_block(rng.choice(blocks)),
+                lambda rng: client.get_resource_type(
+                    'shape', rng.randint(1, 3)
+                ),
+                lambda rng: client.list_resource_types('use_types'),
+            ]
+            errors = []
+            done = []
+            rotated = threading.Event()
+
+            def run(seed):
+                """Make random calls"""
+                rng = random.Random(seed)
+                try:
+                    for _ in range(CALLS_PER_THREAD):
+                        rng.choice(calls)(rng)
+                        done.append(1)
+                except Exception as err:   # pylint: disable=broad-except
+                    errors.append(err)
+
+            def rotate():
+                """Expire the token while calls are being made"""
+                while len(done) < THREADS * CALLS_PER_THREAD // 2:
+                    if errors:
+                        return
+                    rotated.wait(0.01)
+                server.app.rotate_token(client.user_id)
+                rotated.set()
+
+            threads = [
+                threading.Thread(target=run, args=(seed,))
+                for seed in range(THREADS)
+            ]
+            threads.append(threading.Thread(target=rotate))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            client.transport.close()
+            self.assertEqual(errors, [])
+            self.assertTrue(rotated.is_set())
+            self.assertEqual(len(done), THREADS * CALLS_PER_THREAD)
+            # initial authentication and a single refresh
+            self.assertEqual(server.app.calls[AUTHENTICATE], 2)
+
+
+class PickleTests(unittest.TestCase):
+    """Test clients can be passed to other processes"""
+
+    def setUp(self):
+        """setUp"""
+        self.server = FakeBESServer().start()
+        self.limiter = RateLimiter(100, burst=10)
+        self.client = BESClient(
+            base_url=self.server.base_url, email=DEFAULT_EMAIL,
+            password=DEFAULT_PASSWORD, organization_token=DEFAULT_ORG_TOKEN,
+            timeout=5, hooks=[HistogramCollector()], cache=LRUCache(64),
+            transport=RateLimitedTransport(self.limiter, SessionTransport(4))
+        )
+
+    def tearDown(self):
+        """tearDown"""
+        self.server.stop()
+
+    def test_pickle(self):
+        """Test a pickled client is rebuilt without authenticating"""
+        self.client.get_resource_type('shape', 1)
+        self.limiter.acquire(10)
+        copied = pickle.loads(pickle.dumps(self.client))
+        for key in ('base_url', 'api_version', 'token', 'user_id',
+                    'timeout'):
+            self.assertEqual(getattr(copied, key), getattr(self.client, key))
+        self.assertEqual(copied.hooks, [])
+        self.assertEqual(len(copied.cache), 0)
+        self.assertEqual(copied.cache.maxsize, 64)
+        limiter = copied.transport.limiter
+        self.assertEqual((limiter.rate, limiter.burst), (100, 10))
+        self.assertEqual(limiter.tokens, 10)
+        self.assertEqual(copied.transport.transport.pool_maxsize, 4)
+        self.assertEqual(copied.transport.transport.sessions, [])
+        copied.get_resource_type('shape', 2)
+        self.assertEqual(self.server.app.calls[AUTHENTICATE], 1)
+
+    def test_pickle_credentials(self):
+        """Test credentials are only pickled if pickle_credentials is set"""
+        pickled = pickle.dumps(self.client)
+        for secret in (DEFAULT_EMAIL, DEFAULT_PASSWORD, DEFAULT_ORG_TOKEN):
+            self.assertNotIn(secret.encode('utf-8'), pickled)
+        copied = pickle.loads(pickled)
+        self.assertIsNone(copied.email)
+        self.server.app.rotate_token(DEFAULT_USER_ID)
+        with self.assertRaises(APIError):
+            copied.get_resource_type('shape', 2)
+        self.client.pickle_credentials = True
+        copied = pickle.loads(pickle.dumps(self.client))
+        self.assertEqual(copied.email, DEFAULT_EMAIL)
+        # the copy can refresh its token
+        copied.get_resource_type('shape', 3)
+        self.assertEqual(self.server.app.calls[AUTHENTICATE], 2)
+
+    @unittest.skipUnless(PY3, 'concurrent.futures is Python 3 only')
+    def test_process_pool(self):
+        """Test a client can be used by a process pool"""
+        self.client.get_resource_type('shape', 1)
+        executor = ProcessPoolExecutor(max_workers=2)
+        try:
+            ids = list(executor.map(
+                _get_shape, [self.client] * 3, [1, 2, 3]
+            ))
+        finally:
+            executor.shutdown()
+        self.assertEqual(ids, [1, 2, 3])
+        self.assertEqual(self.server.app.calls[AUTHENTICATE], 1)
+
+    def test_fork(self):
+        """Test sessions and the token lock are replaced after fork"""
+        transport = self.client.transport.transport
+        session = transport.session
+        lock = self.client._token_lock      # pylint: disable=protected-access
+        with mock.patch('os.getpid', return_value=-1):
+            with mock.patch.object(session, 'close') as mock_close:
+                self.assertIsNot(transport.session, session)
+                self.assertEqual(len(transport.sessions), 1)
+            self.assertFalse(mock_close.called)
+            self.client.refresh_token()
+        self.assertIsNot(
+            self.client._token_lock, lock   # pylint: disable=protected-access
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
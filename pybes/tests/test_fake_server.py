@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.testing.fake_server
+"""
+
+# Imports from Standard Library
+import json
+import sys
+import threading
+import unittest
+
+# Local Imports
+from pybes.pybes import APIError, BESClient, get_resource_types
+from pybes.testing.fake_server import (
+    DEFAULT_EMAIL,
+    DEFAULT_ORG_TOKEN,
+    DEFAULT_PASSWORD,
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESApp,
+    FakeBESServer,
+    constant,
+)
+from pybes.testing.synthetic import make_portfolio
+from pybes.utils.bes_constants import PREVIEW_SCORE_KEYS
+
+PY3 = sys.version_info[0] == 3
+if PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+# Tests
+class FakeBESAppTests(unittest.TestCase):
+    """Unit tests for FakeBESApp"""
+
+    def setUp(self):
+        """setUp"""
+        self.sleep = mock.MagicMock()
+        self.app = FakeBESApp(sleep=self.sleep, seed=1)
+        preview, full = make_portfolio(2, 2, rated=1.0)
+        self.app.seed(preview=preview, full=full)
+        self.params = {'token': DEFAULT_TOKEN}
+
+    def get(self, path, **params):
+        """GET path"""
+        params = dict(self.params, **params)
+        status, _, content = self.app.handle('GET', path, params)
+        return status, content
+
+    def test_template(self):
+        """Test endpoint templates"""
+        self.assertEqual(
+            self.app.template('get', '/api/v1/buildings/12/score'),
+            'GET v1/buildings/{id}/score'
+        )
+
+    def test_authentication(self):
+        """Test requests need a valid token"""
+        status, _ = self.get('/api/v1/buildings', token='wrong')
+        self.assertEqual(status, 401)
+        status, content = self.get('/api/v1/buildings')
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(content.decode('utf-8'))), 4)
+        self.assertEqual(self.app.calls['GET v1/buildings'], 2)
+
+    def test_latency(self):
+        """Test latency and per endpoint latency"""
+        self.app.latency = constant(0.5)
+        self.app.endpoint_latency = {'GET v1/buildings/{id}': constant(2)}
+        self.get('/api/v1/buildings')
+        self.sleep.assert_called_with(0.5)
+        self.get('/api/v1/buildings/3')
+        self.sleep.assert_called_with(2)
+        self.assertEqual(len(self.app.latencies), 2)
+
+    def test_rate_limit(self):
+        """Test requests over the rate limit get 429"""
+        self.app.rate_limit = 0.001
+        self.app.burst = 2
+        statuses = [self.get('/api/v1/buildings')[0] for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_error_injection(self):
+        """Test injected errors"""
+        self.app.endpoint_errors = {'GET v1/buildings/{id}/score': 1.0}
+        self.app.error_status = 503
+        self.assertEqual(self.get('/api/v1/buildings/3/score')[0], 503)
+        self.assertEqual(self.get('/api/v1/buildings/3')[0], 200)
+
+    def test_simulation_time(self):
+        """Test buildings are Running until simulation_time has passed"""
+        self.app.simulation_time = constant(3600)
+        self.app.handle('GET', '/api/v2/preview_buildings/1/simulate',
+                        self.params)
+        _, content = self.get('/api/v2/preview_buildings/1')
+        self.assertEqual(
+            json.loads(content.decode('utf-8'))['status!'], 'Running'
+        )
+        self.assertEqual(self.get('/api/v2/preview_buildings/1/report')[0],
+                         422)
+
+    def test_handler_errors(self):
+        """Test unexpected handler errors still get a response"""
+        for error, status in ((ValueError('bad int'), 400),
+                              (RuntimeError('bug'), 500)):
+            with mock.patch.object(self.app, '_buildings',
+                                   side_effect=error):
+                response_status, content = self.get('/api/v1/buildings')
+            self.assertEqual(response_status, status)
+            self.assertIn('error', json.loads(content.decode('utf-8')))
+        self.assertEqual(self.app.in_flight, 0)
+
+    def test_concurrent_writes(self):
+        """Test listing while other threads create and delete buildings"""
+        statuses = []
+        body = {'building': {
+            'building_name': 'b', 'year_completed': '2000',
+            'floor_area': 1000, 'street': '1 Main St', 'city': 'Boring',
+            'state': 'OR', 'postal_code': '97009', 'assessment_type': 'Real',
+            'use_type': 'Office', 'orientation': 'North/South',
+        }}
+
+        def churn():
+            """Create and delete preview buildings"""
+            for _ in range(50):
+                status, _, content = self.app.handle(
+                    'POST', '/api/v2/preview_buildings', self.params, body
+                )
+                building_id = json.loads(
+                    content.decode('utf-8')
+                )['building_id']
+                statuses.append(status)
+                statuses.append(self.app.handle(
+                    'DELETE',
+                    '/api/v2/preview_buildings/{}'.format(building_id),
+                    self.params
+                )[0])
+
+        def scan():
+            """List buildings and validate (scans objects)"""
+            for _ in range(50):
+                statuses.append(self.get('/api/v1/buildings')[0])
+                statuses.append(self.get('/api/v1/buildings/3/validate')[0])
+
+        threads = [
+            threading.Thread(target=target)
+            for target in (churn, scan) * 4
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(statuses), 800)
+        self.assertEqual(set(statuses), set([200, 201]))
+        body['building']['year_completed'] = 'unknown'
+        self.assertEqual(self.app.handle(
+            'POST', '/api/v2/preview_buildings', self.params, body
+        )[0], 400)
+
+
+class FakeBESServerTests(unittest.TestCase):
+    """Test BESClient against FakeBESServer"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start server"""
+        cls.server = FakeBESServer().start()
+        preview, full = make_portfolio(2, 2)
+        cls.server.app.seed(preview=preview, full=full)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop server"""
+        cls.server.stop()
+
+    def setUp(self):
+        """setUp"""
+        self.client = BESClient(
+            access_token=DEFAULT_TOKEN, user_id=DEFAULT_USER_ID,
+            base_url=self.server.base_url
+        )
+
+    def test_authenticate(self):
+        """Test authenticating"""
+        client = BESClient(
+            email=DEFAULT_EMAIL, password=DEFAULT_PASSWORD,
+            organization_token=DEFAULT_ORG_TOKEN,
+            base_url=self.server.base_url
+        )
+        self.assertEqual(client.token, DEFAULT_TOKEN)
+        self.assertEqual(client.user_id, DEFAULT_USER_ID)
+
+    def test_preview_workflow(self):
+        """Test the README preview building workflow"""
+        building = self.client.create_preview_building(
+            assessment_type='Test', building_name='Preview Example 1',
+            year_completed='1990', floor_area='100000', street='123 Street',
+            city='Boring', state='OR', postal_code='97009',
+            use_type='Office', number_floors=5, orientation='North/South'
+        )
+        building_id = building['building_id']
+        details = self.client.get_preview_building(building_id)
+        block_id = details['blocks'][0]['block_id']
+        self.client.update_preview_building(
+            building_id, block_id, extras={'floor:floor_type': 'wood framed'}
+        )
+        self.assertEqual(
+            self.client.validate_preview_building(building_id), b'valid'
+        )
+        self.client.simulate_preview_building(building_id)
+        report = self.client.get_preview_building(
+            building_id, report_type='pdf'
+        )
+        self.assertTrue(set(PREVIEW_SCORE_KEYS).issubset(report))
+        self.client.delete_preview_building(building_id)
+        with self.assertRaises(APIError) as conm:
+            self.client.get_preview_building(building_id)
+        self.assertEqual(conm.exception.status_code, 404)
+
+    def test_v1_workflow(self):
+        """Test creating and simulating a v1 building"""
+        building = self.client.create_building(
+            1, 'test', '1984', '1234 1st St', 'Boring', 'OR', 97009, 100
+        )
+        building_id = building['id']
+        with self.assertRaises(APIError) as conm:
+            self.client.validate_building(building_id)
+        block = self.client.create_block(
+            building_id, 1, 'block', 12, 9, True, 1, 0, '0,0',
+            '0,0 10,0 10,10 0,10', 10, 10
+        )
+        self.assertEqual(
+            self.client.get_building_blocks(building_id), [block]
+        )
+        heater = self.client.create_resource(
+            'water_heater', building_id, fuel_type_id=1
+        )
+        self.client.attach_block_resource(
+            'water_heater', block['id'], heater['id']
+        )
+        self.client.update_resource('water_heater', heater['id'], name='wh')
+        self.assertEqual(
+            self.client.get_resource('water_heater', heater['id'])['name'],
+            'wh'
+        )
+        self.assertTrue(self.client.validate_building(building_id))
+        with self.assertRaises(APIError) as conm:
+            self.client.get_building_score(building_id)
+        self.assertEqual(conm.exception.status_code, 404)
+        self.client.simulate_building(building_id)
+        self.assertIn('score', self.client.get_building_score(building_id))
+        csv = self.client.manage_buildings(building_id)
+        self.assertTrue(csv.startswith(b'building_id,name,status'))
+        self.client.delete_building(building_id)
+
+    def test_resource_types(self):
+        """Test resource types"""
+        resource_types = get_resource_types(self.client)
+        self.assertIn('rated', resource_types['status_types'])
+        self.assertIn('office', resource_types['use_types'])
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.limiter
+"""
+
+# Imports from Standard Library
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+# Local Imports
+from pybes.limiter import AdaptiveLimiter, RateLimiter
+from pybes.pybes import APIError, BESClient
+from pybes.testing.fake_server import (
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESServer,
+)
+from pybes.testing.synthetic import make_portfolio
+from pybes.transports import ConcurrencyLimitedTransport, RateLimitedTransport
+from pybes.utils.bes_batch import BatchSession
+from pybes.utils.bes_full import get_bes_buildings
+from pybes.utils.bes_queue import WorkQueue, enqueue_buildings, report_handler
+
+PY3 = sys.version_info[0] == 3
+if PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+# Helper Functions & Classes
+class Clock(object):
+    """Fake clock, advanced by sleep"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        """Advance clock"""
+        self.now += seconds
+
+
+# Tests
+class RateLimiterTests(unittest.TestCase):
+    """Unit tests for RateLimiter"""
+
+    def setUp(self):
+        """setUp"""
+        self.clock = Clock()
+        self.limiter = RateLimiter(
+            2, burst=2, clock=self.clock, sleep=self.clock.sleep
+        )
+
+    def test_acquire(self):
+        """Test callers wait once the burst is used"""
+        self.assertEqual(self.limiter.acquire(), 0)
+        self.assertEqual(self.limiter.acquire(), 0)
+        self.assertEqual(self.limiter.acquire(), 0.5)
+        self.assertEqual(self.clock.now, 0.5)
+        for _ in range(4):
+            self.limiter.acquire()
+        self.assertEqual(self.clock.now, 2.5)
+        self.assertEqual(self.limiter.waited, 2.5)
+
+    def test_try_acquire(self):
+        """Test try_acquire does not wait"""
+        self.assertTrue(self.limiter.try_acquire())
+        self.assertTrue(self.limiter.try_acquire())
+        self.assertFalse(self.limiter.try_acquire())
+        self.clock.now = 0.5
+        self.assertTrue(self.limiter.try_acquire())
+
+    def test_invalid_rate(self):
+        """Test rate must be positive"""
+        with self.assertRaises(ValueError):
+            RateLimiter(0)
+
+    def test_transport(self):
+        """Test RateLimitedTransport waits for limiter"""
+        transport = mock.MagicMock()
+        limited = RateLimitedTransport(self.limiter, transport=transport)
+        for _ in range(3):
+            limited.request('get', 'url', timeout=1)
+        transport.request.assert_called_with('get', 'url', timeout=1)
+        self.assertEqual(self.clock.now, 0.5)
+
+
+class AdaptiveLimiterTests(unittest.TestCase):
+    """Unit tests for AdaptiveLimiter"""
+
+    def setUp(self):
+        """setUp"""
+        self.clock = Clock()
+        self.limiter = AdaptiveLimiter(
+            initial=2, maximum=4, window=5, clock=self.clock
+        )
+
+    def call(self, status=200, latency=0.1):
+        """Make a call taking all the permits"""
+        permits = [self.limiter.acquire() for _ in range(self.limiter.limit)]
+        self.clock.sleep(latency)
+        for permit in permits:
+            self.limiter.release(permit, status=status)
+
+    def grow(self):
+        """Make calls until the limit reaches maximum"""
+        for _ in range(10):
+            self.call()
+            if self.limiter.limit == self.limiter.maximum:
+                return
+        self.fail('limit not raised to maximum')
+
+    def test_increase(self):
+        """Test limit rises by up to 1 a round trip, up to maximum"""
+        self.call()
+        self.assertEqual(self.limiter.limit, 3)
+        self.grow()
+        for _ in range(3):
+            self.call()
+        self.assertEqual(self.limiter.limit, 4)
+        self.assertEqual(self.limiter.increases, 2)
+
+    def test_unsaturated(self):
+        """Test limit isn't raised while it isn't used"""
+        self.grow()
+        self.limiter.maximum = 8
+        for _ in range(10):
+            self.limiter.release(self.limiter.acquire(), status=200)
+        self.assertEqual(self.limiter.limit, 4)
+
+    def test_decrease(self):
+        """Test errors halve limit, once for calls already in flight"""
+        self.grow()
+        permits = [self.limiter.acquire() for _ in range(4)]
+        for permit in permits:
+            self.limiter.release(permit, status=429)
+        self.assertEqual(self.limiter.limit, 2)
+        self.limiter.release(self.limiter.acquire(), status=503)
+        self.assertEqual(self.limiter.limit, 1)
+        self.limiter.release(self.limiter.acquire(), error=True)
+        self.assertEqual(self.limiter.limit, 1)
+        self.assertEqual(self.limiter.decreases, 3)
+        self.limiter.release(self.limiter.acquire(), status=404)
+        self.assertEqual(self.limiter.decreases, 3)
+
+    def test_latency(self):
+        """Test limit is cut when p95 latency rises"""
+        for _ in range(3):
+            self.call(latency=0.1)
+        self.assertEqual(self.limiter.baseline, 0.1)
+        limit = self.limiter.limit
+        self.call(latency=0.5)
+        self.assertEqual(self.limiter.limit, limit // 2)
+        self.assertEqual(self.limiter.decreases, 1)
+
+    def test_baseline_decay(self):
+        """Test the baseline follows a lasting rise in latency"""
+        limiter = self.limiter = AdaptiveLimiter(
+            initial=2, maximum=4, window=5, baseline_decay=0.1,
+            clock=self.clock
+        )
+        for _ in range(3):
+            self.call(latency=0.1)
+        for _ in range(10):
+            self.call(latency=0.15)
+        self.assertGreater(limiter.baseline, 0.12)
+        self.assertLess(limiter.baseline, 0.15)
+        self.assertEqual(limiter.decreases, 0)
+        for _ in range(50):
+            self.call(latency=0.5)
+        decreases = limiter.decreases
+        self.assertGreater(decreases, 0)
+        for _ in range(20):
+            self.call(latency=0.5)
+        self.assertEqual(limiter.decreases, decreases)
+        self.assertGreater(limiter.baseline, 0.25)
+        # a lower latency is taken at once
+        for _ in range(10):
+            self.call(latency=0.1)
+        self.assertAlmostEqual(limiter.baseline, 0.1)
+
+    def test_wait(self):
+        """Test acquire waits while limit calls are in flight"""
+        permits = [self.limiter.acquire(), self.limiter.acquire()]
+        acquired = threading.Event()
+
+        def acquire():
+            """Acquire in a thread"""
+            self.limiter.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        self.limiter.release(permits[0], status=200)
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        self.assertEqual(self.limiter.in_flight, 2)
+
+    def test_invalid(self):
+        """Test limits are checked"""
+        with self.assertRaises(ValueError):
+            AdaptiveLimiter(initial=8, maximum=4)
+        with self.assertRaises(ValueError):
+            AdaptiveLimiter(decrease=1)
+        with self.assertRaises(ValueError):
+            AdaptiveLimiter(baseline_decay=2)
+
+    def test_prometheus(self):
+        """Test limit is exported"""
+        self.call()
+        text = self.limiter.to_prometheus()
+        self.assertIn('# TYPE pybes_concurrency_limit gauge', text)
+        self.assertIn('pybes_concurrency_limit 3\n', text)
+        self.assertIn('pybes_concurrency_increases_total 1\n', text)
+
+    def test_transport(self):
+        """Test ConcurrencyLimitedTransport reports outcomes"""
+        transport = mock.MagicMock()
+        transport.request.return_value.status_code = 503
+        limited = ConcurrencyLimitedTransport(self.limiter, transport)
+        limited.request('get', 'url', timeout=1)
+        transport.request.assert_called_with('get', 'url', timeout=1)
+        self.assertEqual(self.limiter.limit, 1)
+        transport.request.side_effect = IOError('reset')
+        with self.assertRaises(IOError):
+            limited.request('get', 'url')
+        self.assertEqual(self.limiter.in_flight, 0)
+
+    def test_throttled(self):
+        """Test limit is cut when the server throttles"""
+        limiter = AdaptiveLimiter(initial=8, maximum=16)
+        errors = []
+        with FakeBESServer(rate_limit=5, burst=5) as server:
+            client = BESClient(
+                base_url=server.base_url, access_token=DEFAULT_TOKEN,
+                user_id=DEFAULT_USER_ID,
+                transport=ConcurrencyLimitedTransport(limiter)
+            )
+
+            def call():
+                """Make calls"""
+                for _ in range(4):
+                    try:
+                        client.get_resource_type('shape', 1)
+                    except APIError as err:
+                        errors.append(err.status_code)
+
+            threads = [threading.Thread(target=call) for _ in range(16)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertIn(429, errors)
+        self.assertLess(limiter.limit, 8)
+        self.assertEqual(limiter.in_flight, 0)
+
+
+class SharedLimiterTests(unittest.TestCase):
+    """Test the bulk helpers share the client's limiter"""
+
+    def setUp(self):
+        """setUp"""
+        self.server = FakeBESServer().start()
+        preview, self.full = make_portfolio(2, 2, start_id=100)
+        self.server.app.seed(preview=preview, full=self.full)
+        self.limiter = AdaptiveLimiter(initial=4, maximum=8)
+        self.bes_kwargs = {
+            'base_url': self.server.base_url,
+            'access_token': DEFAULT_TOKEN,
+            'user_id': DEFAULT_USER_ID,
+            'transport': ConcurrencyLimitedTransport(self.limiter),
+        }
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """tearDown"""
+        shutil.rmtree(self.tmpdir)
+        self.server.stop()
+
+    def assert_limited(self, run):
+        """Test every api call made by run() takes a permit"""
+        calls = sum(self.server.app.calls.values())
+        with mock.patch.object(
+                self.limiter, 'acquire', wraps=self.limiter.acquire) as acq:
+            run()
+        calls = sum(self.server.app.calls.values()) - calls
+        self.assertGreater(calls, 0)
+        self.assertEqual(acq.call_count, calls)
+        self.assertEqual(self.limiter.in_flight, 0)
+
+    def test_get_bes_buildings(self):
+        """Test get_bes_buildings"""
+        self.assert_limited(lambda: list(get_bes_buildings(
+            [], max_workers=4, **self.bes_kwargs
+        )))
+
+    def test_batch_session(self):
+        """Test BatchSession"""
+        def run():
+            """Update blocks"""
+            with BatchSession(BESClient(**self.bes_kwargs)) as batch:
+                for bldg in self.full:
+                    batch.update_block(
+                        bldg['blocks'][0]['id'], bldg['id'], name='Block'
+                    )
+        self.assert_limited(run)
+
+    def test_work_queue(self):
+        """Test WorkQueue with report_handler"""
+        queue = WorkQueue(os.path.join(self.tmpdir, 'queue.db'))
+
+        def run():
+            """Enqueue and fetch reports"""
+            enqueue_buildings(queue, BESClient(**self.bes_kwargs))
+            queue.work({'report': report_handler(self.bes_kwargs)})
+        try:
+            self.assert_limited(run)
+            self.assertEqual(len(list(queue.results('report'))), 4)
+        finally:
+            queue.close()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.metrics
+"""
+
+# Imports from Standard Library
+import sys
+import unittest
+
+# Local Imports
+from pybes.metrics import (
+    AdaptiveTimeouts,
+    HistogramCollector,
+    OpenTelemetryCollector,
+)
+from pybes.pybes import CONNECT_TIMEOUT, TIMEOUT_PROFILE, RequestEvent
+
+PY3 = sys.version_info[0] == 3
+if PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+# Helper Functions & Classes
+def make_event(latency, endpoint='v2/preview_buildings/{id}', status=200,
+               method='GET'):
+    """RequestEvent"""
+    return RequestEvent(
+        endpoint=endpoint, method=method, status=status, bytes=100,
+        latency=latency, retries=1, start=1000.0
+    )
+
+
+# Tests
+class HistogramCollectorTests(unittest.TestCase):
+    """Unit tests for HistogramCollector"""
+
+    def setUp(self):
+        """setUp"""
+        self.histogram = HistogramCollector(buckets=(0.1, 0.5, 1.0))
+        for latency in (0.05, 0.05, 0.3, 0.7):
+            self.histogram(make_event(latency))
+        self.histogram(make_event(2.0, endpoint='v1/buildings'))
+        self.histogram(make_event(0.05, status=None))
+
+    def test_summary(self):
+        """Test summary"""
+        summary = self.histogram.summary()
+        self.assertEqual(len(summary), 3)
+        self.assertEqual(summary[0]['endpoint'], 'v1/buildings')
+        self.assertEqual(summary[1]['endpoint'], 'v2/preview_buildings/{id}')
+        self.assertEqual(summary[1]['count'], 4)
+        self.assertEqual(summary[1]['bytes'], 400)
+        self.assertEqual(summary[1]['retries'], 4)
+        self.assertAlmostEqual(summary[1]['mean_latency'], 0.275)
+
+    def test_percentile(self):
+        """Test percentile"""
+        self.assertEqual(self.histogram.percentile(50), 0.1)
+        self.assertEqual(self.histogram.percentile(90), float('inf'))
+        self.assertEqual(
+            self.histogram.percentile(
+                99, endpoint='v2/preview_buildings/{id}'
+            ),
+            1.0
+        )
+        self.assertIsNone(self.histogram.percentile(50, method='PUT'))
+        self.histogram.reset()
+        self.assertIsNone(self.histogram.percentile(50))
+
+    def test_to_prometheus(self):
+        """Test Prometheus text format"""
+        text = self.histogram.to_prometheus()
+        labels = (
+            'endpoint="v2/preview_buildings/{id}",method="GET",status="200"'
+        )
+        name = 'pybes_request_duration_seconds'
+        for line in (
+                '# TYPE {} histogram'.format(name),
+                '{}_bucket{{{},le="0.1"}} 2'.format(name, labels),
+                '{}_bucket{{{},le="+Inf"}} 4'.format(name, labels),
+                '{}_count{{{}}} 4'.format(name, labels),
+                'pybes_response_bytes_total{{{}}} 400'.format(labels),
+                'pybes_retries_total{{{}}} 4'.format(labels)):
+            self.assertIn(line, text.splitlines())
+        self.assertIn('status="error"', text)
+
+
+class AdaptiveTimeoutsTests(unittest.TestCase):
+    """Unit tests for AdaptiveTimeouts"""
+
+    def setUp(self):
+        """setUp"""
+        self.histogram = HistogramCollector()
+        self.now = 0.0
+        self.timeouts = AdaptiveTimeouts(
+            self.histogram, percentile=95, min_count=10, maximum=20,
+            fallback=TIMEOUT_PROFILE, clock=lambda: self.now
+        )
+
+    def test_timeouts(self):
+        """Test read timeout is a multiple of percentile latency"""
+        endpoint = 'v1/buildings/{id}/report'
+        self.assertEqual(
+            self.timeouts('GET', endpoint), TIMEOUT_PROFILE[endpoint]
+        )
+        self.assertIsNone(self.timeouts('GET', 'v1/blocks/{id}'))
+        for _ in range(10):
+            self.histogram(make_event(0.4, endpoint=endpoint))
+        # cached for ttl
+        self.assertEqual(
+            self.timeouts('GET', endpoint), TIMEOUT_PROFILE[endpoint]
+        )
+        self.now = 10
+        self.assertEqual(
+            self.timeouts('GET', endpoint), (CONNECT_TIMEOUT, 1.5)
+        )
+        self.assertEqual(self.histogram.count(endpoint, 'GET'), 10)
+        self.assertEqual(self.histogram.count(endpoint, 'PUT'), 0)
+        for _ in range(10):
+            self.histogram(make_event(0.001))
+            self.histogram(make_event(30))
+        self.now = 20
+        self.assertEqual(
+            self.timeouts('GET', 'v2/preview_buildings/{id}'),
+            (CONNECT_TIMEOUT, 20)
+        )
+        self.histogram.reset()
+        for _ in range(10):
+            self.histogram(make_event(0.001))
+        self.now = 30
+        self.assertEqual(
+            self.timeouts('GET', 'v2/preview_buildings/{id}'),
+            (CONNECT_TIMEOUT, 1.0)
+        )
+
+
+class OpenTelemetryCollectorTests(unittest.TestCase):
+    """Unit tests for OpenTelemetryCollector"""
+
+    def test_span(self):
+        """Test events are recorded as spans"""
+        tracer = mock.MagicMock()
+        collector = OpenTelemetryCollector(tracer=tracer)
+        collector(make_event(0.5))
+        tracer.start_span.assert_called_with(
+            'GET v2/preview_buildings/{id}', start_time=int(1000 * 1e9),
+            attributes={
+                'http.method': 'GET',
+                'http.route': 'v2/preview_buildings/{id}',
+                'http.response_content_length': 100,
+                'pybes.retries': 1,
+                'http.status_code': 200,
+            }
+        )
+        tracer.start_span.return_value.end.assert_called_with(
+            end_time=int(1000.5 * 1e9)
+        )
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.pool
+"""
+
+# Imports from Standard Library
+import unittest
+
+# Local Imports
+from pybes.pybes import APIError, BESError
+from pybes.pool import BESClientPool
+from pybes.testing.fake_server import (
+    DEFAULT_ORG_TOKEN,
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESServer,
+)
+from pybes.testing.synthetic import make_portfolio
+
+
+# Tests
+class BESClientPoolTests(unittest.TestCase):
+    """Test BESClientPool against FakeBESServer with two accounts"""
+
+    def setUp(self):
+        """setUp"""
+        self.server = FakeBESServer().start()
+        app = self.server.app
+        self.other_id, _ = app.add_user(
+            'other@example.org', 'Passw0rd!', DEFAULT_ORG_TOKEN,
+            token='other'
+        )
+        preview, full = make_portfolio(2, 2, start_id=100)
+        app.seed(preview=preview, full=full)
+        preview, full = make_portfolio(2, 2, start_id=200)
+        app.seed(preview=preview, full=full, owner=self.other_id)
+        self.pool = BESClientPool.from_credentials(
+            [
+                {'access_token': DEFAULT_TOKEN, 'user_id': DEFAULT_USER_ID},
+                {'email': 'other@example.org', 'password': 'Passw0rd!',
+                 'organization_token': DEFAULT_ORG_TOKEN},
+            ],
+            base_url=self.server.base_url, rate_limit=1000
+        )
+
+    def tearDown(self):
+        """tearDown"""
+        self.server.stop()
+
+    def test_routing(self):
+        """Test calls go to the account owning the building"""
+        self.assertEqual(len(self.pool), 2)
+        self.assertEqual(self.pool.get_building(100)['id'], 100)
+        self.assertEqual(self.pool.get_building(id=202)['id'], 202)
+        self.assertEqual(
+            self.pool.client_for(202).user_id, self.other_id
+        )
+        self.assertEqual(
+            [member.calls for member in self.pool.members], [2, 2]
+        )
+        self.assertEqual(len(self.pool.owners), 8)
+        with self.assertRaises(BESError):
+            self.pool.get_building(999)
+        with self.assertRaises(AttributeError):
+            self.pool.get_block(1)
+
+    def test_list(self):
+        """Test listings combine every account"""
+        self.assertEqual(len(self.pool.list_preview_buildings()), 4)
+        self.assertEqual(len(self.pool.owners), 4)
+
+    def test_create(self):
+        """Test new buildings are spread over accounts and tracked"""
+        ids = []
+        for idx in range(4):
+            building = self.pool.create_building(
+                1, 'test {}'.format(idx), '1984', '1234 1st St', 'Boring',
+                'OR', 97009, 100
+            )
+            ids.append(building['id'])
+        self.assertEqual(
+            [member.calls for member in self.pool.members], [2, 2]
+        )
+        for building_id in ids:
+            self.assertEqual(
+                self.pool.get_building(building_id)['id'], building_id
+            )
+        clone = self.pool.duplicate_preview_building(201)
+        self.assertIs(
+            self.pool.owners[clone['building_id']], self.pool.owners[201]
+        )
+
+    def test_map(self):
+        """Test map uses the owning client and returns errors"""
+        def score(client, building_id):
+            """Get score"""
+            return client.get_building_score(building_id)['score']
+        results = self.pool.map(score, [102, 103, 202, 203, 100])
+        self.assertTrue(all(
+            isinstance(result, dict) for result in results[:4]
+        ))
+        # preview buildings have no v1 score
+        self.assertIsInstance(results[4], APIError)
+        self.assertEqual(
+            self.server.app.calls['GET v1/buildings/{id}/score'], 5
+        )
+
+    def test_map_unowned(self):
+        """Test unowned ids get an error in their slot, after one listing"""
+        def get_id(client, building_id):
+            """Get building id"""
+            return client.get_building(building_id)['id']
+        results = self.pool.map(get_id, [102, 998, 202, 999, 'x'])
+        self.assertEqual([results[0], results[2]], [102, 202])
+        self.assertIsInstance(results[1], BESError)
+        self.assertEqual(results[1].building_id, 998)
+        self.assertIsInstance(results[3], BESError)
+        self.assertIsInstance(results[4], ValueError)
+        # one discover, listing each account once
+        self.assertEqual(self.server.app.calls['GET v1/buildings'], 2)
@@ -19,7 +19,7 @@ import requests
 
 # Local Imports
 import pybes.pybes as pybes
-from pybes.pybes import TIMEOUT
+from pybes.pybes import CONNECT_TIMEOUT, TIMEOUT, TIMEOUT_PROFILE
 
 PY3 = sys.version_info[0] == 3
 if PY3:
@@ -29,6 +29,7 @@ else:
 
 API_VERSION = '2'
 BASE_URL = 'https://api.labworks.org/api'
+DEFAULT_TIMEOUT = (CONNECT_TIMEOUT, TIMEOUT)
 
 # Constants
 TEST_BUILDING = {
@@ -364,7 +365,7 @@ class TestAPIGenerics(unittest.TestCase):
         mock_response = mock.MagicMock()
         mock_requests.get.return_value = mock_response
         expected = {
-            'timeout': TIMEOUT,
+            'timeout': DEFAULT_TIMEOUT,
             'params': {'token': self.token, 'a': 1}
         }
 
@@ -377,7 +378,7 @@ class TestAPIGenerics(unittest.TestCase):
         mock_response = mock.MagicMock()
         mock_requests.post.return_value = mock_response
         expected = {
-            'timeout': TIMEOUT,
+            'timeout': DEFAULT_TIMEOUT,
             'files': 'files',
             'json': {'token': self.token, 'a': 1}
         }
@@ -392,7 +393,7 @@ class TestAPIGenerics(unittest.TestCase):
         mock_requests.put.return_value = mock_response
 
         expected = {
-            'timeout': TIMEOUT,
+            'timeout': DEFAULT_TIMEOUT,
             'files': 'files',
             'json': {'token': self.token, 'a': 1}
         }
@@ -401,7 +402,7 @@ class TestAPIGenerics(unittest.TestCase):
         self.assertEqual(mock_response, result)
 
         expected = {
-            'timeout': TIMEOUT,
+            'timeout': DEFAULT_TIMEOUT,
             'params': {'token': self.token, 'a': 1}
         }
         self.client._put(self.endpoint, use_json=False, a=1)
@@ -412,7 +413,7 @@ class TestAPIGenerics(unittest.TestCase):
         mock_response = mock.MagicMock()
         mock_requests.patch.return_value = mock_response
         expected = {
-            'timeout': TIMEOUT,
+            'timeout': DEFAULT_TIMEOUT,
             'files': 'files',
             'json': {'token': self.token, 'a': 1}
         }
@@ -426,7 +427,7 @@ class TestAPIGenerics(unittest.TestCase):
         mock_response = mock.MagicMock()
         mock_requests.delete.return_value = mock_response
         expected = {
-            'timeout': TIMEOUT,
+            'timeout': DEFAULT_TIMEOUT,
             'params': {'token': self.token}
         }
         url = self.url + '/1'
@@ -435,6 +436,65 @@ class TestAPIGenerics(unittest.TestCase):
         mock_requests.delete.assert_called_with(url, **expected)
         self.assertEqual(mock_response, result)
 
+    def test_hooks(self, mock_requests):
+        """Test hooks are called with a RequestEvent"""
+        mock_response = mock.MagicMock()
+        mock_response.status_code = 200
+        mock_response.content = b'{"score": 1}'
+        mock_requests.get.return_value = mock_response
+        hook = mock.MagicMock()
+        failing_hook = mock.MagicMock(side_effect=ValueError)
+        self.client.hooks = [failing_hook, hook]
+
+        self.client._get('buildings', id=1, action='score', api_version=1)
+        event = hook.call_args[0][0]
+        self.assertIsInstance(event, pybes.RequestEvent)
+        self.assertEqual(event.endpoint, 'v1/buildings/{id}/score')
+        self.assertEqual(event.method, 'GET')
+        self.assertEqual(event.status, 200)
+        self.assertEqual(event.bytes, 12)
+        self.assertEqual(event.retries, 0)
+        self.assertTrue(failing_hook.called)
+
+        mock_requests.delete.side_effect = requests.ConnectionError
+        with self.assertRaises(requests.ConnectionError):
+            self.client._delete(self.endpoint, id=1)
+        event = hook.call_args[0][0]
+        self.assertEqual(event.endpoint, 'v2/endpoint/{id}')
+        self.assertIsNone(event.status)
+
+    def test_timeouts(self, mock_requests):
+        """Test timeouts are overridden by endpoint"""
+        self.client.timeouts = dict(
+            TIMEOUT_PROFILE, **{'DELETE v2/endpoint/{id}': 1}
+        )
+        self.client._get('buildings', id=1, action='report', api_version=1)
+        self.assertEqual(
+            mock_requests.get.call_args[1]['timeout'], (CONNECT_TIMEOUT, 60)
+        )
+        self.client._get('buildings', id=1, api_version=1)
+        self.assertEqual(
+            mock_requests.get.call_args[1]['timeout'], (CONNECT_TIMEOUT, 5)
+        )
+        self.client._get('preview_buildings', id=1)
+        self.assertEqual(
+            mock_requests.get.call_args[1]['timeout'], (CONNECT_TIMEOUT, 5)
+        )
+        self.client._put('buildings', id=1, api_version=1)
+        self.assertEqual(
+            mock_requests.put.call_args[1]['timeout'], DEFAULT_TIMEOUT
+        )
+        self.client._get('buildings', id=1, action='score', api_version=1)
+        self.assertEqual(
+            mock_requests.get.call_args[1]['timeout'], DEFAULT_TIMEOUT
+        )
+        self.client._delete(self.endpoint, id=1)
+        self.assertEqual(mock_requests.delete.call_args[1]['timeout'], 1)
+        self.client.timeouts = mock.MagicMock(return_value=(1, 2))
+        self.client._get('shapes', id=1, api_version=1)
+        self.client.timeouts.assert_called_with('GET', 'v1/shapes/{id}')
+        self.assertEqual(mock_requests.get.call_args[1]['timeout'], (1, 2))
+
 
 class TestAPIGenericsNoCall(unittest.TestCase):
     """Test generic api client functionality that doesn't hit api"""
@@ -604,14 +664,14 @@ class TestPreviewBuildingAPI(unittest.TestCase):
         }
         self.client.create_preview_building(**building)
         mock_requests.post.assert_called_with(
-            self.url, json=expected, timeout=TIMEOUT
+            self.url, json=expected, timeout=DEFAULT_TIMEOUT
         )
 
     def test_delete_preview_building(self, mock_requests):
         """Test delete_preview_building call."""
         self.client.delete_preview_building(self.id)
         mock_requests.delete.assert_called_with(
-            self.id_url, params={'token': self.token}, timeout=TIMEOUT
+            self.id_url, params={'token': self.token}, timeout=DEFAULT_TIMEOUT
         )
 
     def test_duplicate_preview_building(self, mock_requests):
@@ -619,7 +679,7 @@ class TestPreviewBuildingAPI(unittest.TestCase):
         self.client.duplicate_preview_building(self.id)
         url = self.id_url + '/duplicate'
         mock_requests.get.assert_called_with(
-            url, params={'token': self.token}, timeout=TIMEOUT
+            url, params={'token': self.token}, timeout=DEFAULT_TIMEOUT
         )
 
     def test_get_preview_building(self, mock_requests):
@@ -629,7 +689,7 @@ class TestPreviewBuildingAPI(unittest.TestCase):
         # without report type
         result = self.client.get_preview_building(self.id)
         mock_requests.get.assert_called_with(
-            self.id_url, params={'token': self.token}, timeout=TIMEOUT
+            self.id_url, params={'token': self.token}, timeout=DEFAULT_TIMEOUT
         )
         self.assertEqual(self.json, result)
 
@@ -639,7 +699,7 @@ class TestPreviewBuildingAPI(unittest.TestCase):
         )
         url = self.id_url + '/simple'
         mock_requests.get.assert_called_with(
-            url, params={'token': self.token}, timeout=TIMEOUT
+            url, params={'token': self.token}, timeout=DEFAULT_TIMEOUT
         )
         self.assertEqual(self.json, result)
 
@@ -649,7 +709,7 @@ class TestPreviewBuildingAPI(unittest.TestCase):
         )
         url = self.id_url + '/report'
         mock_requests.get.assert_called_with(
-            url, params={'token': self.token}, timeout=TIMEOUT
+            url, params={'token': self.token}, timeout=DEFAULT_TIMEOUT
         )
         self.assertEqual(self.json, result)
 
@@ -663,7 +723,7 @@ class TestPreviewBuildingAPI(unittest.TestCase):
         """Test list_preview_building call."""
         self.client.list_preview_buildings()
         mock_requests.get.assert_called_with(
-            self.url, params={'token': self.token}, timeout=TIMEOUT
+            self.url, params={'token': self.token}, timeout=DEFAULT_TIMEOUT
         )
 
     def test_simulate_preview_building(self, mock_requests):
@@ -671,7 +731,7 @@ class TestPreviewBuildingAPI(unittest.TestCase):
         self.client.simulate_preview_building(self.id)
         url = self.id_url + '/simulate'
         mock_requests.get.assert_called_with(
-            url, params={'token': self.token}, timeout=TIMEOUT
+            url, params={'token': self.token}, timeout=DEFAULT_TIMEOUT
         )
 
     def test_update_preview_building(self, mock_requests):
@@ -697,7 +757,7 @@ class TestPreviewBuildingAPI(unittest.TestCase):
         }
         self.client.update_preview_building(self.id, block_id, **building)
         mock_requests.put.assert_called_with(
-            self.id_url, json=expected, timeout=TIMEOUT
+            self.id_url, json=expected, timeout=DEFAULT_TIMEOUT
         )
 
     def test_validate_preview_building(self, mock_requests):
@@ -705,7 +765,7 @@ class TestPreviewBuildingAPI(unittest.TestCase):
         self.client.validate_preview_building(self.id)
         url = self.id_url + '/validate'
         mock_requests.get.assert_called_with(
-            url, params={'token': self.token}, timeout=TIMEOUT
+            url, params={'token': self.token}, timeout=DEFAULT_TIMEOUT
         )
 
 
@@ -740,7 +800,7 @@ class TestHESUserAPI(unittest.TestCase):
         mock_requests.get.return_value = self.mock_response
         result = self.client.get_user(self.id)
         mock_requests.get.assert_called_with(
-            self.id_url, params={'token': self.token}, timeout=TIMEOUT
+            self.id_url, params={'token': self.token}, timeout=DEFAULT_TIMEOUT
         )
         self.assertEqual(self.json, result)
 
@@ -759,7 +819,7 @@ class TestHESUserAPI(unittest.TestCase):
         expected['token'] = self.token
         result = self.client.update_user(self.id, **params)
         mock_requests.put.assert_called_with(
-            self.id_url, json=expected, timeout=TIMEOUT
+            self.id_url, json=expected, timeout=DEFAULT_TIMEOUT
         )
         self.assertIsNone(result)
 
@@ -794,7 +854,7 @@ class TestHESUserAPI(unittest.TestCase):
             self.first, self.last, BASE_URL
         )
         mock_requests.post.assert_called_with(
-            self.url, json=expected, timeout=TIMEOUT
+            self.url, json=expected, timeout=DEFAULT_TIMEOUT
         )
         self.assertEqual((self.id, self.org_id, self.role_id), result)
 
@@ -852,20 +912,20 @@ class TestBlockAPI(unittest.TestCase):
             has_drop_ceiling=False
         )
         mock_requests.post.assert_called_with(
-            url, json=expected, timeout=TIMEOUT
+            url, json=expected, timeout=DEFAULT_TIMEOUT
         )
         self.assertEqual(result, self.json)
 
     def test_delete_block(self, mock_requests):
         """Test delete_block method"""
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         self.client.delete_block(self.id)
         mock_requests.delete.assert_called_with(self.id_url, **expected)
 
     def test_get_block(self, mock_requests):
         """Test get_block method"""
         mock_requests.get.return_value = self.mock_response
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         result = self.client.get_block(self.id)
         mock_requests.get.assert_called_with(self.id_url, **expected)
         self.assertEqual(result, self.json)
@@ -874,7 +934,7 @@ class TestBlockAPI(unittest.TestCase):
         """Test update_block method"""
         expected = {
             'json': {'token': 'token', 'shape_id': 2, 'name': 'test'},
-            'timeout': TIMEOUT
+            'timeout': DEFAULT_TIMEOUT
         }
         self.client.update_block(self.id, 2, name='test')
         mock_requests.put.assert_called_with(self.id_url, **expected)
@@ -895,13 +955,13 @@ class TestBlockAPI(unittest.TestCase):
         )
         params.update({'name': name})
         mock_requests.post.assert_called_with(
-            url, json=params, timeout=TIMEOUT
+            url, json=params, timeout=DEFAULT_TIMEOUT
         )
         self.assertEqual(result, self.json)
 
     def test_delete_block_resource(self, mock_requests):
         """Test delete_block_resource method"""
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         self.client.delete_block_resource('air_handler', self.id)
         mock_requests.delete.assert_called_with(
             self.id_url.replace('blocks', 'block_air_handlers'), **expected
@@ -910,7 +970,7 @@ class TestBlockAPI(unittest.TestCase):
     def test_get_block_resource(self, mock_requests):
         """Test get_block_resource method"""
         mock_requests.get.return_value = self.mock_response
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         result = self.client.get_block_resource('air_handler', self.id)
         mock_requests.get.assert_called_with(
             self.id_url.replace('blocks', 'block_air_handlers'), **expected
@@ -920,7 +980,7 @@ class TestBlockAPI(unittest.TestCase):
     def test_get_block_resources(self, mock_requests):
         """Test get_block_resources method"""
         mock_requests.get.return_value = self.mock_response
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         result = self.client.get_block_resources('air_handler', self.id)
         mock_requests.get.assert_called_with(
             self.id_url + '/block_air_handlers', **expected
@@ -931,7 +991,7 @@ class TestBlockAPI(unittest.TestCase):
         """Test update_block_resource method"""
         expected = {
             'json': {'token': 'token', 'air_handler_id': 2, 'name': 'test'},
-            'timeout': TIMEOUT
+            'timeout': DEFAULT_TIMEOUT
         }
         self.client.update_block_resource(
             'air_handler', self.id, 2, name='test'
@@ -979,14 +1039,20 @@ class TestBuildingAPI(unittest.TestCase):
             notes='test'
         )
         mock_requests.post.assert_called_with(
-            self.url, json=expected, timeout=TIMEOUT
+            self.url, json=expected, timeout=DEFAULT_TIMEOUT
         )
         self.assertEqual(result, self.json)
 
+    def test_delete_building(self, mock_requests):
+        """Test delete_building method"""
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
+        self.client.delete_building(self.id)
+        mock_requests.delete.assert_called_with(self.id_url, **expected)
+
     def test_get_building(self, mock_requests):
         """Test get_building method"""
         mock_requests.get.return_value = self.mock_response
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         result = self.client.get_building(self.id)
         mock_requests.get.assert_called_with(self.id_url, **expected)
         self.assertEqual(result, self.json)
@@ -1004,7 +1070,7 @@ class TestBuildingAPI(unittest.TestCase):
     def test_get_building_blocks(self, mock_requests):
         """Test get_building_blocks method"""
         mock_requests.get.return_value = self.mock_response
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         result = self.client.get_building_blocks(self.id)
         mock_requests.get.assert_called_with(
             self.id_url + '/blocks', **expected
@@ -1014,7 +1080,7 @@ class TestBuildingAPI(unittest.TestCase):
     def test_get_building_resources(self, mock_requests):
         """Test get_building_resources method"""
         mock_requests.get.return_value = self.mock_response
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         result = self.client.get_building_resources('air_handler', self.id)
         mock_requests.get.assert_called_with(
             self.id_url + '/air_handlers', **expected
@@ -1024,7 +1090,7 @@ class TestBuildingAPI(unittest.TestCase):
     def test_get_building_score(self, mock_requests):
         """Test get_building_score method"""
         mock_requests.get.return_value = self.mock_response
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         result = self.client.get_building_score(self.id)
         mock_requests.get.assert_called_with(
             self.id_url + '/score', **expected
@@ -1034,7 +1100,7 @@ class TestBuildingAPI(unittest.TestCase):
     def test_list_buildings(self, mock_requests):
         """Test list_buildings method"""
         mock_requests.get.return_value = self.mock_response
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         result = self.client.list_buildings()
         mock_requests.get.assert_called_with(self.url, **expected)
         self.assertEqual(result, self.json)
@@ -1046,7 +1112,7 @@ class TestBuildingAPI(unittest.TestCase):
         )
         expected = {
             'params': {'token': 'token', 'building_ids': '1,2,3'},
-            'timeout': TIMEOUT
+            'timeout': DEFAULT_TIMEOUT
         }
         self.client.manage_buildings(1, 2, 3)
         mock_requests.get.assert_called_with(url, **expected)
@@ -1054,7 +1120,7 @@ class TestBuildingAPI(unittest.TestCase):
     def test_simulate_building(self, mock_requests):
         """Test simulate_building method"""
         mock_requests.post.return_value = self.mock_response
-        expected = {'json': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'json': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         self.client.simulate_building(self.id)
         mock_requests.post.assert_called_with(
             self.id_url + '/simulate', **expected
@@ -1064,7 +1130,7 @@ class TestBuildingAPI(unittest.TestCase):
         """Test update_building method"""
         expected = {
             'json': {'token': 'token', 'notes': 'test'},
-            'timeout': TIMEOUT
+            'timeout': DEFAULT_TIMEOUT
         }
         self.client.update_building(self.id, notes='test')
         mock_requests.put.assert_called_with(self.id_url, **expected)
@@ -1075,7 +1141,7 @@ class TestBuildingAPI(unittest.TestCase):
         mock_response.json.return_value = {'valid': True}
         mock_response.raise_for_status.return_value = True
         mock_requests.get.return_value = mock_response
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         result = self.client.validate_building(self.id)
         mock_requests.get.assert_called_with(
             self.id_url + '/validate', **expected
@@ -1106,13 +1172,13 @@ class TestBuildingAPI(unittest.TestCase):
             'air handler', 1, name='test'
         )
         mock_requests.post.assert_called_with(
-            url, json=expected, timeout=TIMEOUT
+            url, json=expected, timeout=DEFAULT_TIMEOUT
         )
         self.assertEqual(result, self.json)
 
     def test_delete_resource(self, mock_requests):
         """Test delete_resource method"""
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         self.client.delete_resource('air_handler', self.id)
         mock_requests.delete.assert_called_with(
             self.id_url.replace('buildings', 'air_handlers'),
@@ -1122,7 +1188,7 @@ class TestBuildingAPI(unittest.TestCase):
     def test_get_resource(self, mock_requests):
         """Test get_resource method"""
         mock_requests.get.return_value = self.mock_response
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         result = self.client.get_resource('air_handler', self.id)
         mock_requests.get.assert_called_with(
             self.id_url.replace('buildings', 'air_handlers'),
@@ -1134,7 +1200,7 @@ class TestBuildingAPI(unittest.TestCase):
         """Test update_resource method"""
         expected = {
             'json': {'token': 'token', 'name': 'test'},
-            'timeout': TIMEOUT
+            'timeout': DEFAULT_TIMEOUT
         }
         self.client.update_resource(
             'air_handler', self.id, name='test'
@@ -1147,7 +1213,7 @@ class TestBuildingAPI(unittest.TestCase):
     def test_get_resource_type(self, mock_requests):
         """Test get_resource_type method"""
         mock_requests.get.return_value = self.mock_response
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         result = self.client.get_resource_type('air_handler', self.id)
         mock_requests.get.assert_called_with(
             self.id_url.replace('buildings', 'air_handler_types'),
@@ -1158,7 +1224,7 @@ class TestBuildingAPI(unittest.TestCase):
     def test_list_resource_type(self, mock_requests):
         """Test list_resource method"""
         mock_requests.get.return_value = self.mock_response
-        expected = {'params': {'token': 'token'}, 'timeout': TIMEOUT}
+        expected = {'params': {'token': 'token'}, 'timeout': DEFAULT_TIMEOUT}
         result = self.client.list_resource_types('air_handler')
         mock_requests.get.assert_called_with(
             self.url.replace('buildings', 'air_handler_types'),
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.streaming
+"""
+
+# Imports from Standard Library
+import json
+import unittest
+
+# Local Imports
+from pybes import streaming
+from pybes.pybes import APIError, BESClient
+from pybes.streaming import _iter_stdlib, iter_array
+from pybes.testing.fake_server import (
+    DEFAULT_TOKEN,
+    DEFAULT_USER_ID,
+    FakeBESServer,
+)
+from pybes.testing.synthetic import make_portfolio
+
+# Constants
+ITEMS = [
+    {'id': 1, 'name': u'Caf\xe9 ] [', 'blocks': [{'id': 2}], 'area': 1.5},
+    {'id': 2, 'name': 'a "quoted", name', 'notes': None, 'rated': True},
+    123456789, -2.5e3, 'text', None, [],
+]
+RAW = json.dumps(ITEMS, ensure_ascii=False, indent=1).encode('utf-8')
+
+
+# Helper Functions & Classes
+def chunked(data, size):
+    """data in chunks of size bytes"""
+    return [data[idx:idx + size] for idx in range(0, len(data), size)]
+
+
+# Tests
+class IterArrayTests(unittest.TestCase):
+    """Unit tests for iter_array"""
+
+    def test_chunks(self):
+        """Test items are parsed whatever the chunk boundaries"""
+        for size in (1, 2, 3, 7, 64, len(RAW)):
+            self.assertEqual(list(iter_array(chunked(RAW, size))), ITEMS)
+            self.assertEqual(list(_iter_stdlib(chunked(RAW, size))), ITEMS)
+        self.assertEqual(list(iter_array([b' [ ] '])), [])
+        self.assertEqual(list(iter_array([b'[1', b'2, 3]'])), [12, 3])
+
+    def test_fields(self):
+        """Test fields are projected"""
+        self.assertEqual(
+            list(iter_array([RAW], fields=('id', 'notes')))[:3],
+            [{'id': 1}, {'id': 2, 'notes': None}, 123456789]
+        )
+
+    def test_invalid(self):
+        """Test invalid arrays raise ValueError"""
+        for raw in (b'', b'{}', b'[1, 2', b'[1 2]', b'[{"id": 1]'):
+            with self.assertRaises(ValueError):
+                list(iter_array([raw]))
+
+    def test_incremental(self):
+        """Test items are yielded before the array is read"""
+        read = []
+
+        def chunks():
+            """An endless array, one chunk per item"""
+            yield b'['
+            idx = 0
+            while True:
+                read.append(idx)
+                yield json.dumps({'id': idx}).encode('utf-8') + b','
+                idx += 1
+
+        items = iter_array(chunks())
+        for idx in range(1000):
+            self.assertEqual(next(items), {'id': idx})
+        self.assertLessEqual(len(read), 1002)
+
+    @unittest.skipUnless(streaming.ijson, 'ijson is not installed')
+    def test_ijson(self):
+        """Test ijson and the standard library parse the same"""
+        self.assertEqual(
+            list(streaming._iter_ijson(chunked(RAW, 5))), ITEMS
+        )
+
+
+class ClientStreamingTests(unittest.TestCase):
+    """Test BESClient.iter_buildings and iter_preview_buildings"""
+
+    def setUp(self):
+        """setUp"""
+        self.server = FakeBESServer().start()
+        preview, full = make_portfolio(5, 20, start_id=100)
+        self.server.app.seed(preview=preview, full=full)
+        self.client = BESClient(
+            base_url=self.server.base_url, access_token=DEFAULT_TOKEN,
+            user_id=DEFAULT_USER_ID
+        )
+
+    def tearDown(self):
+        """tearDown"""
+        self.server.stop()
+
+    def test_iter_buildings(self):
+        """Test iter_buildings matches list_buildings"""
+        self.assertEqual(
+            list(self.client.iter_buildings(chunk_size=100)),
+            self.client.list_buildings()
+        )
+        fields = ('id', 'status_type_id', 'updated_at')
+        self.assertEqual(
+            list(self.client.iter_buildings(fields=fields)),
+            [
+                {key: bldg[key] for key in fields}
+                for bldg in self.client.list_buildings()
+            ]
+        )
+
+    def test_iter_preview_buildings(self):
+        """Test iter_preview_buildings matches list_preview_buildings"""
+        self.assertEqual(
+            list(self.client.iter_preview_buildings(chunk_size=100)),
+            self.client.list_preview_buildings()
+        )
+
+    def test_error(self):
+        """Test errors are raised as APIError"""
+        client = BESClient(
+            base_url=self.server.base_url, access_token='invalid',
+            user_id=DEFAULT_USER_ID
+        )
+        with self.assertRaises(APIError):
+            list(client.iter_buildings())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved.
+
+Unit tests for pybes.transports
+"""
+
+# Imports from Standard Library
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# Local Imports
+from pybes.pybes import APIError, BESClient, BESError
+from pybes.testing.fake_server import (
+    DEFAULT_EMAIL,
+    DEFAULT_ORG_TOKEN,
+    DEFAULT_PASSWORD,
+    DEFAULT_TOKEN,
+    FakeBESServer,
+)
+from pybes.testing.synthetic import make_portfolio
+from pybes.transports import (
+    HedgedTransport,
+    RecordingTransport,
+    ReplayTransport,
+    SessionTransport,
+)
+from pybes.utils.bes_full import get_bes_buildings
+
+PY3 = sys.version_info[0] == 3
+if PY3:
+    from unittest import mock
+else:
+    import mock
+
+
+# Tests
+class RecordReplayTests(unittest.TestCase):
+    """Record a session against FakeBESServer then replay it"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Record a session"""
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.tmpdir, 'session.jsonl.gz')
+        preview, full = make_portfolio(3, 3)
+        with FakeBESServer() as server:
+            server.app.seed(preview=preview, full=full)
+            cls.bes_kwargs = {
+                'email': DEFAULT_EMAIL, 'password': DEFAULT_PASSWORD,
+                'organization_token': DEFAULT_ORG_TOKEN,
+                'base_url': server.base_url,
+            }
+            with RecordingTransport(cls.path) as transport:
+                cls.recorded = list(get_bes_buildings(
+                    [], transport=transport, **cls.bes_kwargs
+                ))
+                client = BESClient(transport=transport, **cls.bes_kwargs)
+                try:
+                    client.get_building(999)
+                except APIError:
+                    pass
+                cls.recorded_count = transport.count
+            cls.server_calls = sum(server.app.calls.values())
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove recording"""
+        shutil.rmtree(cls.tmpdir)
+
+    def test_recording(self):
+        """Test every request is recorded, without credentials"""
+        self.assertEqual(self.recorded_count, self.server_calls)
+        with gzip.open(self.path, 'rb') as fil:
+            content = fil.read().decode('utf-8')
+        self.assertEqual(len(content.splitlines()), self.recorded_count + 1)
+        for secret in (DEFAULT_PASSWORD, DEFAULT_ORG_TOKEN):
+            self.assertNotIn(secret, content)
+        self.assertNotIn('"token":"{}"'.format(DEFAULT_TOKEN), content)
+        self.assertNotIn(
+            '\\"token\\": \\"{}\\"'.format(DEFAULT_TOKEN), content
+        )
+        self.assertIn('\\"token\\": \\"REDACTED\\"', content)
+
+    def test_replay(self):
+        """Test get_bes_buildings replays with the server stopped"""
+        sleep = mock.MagicMock()
+        transport = ReplayTransport(self.path, speed=10, sleep=sleep)
+        bes_kwargs = dict(self.bes_kwargs, base_url='http://replay/api')
+        replayed = list(get_bes_buildings(
+            [], transport=transport, **bes_kwargs
+        ))
+        self.assertEqual(len(replayed), 6)
+        for (bldg, bes_type), (recorded, recorded_type) in zip(
+                replayed, self.recorded):
+            self.assertEqual(bes_type, recorded_type)
+            self.assertEqual(
+                bldg['bes_building_id'], recorded['bes_building_id']
+            )
+            score = 'source_eui' if bes_type == 'Full' else 'mean_eui'
+            self.assertEqual(bldg[score], recorded[score])
+        self.assertTrue(sleep.called)
+        self.assertTrue(all(call[0][0] < 1 for call in sleep.call_args_list))
+
+    def test_replay_schedule(self):
+        """Test responses are served at their recorded offset and latency"""
+        with gzip.open(self.path, 'rb') as fil:
+            entries = [
+                json.loads(line.decode('utf-8')) for line in fil
+            ][1:]
+        for now, speed in ((0.0, 2), (1000.0, 4)):
+            # the first request starts the replay at 0
+            times = [0.0] + [now] * (len(entries) - 1)
+            sleep = mock.MagicMock()
+            transport = ReplayTransport(
+                self.path, speed=speed, loop=False, sleep=sleep,
+                clock=mock.MagicMock(side_effect=times)
+            )
+            for entry in entries:
+                transport.request(
+                    entry['method'], entry['url'], params=entry['params'],
+                    json=entry['json']
+                )
+            self.assertEqual(sleep.call_count, len(entries))
+            for call, entry, time_ in zip(
+                    sleep.call_args_list, entries, times):
+                self.assertAlmostEqual(
+                    call[0][0],
+                    max(entry['offset'] / speed - time_, 0) +
+                    entry['latency'] / speed
+                )
+        self.assertTrue(any(entry['offset'] > 0 for entry in entries))
+
+    def test_replay_errors(self):
+        """Test recorded errors are replayed, unrecorded calls raise"""
+        transport = ReplayTransport(self.path, speed=None)
+        client = BESClient(
+            access_token='token', user_id=1, base_url='http://replay/api',
+            transport=transport
+        )
+        with self.assertRaises(APIError) as conm:
+            client.get_building(999)
+        self.assertEqual(conm.exception.status_code, 404)
+        with self.assertRaises(BESError):
+            client.get_building(1000)
+
+    def test_replay_no_loop(self):
+        """Test recorded responses are used up unless loop is set"""
+        transport = ReplayTransport(self.path, speed=None, loop=False)
+        client = BESClient(
+            access_token='token', user_id=1, base_url='http://replay/api',
+            transport=transport
+        )
+        client.list_buildings()
+        with self.assertRaises(BESError):
+            client.list_buildings()
+
+
+class SessionTransportTests(unittest.TestCase):
+    """Test SessionTransport"""
+
+    def test_session_per_thread(self):
+        """Test each thread gets its own session, closed by close()"""
+        with FakeBESServer() as server:
+            client = BESClient(
+                base_url=server.base_url, email=DEFAULT_EMAIL,
+                password=DEFAULT_PASSWORD,
+                organization_token=DEFAULT_ORG_TOKEN,
+                session_per_thread=True
+            )
+            transport = client.transport
+            self.assertIsInstance(transport, SessionTransport)
+            sessions = []
+
+            def call():
+                """Make calls in a thread"""
+                client.get_resource_type('shape', 1)
+                client.get_resource_type('shape', 2)
+                sessions.append(transport.session)
+
+            threads = [threading.Thread(target=call) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(set(id(sess) for sess in sessions)), 3)
+            # the main thread's session authenticated
+            self.assertEqual(len(transport.sessions), 4)
+            with mock.patch.object(sessions[0], 'close') as mock_close:
+                transport.close()
+            mock_close.assert_called_once_with()
+            self.assertEqual(transport.sessions, [])
+
+
+class HedgedTransportTests(unittest.TestCase):
+    """Test HedgedTransport"""
+
+    def setUp(self):
+        """setUp"""
+        self.slow = set()
+        calls = []
+
+        def latency(_):
+            """First call to a slow endpoint hangs"""
+            calls.append(1)
+            return 2.0 if len(calls) in self.slow else 0.0
+
+        self.server = FakeBESServer(
+            endpoint_latency={'GET v2/preview_buildings/{id}': latency}
+        ).start()
+        preview, _ = make_portfolio(1, 0, start_id=100)
+        self.server.app.seed(preview=preview)
+        self.transport = HedgedTransport(initial_delay=0.1, budget=0.5,
+                                         max_tokens=1)
+        self.client = BESClient(
+            base_url=self.server.base_url, access_token=DEFAULT_TOKEN,
+            user_id=1, transport=self.transport
+        )
+
+    def tearDown(self):
+        """tearDown"""
+        self.transport.close()
+        self.server.stop()
+
+    def test_hedge(self):
+        """Test a slow GET is hedged and the fast answer used"""
+        self.slow.add(1)
+        start = time.time()
+        bldg = self.client.get_preview_building(100)
+        self.assertLess(time.time() - start, 1.5)
+        self.assertEqual(bldg['building_id'], 100)
+        self.assertEqual(
+            (self.transport.requests, self.transport.hedges,
+             self.transport.hedge_wins),
+            (1, 1, 1)
+        )
+        self.assertEqual(
+            self.server.app.calls['GET v2/preview_buildings/{id}'], 2
+        )
+
+    def test_budget(self):
+        """Test hedges are limited by the budget"""
+        self.slow.update([1, 3])
+        self.client.get_preview_building(100)
+        self.assertEqual(self.transport.tokens, 0)
+        start = time.time()
+        self.client.get_preview_building(100)
+        self.assertGreater(time.time() - start, 1.5)
+        self.assertEqual(self.transport.hedges, 1)
+
+    def test_not_hedged(self):
+        """Test fast and non GET requests aren't hedged"""
+        self.client.get_preview_building(100)
+        self.client.delete_preview_building(100)
+        self.assertEqual(self.transport.hedges, 0)
+        self.assertEqual(self.transport.requests, 1)
+
+    def test_primary_thread(self):
+        """Test only hedges use the executor"""
+        threads = []
+        inner = mock.MagicMock()
+        inner.request.side_effect = lambda *args, **kwargs: threads.append(
+            threading.current_thread()
+        )
+        for max_tokens, caller in ((0, True), (1, False)):
+            transport = HedgedTransport(inner, max_tokens=max_tokens)
+            transport.request('get', 'http://bes/api/v1/buildings')
+            self.assertEqual(threads.pop() is threading.current_thread(),
+                             caller)
+            self.assertIsNone(
+                transport._executor     # pylint: disable=protected-access
+            )
+        self.client.get_preview_building(100)
+        self.assertIsNone(
+            self.transport._executor    # pylint: disable=protected-access
+        )
+        self.slow.add(2)
+        self.client.get_preview_building(100)
+        self.assertIsNotNone(
+            self.transport._executor    # pylint: disable=protected-access
+        )
+
+    def test_fork(self):
+        """Test threads and the lock are replaced after fork"""
+        self.client.get_preview_building(100)
+        executor = self.transport.executor
+        lock = self.transport._lock     # pylint: disable=protected-access
+        with mock.patch('os.getpid', return_value=-1):
+            self.assertIsNot(self.transport.executor, executor)
+            self.assertIsNot(
+                self.transport._lock, lock  # pylint: disable=protected-access
+            )
+            self.slow.add(2)
+            self.client.get_preview_building(100)
+        self.assertEqual(self.transport.hedge_wins, 1)
+        executor.shutdown()
+
+    def test_delay(self):
+        """Test delay is the percentile latency once there are samples"""
+        transport = HedgedTransport(initial_delay=1, min_samples=3,
+                                    percentile=50, window=10)
+        self.assertEqual(transport.delay, 1)
+        transport.latencies.extend([0.2, 0.3, 0.1])
+        transport._delay = None         # pylint: disable=protected-access
+        self.assertEqual(transport.delay, 0.2)
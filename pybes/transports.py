@@ -0,0 +1,671 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Transports for BESClient.
+
+A transport makes the http call for BESClient._request. It has a single
+method, request(method, url, **kwargs), taking the same arguments as
+requests.request and returning a requests.Response. By default the client
+uses requests directly.
+
+SessionTransport keeps a requests.Session per thread, so connections are
+reused (sessions are not safe to share between threads).
+
+RateLimitedTransport keeps calls under a RateLimiter's rate.
+ConcurrencyLimitedTransport keeps calls in flight under an
+AdaptiveLimiter's limit, reporting their latency and status back to it.
+
+CircuitBreakerTransport fails calls fast, with CircuitOpenError, while a
+CircuitBreaker's circuit for their endpoint family is open.
+
+HedgedTransport sends a second copy of a GET that is slower than most
+(by default its 95th percentile latency) and uses whichever answers
+first, within a budget of extra requests.
+
+RecordingTransport captures request/response pairs from a real session
+to a gzipped json lines file, with tokens and passwords redacted.
+ReplayTransport serves them back, at the recorded or an accelerated
+speed, so runs can be repeated and profiled without the API::
+
+    with RecordingTransport('portfolio.jsonl.gz') as transport:
+        incomplete = []
+        list(get_bes_buildings(incomplete, transport=transport, **kwargs))
+
+    transport = ReplayTransport('portfolio.jsonl.gz', speed=10)
+    list(get_bes_buildings([], transport=transport, **kwargs))
+
+Replayed requests are matched on method, url path and parameters (so
+the base url may differ); repeated identical requests are answered in
+the order they were recorded.
+"""
+
+# Imports from Standard Library
+import base64
+import gzip
+import io
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Any, Dict, List, Optional, Tuple
+
+# Imports from Third Party Modules
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Local Imports
+from pybes.breaker import endpoint_family
+from pybes.pybes import BESError
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:                                     # pragma: no cover
+    from urlparse import urlsplit
+
+# Constants
+FORMAT_VERSION = 1
+REDACTED = 'REDACTED'
+REDACTED_KEYS = frozenset(
+    ['token', 'password', 'password_confirmation', 'organization_token']
+)
+RECORDED_HEADERS = ('Content-Type', 'Retry-After')
+
+
+# Private Functions
+def _redact(obj):
+    # type: (Any) -> Any
+    """Copy of obj with the values of REDACTED_KEYS replaced"""
+    if isinstance(obj, dict):
+        return {
+            key: REDACTED if key in REDACTED_KEYS else _redact(val)
+            for key, val in obj.items()
+        }
+    if isinstance(obj, (list, tuple)):
+        return [_redact(item) for item in obj]
+    return obj
+
+
+def _request_key(method, url, params, data):
+    # type: (str, str, Optional[Dict], Optional[Dict]) -> Tuple[str, str, str]
+    """Key used to match a request on replay, ignores redacted values"""
+    return (
+        method.upper(),
+        urlsplit(url).path,
+        json.dumps(
+            [_redact(params or {}), _redact(data or {})],
+            sort_keys=True, default=str
+        ),
+    )
+
+
+def _encode_body(content):
+    # type: (bytes) -> Tuple[str, Optional[str]]
+    """Body as text, redacted if json, or base64 if binary"""
+    try:
+        text = content.decode('utf-8')
+    except UnicodeDecodeError:
+        return base64.b64encode(content).decode('ascii'), 'base64'
+    try:
+        return json.dumps(_redact(json.loads(text))), None
+    except ValueError:
+        return text, None
+
+
+def _send(transport, method, url, kwargs):
+    # type: (Any, str, str, Dict) -> requests.Response
+    """Make request with transport, or requests if None"""
+    if transport:
+        return transport.request(method, url, **kwargs)
+    return requests.request(method.upper(), url, **kwargs)
+
+
+def _close(future):
+    # type: (Any) -> None
+    """Close response of a hedged request that lost"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _make_response(entry, url):
+    # type: (Dict, str) -> requests.Response
+    """requests.Response from a recorded entry"""
+    response = requests.Response()
+    response.status_code = entry['status']
+    response.headers = CaseInsensitiveDict(entry.get('headers', {}))
+    body = entry.get('body', '')
+    if entry.get('encoding') == 'base64':
+        response._content = base64.b64decode(body)
+    else:
+        response._content = body.encode('utf-8')
+    response.encoding = 'utf-8'
+    response.url = url
+    return response
+
+
+# Public Classes and Functions
+class SessionTransport(object):
+    """
+    Makes requests with a requests.Session per thread, reusing connections.
+    Thread safe. close() closes every thread's session.
+
+    Sessions are dropped (not closed, as their sockets are shared with the
+    parent) in a forked process, and a pickled copy starts without any.
+    """
+
+    def __init__(self, pool_maxsize=10):
+        # type: (int) -> None
+        """
+        :param pool_maxsize: connections kept open per host by each session
+        """
+        self.pool_maxsize = pool_maxsize
+        self._reset()
+
+    def __getstate__(self):
+        return {'pool_maxsize': self.pool_maxsize}
+
+    def __setstate__(self, state):
+        self.pool_maxsize = state['pool_maxsize']
+        self._reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _reset(self):
+        # type: () -> None
+        """Forget all sessions"""
+        self.sessions = []              # type: List[requests.Session]
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @property
+    def session(self):
+        # type: () -> requests.Session
+        """This thread's session"""
+        if self._pid != os.getpid():
+            self._reset()
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=self.pool_maxsize
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+            with self._lock:
+                self.sessions.append(session)
+        return session
+
+    def request(self, method, url, **kwargs):
+        # type: (str, str, **Any) -> requests.Response
+        """Make request with this thread's session"""
+        return self.session.request(method.upper(), url, **kwargs)
+
+    def close(self):
+        # type: () -> None
+        """Close all sessions"""
+        with self._lock:
+            sessions, self.sessions = self.sessions, []
+        for session in sessions:
+            session.close()
+        self._local = threading.local()
+
+
+class RateLimitedTransport(object):
+    """
+    Waits for limiter before passing requests on to transport (default
+    requests). Share the limiter between every client using a token.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, limiter, transport=None):
+        # type: (Any, Any) -> None
+        """
+        :param limiter: RateLimiter
+        :param transport: transport to limit, default requests
+        """
+        self.limiter = limiter
+        self.transport = transport
+
+    def request(self, method, url, **kwargs):
+        # type: (str, str, **Any) -> requests.Response
+        """Make request once limiter allows"""
+        self.limiter.acquire()
+        return _send(self.transport, method, url, kwargs)
+
+
+class ConcurrencyLimitedTransport(object):
+    """
+    Waits for an AdaptiveLimiter permit before passing requests on to
+    transport (default requests), reporting each outcome back to it.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, limiter, transport=None):
+        # type: (Any, Any) -> None
+        """
+        :param limiter: AdaptiveLimiter
+        :param transport: transport to limit, default requests
+        """
+        self.limiter = limiter
+        self.transport = transport
+
+    def request(self, method, url, **kwargs):
+        # type: (str, str, **Any) -> requests.Response
+        """Make request once limiter allows"""
+        permit = self.limiter.acquire()
+        try:
+            response = _send(self.transport, method, url, kwargs)
+        except Exception:
+            self.limiter.release(permit, error=True)
+            raise
+        self.limiter.release(permit, status=response.status_code)
+        return response
+
+
+class CircuitBreakerTransport(object):
+    """
+    Checks breaker before passing requests on to transport (default
+    requests), recording 5xx responses and errors as failures.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, breaker, transport=None):
+        # type: (Any, Any) -> None
+        """
+        :param breaker: CircuitBreaker
+        :param transport: transport to protect, default requests
+        """
+        self.breaker = breaker
+        self.transport = transport
+
+    def request(self, method, url, **kwargs):
+        # type: (str, str, **Any) -> requests.Response
+        """Make request unless its circuit is open"""
+        family = endpoint_family(url)
+        probe = self.breaker.before(family)
+        try:
+            response = _send(self.transport, method, url, kwargs)
+        except Exception:
+            self.breaker.record(family, False, probe=probe)
+            raise
+        self.breaker.record(family, response.status_code < 500, probe=probe)
+        return response
+
+
+class HedgedTransport(object):
+    """
+    Hedges idempotent (GET) requests to transport (default requests).
+    Thread safe.
+
+    If a GET hasn't been answered after delay (the percentile latency of
+    recent GETs, or initial_delay until min_samples have been seen) a
+    duplicate is sent and the first successful response used. The other
+    request is cancelled if it hasn't started, or its response closed.
+
+    Each GET earns budget hedges, up to max_tokens, and each hedge costs
+    one, so at most about budget extra requests are sent per request,
+    however slow the api gets. A GET that can't be hedged, as the budget
+    is spent, is made in the caller's thread; otherwise it gets a thread
+    of its own and only hedges are made by the executor.
+
+    Its threads are replaced in a forked process, and a pickled copy
+    starts without any.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, transport=None, percentile=95, initial_delay=1.0,
+                 min_delay=0.01, budget=0.05, max_tokens=10, window=1000,
+                 min_samples=20, max_workers=32, methods=('get',)):
+        # type: (Any, float, float, float, float, float, int, int, int, Tuple[str, ...]) -> None
+        """
+        :param transport: transport to hedge, default requests
+        :param percentile: latency percentile after which to hedge
+        :param initial_delay: delay before hedging until there are
+            min_samples latencies
+        :param min_delay: shortest delay
+        :param budget: hedges earned per request
+        :param max_tokens: most hedges that can be saved up
+        :param window: number of recent latencies used
+        :param min_samples: latencies needed before percentile is used
+        :param max_workers: threads making hedges
+        :param methods: methods to hedge, must be idempotent
+        """
+        # pylint: disable=too-many-arguments
+        self.transport = transport
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.budget = budget
+        self.max_tokens = max_tokens
+        self.window = window
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self.methods = tuple(method.lower() for method in methods)
+        self._reset()
+
+    def __getstate__(self):
+        return {
+            key: getattr(self, key) for key in (
+                'transport', 'percentile', 'initial_delay', 'min_delay',
+                'budget', 'max_tokens', 'window', 'min_samples',
+                'max_workers', 'methods',
+            )
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _reset(self):
+        # type: () -> None
+        """No latencies, hedges or threads yet"""
+        self.latencies = deque(maxlen=self.window)  # type: deque
+        self.tokens = float(self.max_tokens)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._delay = None                  # type: Optional[float]
+        self._executor = None               # type: Optional[ThreadPoolExecutor]
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        # type: () -> None
+        """
+        Drop the threads and lock in a forked process, where the threads
+        don't exist and the lock may be held by one of them
+        """
+        if self._pid != os.getpid():
+            self._executor = None
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    @property
+    def executor(self):
+        # type: () -> ThreadPoolExecutor
+        """Threads used to make hedges"""
+        self._check_fork()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers
+                )
+            return self._executor
+
+    @property
+    def delay(self):
+        # type: () -> float
+        """Seconds to wait before hedging"""
+        with self._lock:
+            if self._delay is None:
+                if len(self.latencies) < self.min_samples:
+                    self._delay = self.initial_delay
+                else:
+                    latencies = sorted(self.latencies)
+                    idx = int(self.percentile / 100.0 * (len(latencies) - 1))
+                    self._delay = max(self.min_delay, latencies[idx])
+            return self._delay
+
+    def _timed(self, method, url, kwargs):
+        # type: (str, str, Dict) -> requests.Response
+        """Make request, recording its latency if it succeeds"""
+        start = time.time()
+        response = _send(self.transport, method, url, kwargs)
+        with self._lock:
+            self.latencies.append(time.time() - start)
+            # recalculated every window / 10 requests
+            if len(self.latencies) % max(1, self.window // 10) == 0:
+                self._delay = None
+        return response
+
+    def _run(self, future, method, url, kwargs):
+        # type: (Future, str, str, Dict) -> None
+        """Make request, setting the result of future"""
+        try:
+            future.set_result(self._timed(method, url, kwargs))
+        except Exception as err:        # pylint: disable=broad-except
+            future.set_exception(err)
+
+    def _start(self, method, url, kwargs):
+        # type: (str, str, Dict) -> Future
+        """Make request in a thread of its own"""
+        future = Future()       # type: Future
+        future.set_running_or_notify_cancel()
+        thread = threading.Thread(
+            target=self._run, args=(future, method, url, kwargs)
+        )
+        thread.daemon = True
+        thread.start()
+        return future
+
+    def _take_token(self):
+        # type: () -> bool
+        """Spend a hedge from the budget, if there is one"""
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            self.hedges += 1
+            return True
+
+    def request(self, method, url, **kwargs):
+        # type: (str, str, **Any) -> requests.Response
+        """Make request, hedging if it is slow"""
+        if method.lower() not in self.methods:
+            return _send(self.transport, method, url, kwargs)
+        self._check_fork()
+        with self._lock:
+            self.requests += 1
+            self.tokens = min(self.max_tokens, self.tokens + self.budget)
+            can_hedge = self.tokens >= 1
+        if not can_hedge:
+            return self._timed(method, url, kwargs)
+        # the primary gets a thread of its own, rather than one of the
+        # executor's, so only hedges are limited by max_workers
+        primary = self._start(method, url, kwargs)
+        done, _ = wait([primary], timeout=self.delay)
+        if done or not self._take_token():
+            return primary.result()
+        hedge = self.executor.submit(self._timed, method, url, kwargs)
+        pending = set([primary, hedge])
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [
+                future for future in done if future.exception() is None
+            ]
+            if succeeded or not pending:
+                break
+        for future in pending:
+            if not future.cancel():
+                future.add_done_callback(_close)
+        if not succeeded:
+            return primary.result()
+        if hedge in succeeded and primary not in succeeded:
+            with self._lock:
+                self.hedge_wins += 1
+            return hedge.result()
+        return primary.result()
+
+    def close(self):
+        # type: () -> None
+        """Stop threads, once requests in progress have finished"""
+        self._check_fork()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown()
+
+
+class RecordingTransport(object):
+    """
+    Records request/response pairs to path (gzipped json lines) while
+    passing requests on to transport (default requests). Thread safe.
+    Call close(), or use as a context manager, to finish the file.
+    """
+
+    def __init__(self, path, transport=None):
+        # type: (str, Any) -> None
+        """
+        :param path: file to record to, overwritten
+        :param transport: transport to record, default requests
+        """
+        self.path = path
+        self.transport = transport
+        self.count = 0
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._file = io.TextIOWrapper(gzip.open(path, 'wb'), encoding='utf-8')
+        self._write({'version': FORMAT_VERSION, 'started': self._started})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write(self, entry):
+        # type: (Dict) -> None
+        """Write entry as a line of json"""
+        line = json.dumps(entry, sort_keys=True, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + u'\n')
+
+    def close(self):
+        # type: () -> None
+        """Flush and close the recording"""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def request(self, method, url, **kwargs):
+        # type: (str, str, **Any) -> requests.Response
+        """Make and record request"""
+        start = time.time()
+        response = _send(self.transport, method, url, kwargs)
+        latency = time.time() - start
+        body, encoding = _encode_body(response.content or b'')
+        entry = {
+            'method': method.upper(),
+            'url': url,
+            'params': _redact(kwargs.get('params') or {}),
+            'json': _redact(kwargs.get('json') or {}),
+            'status': response.status_code,
+            'headers': {
+                key: response.headers[key] for key in RECORDED_HEADERS
+                if key in response.headers
+            },
+            'body': body,
+            'offset': start - self._started,
+            'latency': latency,
+        }
+        if encoding:
+            entry['encoding'] = encoding
+        if kwargs.get('files'):
+            entry['files'] = sorted(kwargs['files'])
+        self._write(entry)
+        with self._lock:
+            self.count += 1
+        return response
+
+
+class ReplayTransport(object):
+    """
+    Serves responses recorded by RecordingTransport. Thread safe.
+
+    Raises BESError for a request that was not recorded, or if all the
+    recorded responses for it have been used (unless loop is True, in which
+    case the last is repeated).
+
+    Unless speed is None or 0, responses are served on the recorded
+    schedule: no earlier than their recorded offset from the start of the
+    recording (counted from the first replayed request), plus their
+    recorded latency, both scaled by speed.
+    """
+
+    def __init__(self, path, speed=1.0, loop=True, sleep=time.sleep,
+                 clock=time.time):
+        # type: (str, Optional[float], bool, Any, Any) -> None
+        """
+        :param path: recording
+        :param speed: 1 replays at the recorded pace, 10 ten times
+            faster, None or 0 without any delay
+        :param loop: repeat the last response once a request's recorded
+            responses are used up
+        :param sleep: function used to wait
+        :param clock: function returning the current time, in seconds
+        """
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.sleep = sleep
+        self.clock = clock
+        self.count = 0
+        self._started = None    # type: Optional[float]
+        self.responses = defaultdict(deque)
+        self._lock = threading.Lock()
+        with io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8') as fil:
+            header = json.loads(fil.readline())
+            if header.get('version') != FORMAT_VERSION:
+                raise BESError(
+                    'Unsupported recording version: {}'.format(
+                        header.get('version')
+                    )
+                )
+            for line in fil:
+                entry = json.loads(line)
+                key = _request_key(
+                    entry['method'], entry['url'], entry['params'],
+                    entry['json']
+                )
+                self.responses[key].append(entry)
+
+    def request(self, method, url, **kwargs):
+        # type: (str, str, **Any) -> requests.Response
+        """Replay recorded response for request"""
+        key = _request_key(
+            method, url, kwargs.get('params'), kwargs.get('json')
+        )
+        with self._lock:
+            entries = self.responses.get(key)
+            if not entries:
+                raise BESError(
+                    'No recorded response for {} {}'.format(
+                        method.upper(), url
+                    ),
+                    request=key
+                )
+            if len(entries) > 1 or not self.loop:
+                entry = entries.popleft()
+            else:
+                entry = entries[0]
+            self.count += 1
+            now = self.clock()
+            if self._started is None:
+                self._started = now
+        if self.speed:
+            speed = float(self.speed)
+            due = self._started + entry.get('offset', 0) / speed
+            self.sleep(max(due - now, 0) + entry['latency'] / speed)
+        return _make_response(entry, url)
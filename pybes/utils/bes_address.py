@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Address index for matching SEED records to existing BES buildings.
+
+Comparing every SEED property against every BES building is O(N x M).
+AddressIndex normalizes the BES listing once (using ADDRESS_MAP) and builds
+hash indexes on the full address, street + postal code and street + city
++ state, with a character trigram index on street for addresses that
+differ slightly (typos, missing suite numbers). Trigrams are indexed
+within each postal code and each city, so a lookup only touches buildings
+sharing an exact key or an uncommon trigram in the same area::
+
+    index = AddressIndex.from_client(client)
+    for state, match in index.match_many(seed_states):
+        if match and match.confidence > 0.9:
+            link(state, match.building_id)
+"""
+
+# Imports from Standard Library
+from collections import Counter, defaultdict, namedtuple
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+# Local Imports
+from pybes.pybes import BESClient
+from pybes.utils.bes_constants import ADDRESS_FIELDS, ADDRESS_MAP
+from pybes.utils.bes_utils import get_addr_line_str, normalize_address
+
+# Constants
+NGRAM = 3
+
+# confidence for each kind of match
+EXACT = 1.0
+STREET_POSTAL_CODE = 0.95
+STREET_CITY_STATE = 0.9
+# fuzzy match scores are street similarity, reduced if the postal code
+# differs
+POSTAL_CODE_MISMATCH = 0.9
+
+
+# Data Structure Definitions
+AddressKey = namedtuple(
+    'AddressKey', ['street', 'city', 'state', 'postal_code']
+)
+AddressMatch = namedtuple(
+    'AddressMatch', ['building_id', 'confidence', 'method', 'candidates']
+)
+
+
+# Private Functions
+def _ngrams(text):
+    # type: (str) -> Set[str]
+    """Character ngrams of text, padded so short strings have some"""
+    text = ' {} '.format(text)
+    return set(text[idx:idx + NGRAM] for idx in range(len(text) - NGRAM + 1))
+
+
+# Public Classes and Functions
+def address_key(street, city, state, postal_code):
+    # type: (Any, Any, Any, Any) -> AddressKey
+    """Normalized AddressKey, only 5 digits of postal code are used"""
+    return AddressKey(
+        normalize_address(street), normalize_address(city),
+        normalize_address(state), normalize_address(postal_code)[:5]
+    )
+
+
+def seed_address_key(state):
+    # type: (Mapping[str, Any]) -> AddressKey
+    """AddressKey for a SEED property state (ADDRESS_FIELDS)"""
+    city, state_code, postal_code = (
+        state.get(field) for field in ADDRESS_FIELDS[2:]
+    )
+    return address_key(
+        get_addr_line_str(state), city, state_code, postal_code
+    )
+
+
+def bes_address_key(building):
+    # type: (Mapping[str, Any]) -> AddressKey
+    """AddressKey for a BES building, fields mapped using ADDRESS_MAP"""
+    return address_key(
+        *(
+            building.get(ADDRESS_MAP[field])
+            for field in ('address_line_1', 'city', 'state', 'postal_code')
+        )
+    )
+
+
+class AddressIndex(object):
+    """
+    Hash and trigram indexes of BES building addresses.
+
+    Build with the list_buildings listing (which includes preview
+    buildings), then match SEED states with match or match_many.
+    """
+
+    def __init__(self, buildings, id_key='id', max_posting=0.05,
+                 min_confidence=0.75):
+        # type: (Iterable[Mapping[str, Any]], str, float, float) -> None
+        """
+        :param buildings: BES buildings with address fields
+        :param id_key: key of building id
+        :param max_posting: trigrams found in more than this fraction of
+            the buildings in an area (min 50) are ignored for fuzzy
+            matching, as they discriminate little and are costly to scan
+        :param min_confidence: fuzzy matches scoring less are discarded
+        """
+        self.min_confidence = min_confidence
+        self.ids = []                           # type: List[Any]
+        self.keys = []                          # type: List[AddressKey]
+        self.exact = defaultdict(list)          # type: Dict[Tuple, List[int]]
+        self.street_postal_code = defaultdict(list)
+        self.street_city_state = defaultdict(list)
+        # area: ngram: indexes, areas are postal codes and cities
+        self.ngrams = defaultdict(
+            lambda: defaultdict(list)
+        )                       # type: Dict[Tuple, Dict[str, List[int]]]
+        self.area_sizes = Counter()             # type: Counter
+        self.ngram_counts = []                  # type: List[int]
+        self.max_posting = max_posting
+        for building in buildings:
+            self.add(building[id_key], bes_address_key(building))
+
+    @classmethod
+    def from_client(cls, client, **kwargs):
+        # type: (BESClient, **Any) -> AddressIndex
+        """Index of buildings in client's list_buildings"""
+        return cls(client.list_buildings(), **kwargs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, building_id, key):
+        # type: (Any, AddressKey) -> None
+        """Add building to index"""
+        if not key.street:
+            return
+        idx = len(self.ids)
+        self.ids.append(building_id)
+        self.keys.append(key)
+        self.exact[key].append(idx)
+        self.street_postal_code[(key.street, key.postal_code)].append(idx)
+        self.street_city_state[
+            (key.street, key.city, key.state)
+        ].append(idx)
+        grams = _ngrams(key.street)
+        for area in self._areas(key):
+            self.area_sizes[area] += 1
+            area_ngrams = self.ngrams[area]
+            for gram in grams:
+                area_ngrams[gram].append(idx)
+        self.ngram_counts.append(len(grams))
+
+    @staticmethod
+    def _areas(key):
+        # type: (AddressKey) -> List[Tuple]
+        """Areas used to block trigram lookups"""
+        return [
+            area for area in (
+                ('postal_code', key.postal_code),
+                ('city', key.city, key.state),
+            ) if all(area[1:])
+        ]
+
+    def _result(self, indexes, confidence, method):
+        # type: (List[int], float, str) -> AddressMatch
+        """AddressMatch for best indexes, ambiguous matches lower confidence"""
+        candidates = [self.ids[idx] for idx in indexes]
+        return AddressMatch(
+            candidates[0], confidence / len(candidates), method, candidates
+        )
+
+    def _fuzzy(self, key):
+        # type: (AddressKey) -> Optional[AddressMatch]
+        """
+        Best match on street trigram similarity, in the same postal code or
+        failing that the same city
+        """
+        grams = _ngrams(key.street)
+        for area in self._areas(key):
+            area_ngrams = self.ngrams.get(area)
+            if not area_ngrams:
+                continue
+            max_posting = max(
+                50, int(self.max_posting * self.area_sizes[area])
+            )
+            shared = Counter()                  # type: Counter
+            for gram in grams:
+                posting = area_ngrams.get(gram)
+                if posting and len(posting) <= max_posting:
+                    shared.update(posting)
+            best = []                           # type: List[int]
+            best_score = 0.0
+            for idx, count in shared.items():
+                # dice coefficient
+                score = 2.0 * count / (len(grams) + self.ngram_counts[idx])
+                if key.postal_code != self.keys[idx].postal_code:
+                    score *= POSTAL_CODE_MISMATCH
+                if score > best_score:
+                    best, best_score = [idx], score
+                elif score == best_score:
+                    best.append(idx)
+            if best_score >= self.min_confidence:
+                return self._result(best, best_score, 'fuzzy')
+        return None
+
+    def match_key(self, key):
+        # type: (AddressKey) -> Optional[AddressMatch]
+        """Best match for an AddressKey, or None"""
+        if not key.street:
+            return None
+        for index, index_key, confidence, method in (
+                (self.exact, key, EXACT, 'exact'),
+                (self.street_postal_code, (key.street, key.postal_code),
+                 STREET_POSTAL_CODE, 'street_postal_code'),
+                (self.street_city_state, (key.street, key.city, key.state),
+                 STREET_CITY_STATE, 'street_city_state')):
+            indexes = index.get(index_key)
+            if indexes:
+                return self._result(indexes, confidence, method)
+        return self._fuzzy(key)
+
+    def match(self, state):
+        # type: (Mapping[str, Any]) -> Optional[AddressMatch]
+        """Best match for a SEED property state, or None"""
+        return self.match_key(seed_address_key(state))
+
+    def match_many(self, states):
+        # type: (Iterable[Mapping[str, Any]]) -> Iterator[Tuple[Mapping, Optional[AddressMatch]]]
+        """(state, match) for each SEED property state"""
+        for state in states:
+            yield state, self.match(state)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Write-behind batching of BES update calls.
+
+Scripts that configure a building field by field tend to call e.g.
+update_resource('water_heater', id, ...) several times for the same
+resource. A BatchSession buffers these calls and, when flushed, merges all
+calls made against the same target into a single request.
+"""
+
+# Imports from Standard Library
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Imports from Third Party Modules
+from requests import RequestException
+
+# Local Imports
+from pybes.pybes import (
+    BESClient,
+    BESError,
+    _get_block_resource,
+    _get_resource_name,
+)
+
+# Constants
+MAX_WORKERS = 4
+
+
+# Data Structure Definitions
+class _BufferedCall(object):
+    """A (merged) pending call to a BESClient update method."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, method, args):
+        # type: (str, Tuple) -> None
+        self.method = method
+        self.args = args
+        self.kwargs = {}            # type: Dict[str, Any]
+        self.extras = None          # type: Optional[Dict[str, Any]]
+        self.count = 0
+
+    def merge(self, args, kwargs, extras=None):
+        # type: (Tuple, Dict, Optional[Dict]) -> None
+        """Merge a later call into this one, later values win."""
+        self.args = args
+        self.kwargs.update(
+            {key: val for key, val in kwargs.items() if val is not None}
+        )
+        if extras:
+            if self.extras is None:
+                self.extras = {}
+            self.extras.update(extras)
+        self.count += 1
+
+    def send(self, client):
+        # type: (BESClient) -> Any
+        """Make the call using client."""
+        kwargs = self.kwargs.copy()
+        if self.extras is not None:
+            kwargs['extras'] = self.extras
+        return getattr(client, self.method)(*self.args, **kwargs)
+
+
+# Public Classes and Functions
+class BatchSession(object):
+    """
+    Buffer update calls and send one request per target on flush.
+
+    Supports update_resource, update_block_resource, update_block and
+    update_preview_building, with the same signatures as BESClient.
+    Calls against the same target (e.g. the same water heater) are merged,
+    if a field is set more than once the last value wins. Targets are
+    flushed in parallel.
+
+    Used as a context manager the session is flushed on exit, unless an
+    exception was raised in which case the buffered calls are discarded::
+
+        with BatchSession(client) as batch:
+            batch.update_resource(
+                'water_heater', wh_id, tank_insulation_r_value=11
+            )
+            batch.update_resource('water_heater', wh_id, fuel_type_id=3)
+
+    results in a single PUT to water_heaters/wh_id.
+    """
+
+    def __init__(self, client, max_workers=MAX_WORKERS):
+        # type: (BESClient, int) -> None
+        """
+        :param client: client used to send the merged calls
+        :type client: BESClient
+        :param max_workers: max number of targets to flush concurrently
+        :type max_workers: int
+        """
+        self.client = client
+        self.max_workers = max_workers
+        self.results = {}           # type: Dict[Hashable, Any]
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+        return False
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _buffer(self, key, method, args, kwargs, extras=None):
+        # type: (Hashable, str, Tuple, Dict, Optional[Dict]) -> None
+        """Add call to buffer, merging with any pending call for key."""
+        with self._lock:
+            call = self._pending.get(key)
+            if not call:
+                call = self._pending[key] = _BufferedCall(method, args)
+            call.merge(args, kwargs, extras=extras)
+
+    def update_resource(self, resource_name, id, **kwargs):
+        """Buffer a call to BESClient.update_resource"""
+        # pylint: disable=redefined-builtin,invalid-name
+        # converted here so invalid names are caught when called
+        endpoint = _get_resource_name(resource_name)
+        self._buffer(
+            ('update_resource', endpoint, str(id)),
+            'update_resource', (endpoint, id), kwargs
+        )
+
+    def update_block_resource(self, block_resource, block_resource_id,
+                              resource_id, **kwargs):
+        """Buffer a call to BESClient.update_block_resource"""
+        endpoint, _ = _get_block_resource(block_resource)
+        self._buffer(
+            ('update_block_resource', endpoint, str(block_resource_id)),
+            'update_block_resource',
+            (block_resource, block_resource_id, resource_id), kwargs
+        )
+
+    def update_block(self, id, shape_id, **kwargs):
+        """Buffer a call to BESClient.update_block"""
+        # pylint: disable=redefined-builtin,invalid-name
+        self._buffer(
+            ('update_block', str(id)), 'update_block', (id, shape_id), kwargs
+        )
+
+    def update_preview_building(self, building_id, block_id, extras=None,
+                                **kwargs):
+        """Buffer a call to BESClient.update_preview_building"""
+        self._buffer(
+            ('update_preview_building', str(building_id), str(block_id)),
+            'update_preview_building', (building_id, block_id), kwargs,
+            extras=extras
+        )
+
+    def discard(self):
+        # type: () -> None
+        """Drop all buffered calls without sending them."""
+        with self._lock:
+            self._pending.clear()
+
+    def flush(self):
+        # type: () -> Dict[Hashable, Any]
+        """
+        Send all buffered calls, one per target, in parallel.
+
+        :returns: return value of each call keyed by target
+        :rtype: dict
+        :raises: BESError if any call fails (with a BESError or a requests
+                 exception e.g. ReadTimeout), the error has results and
+                 errors attributes (both dicts keyed by target).
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = OrderedDict()
+        if not pending:
+            return {}
+        results = OrderedDict()
+        errors = OrderedDict()
+        workers = max(1, min(self.max_workers, len(pending)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                (key, executor.submit(call.send, self.client))
+                for key, call in pending.items()
+            ]
+            for key, future in futures:
+                try:
+                    results[key] = future.result()
+                except (BESError, RequestException) as err:
+                    errors[key] = err
+        self.results.update(results)
+        if errors:
+            msg = "Unable to flush {} of {} batched updates: {}".format(
+                len(errors), len(pending),
+                "; ".join(str(err) for err in errors.values())
+            )
+            raise BESError(msg, results=results, errors=errors)
+        return results
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Declarative creation of v1 buildings.
+
+Creating a v1 building means create_building, then create_block for each
+block, then create_resource/create_block_resource/attach_block_resource
+calls that need the ids returned by the earlier calls. BuildingBuilder
+collects a description of the building up front, works out which calls
+depend on which and runs independent calls concurrently. If any call fails
+everything created so far is deleted again.
+
+Example::
+
+    builder = BuildingBuilder(client)
+    bldg = builder.building(
+        'building', assessment_type_id=1, name='Example',
+        year_of_construction=1990, address='123 Street', city='Boring',
+        state='OR', zip_code='97009', reported_floor_area=10000
+    )
+    block = builder.block('block', building_id=bldg, shape_id=1, ...)
+    heater = builder.resource(
+        'heater', 'water_heater', building_id=bldg, fuel_type_id=1
+    )
+    builder.attach(
+        'block_heater', 'water_heater', block_id=block, resource_id=heater
+    )
+    results = builder.build()
+    building_id = results['building']['id']
+"""
+
+# Imports from Standard Library
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Mapping, Sequence, Set
+
+# Imports from Third Party Modules
+from requests import RequestException
+
+# Local Imports
+from pybes.pybes import BESClient, BESError
+
+# Constants
+MAX_WORKERS = 4
+
+
+# Data Structure Definitions
+class Ref(object):
+    """
+    Placeholder for a value returned by an earlier step.
+
+    The value is looked up in the (json) result of the step called label,
+    using key, when the step that uses it runs.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, label, key='id'):
+        # type: (str, str) -> None
+        self.label = label
+        self.key = key
+
+    def __repr__(self):
+        return '<Ref: {}[{}]>'.format(self.label, self.key)
+
+    def resolve(self, results):
+        # type: (Mapping[str, Mapping]) -> Any
+        """Get value from results of earlier steps"""
+        return results[self.label][self.key]
+
+
+class _Step(object):
+    """A single client call in a build plan"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, label, method, args, kwargs):
+        # type: (str, str, Sequence, Dict) -> None
+        self.label = label
+        self.method = method
+        self.args = tuple(args)
+        self.kwargs = kwargs
+        self.deps = set(
+            val.label for val in list(self.args) + list(kwargs.values())
+            if isinstance(val, Ref)
+        )
+
+    def resolve(self, results):
+        """Return args, kwargs with any Refs replaced by their values"""
+        args = tuple(
+            val.resolve(results) if isinstance(val, Ref) else val
+            for val in self.args
+        )
+        kwargs = {
+            key: val.resolve(results) if isinstance(val, Ref) else val
+            for key, val in self.kwargs.items()
+        }
+        return args, kwargs
+
+
+# Private Functions
+def _delete_created(client, method, args, obj_id):
+    # type: (BESClient, str, Sequence, int) -> None
+    """Delete an object created by (create) method called with args"""
+    if method == 'create_building':
+        client.delete_building(obj_id)
+    elif method == 'create_block':
+        client.delete_block(obj_id)
+    elif method == 'create_resource':
+        client.delete_resource(args[0], obj_id)
+    else:
+        # create_block_resource, attach_block_resource
+        client.delete_block_resource(args[0], obj_id)
+
+
+# Public Classes and Functions
+class BuildingBuilder(object):
+    """
+    Describe a v1 building, its blocks and resources then create them.
+
+    Each method adds a step, identified by label, that calls the
+    corresponding BESClient create method with the supplied arguments and
+    returns a Ref to its result. Passing a Ref as an argument to another
+    step makes that step depend on it: it runs once the id is available.
+    Steps that do not depend on each other run concurrently.
+    """
+
+    def __init__(self, client, max_workers=MAX_WORKERS):
+        # type: (BESClient, int) -> None
+        """
+        :param client: client used to create the building
+        :type client: BESClient
+        :param max_workers: max number of concurrent api calls
+        :type max_workers: int
+        """
+        self.client = client
+        self.max_workers = max_workers
+        self.steps = OrderedDict()          # type: Dict[str, _Step]
+
+    def _add(self, label, method, *args, **kwargs):
+        # type: (str, str, *Any, **Any) -> Ref
+        """Add a step"""
+        if label in self.steps:
+            raise BESError("Step {} already exists".format(label))
+        self.steps[label] = _Step(label, method, args, kwargs)
+        return Ref(label)
+
+    def building(self, label, **kwargs):
+        # type: (str, **Any) -> Ref
+        """Add a create_building step"""
+        return self._add(label, 'create_building', **kwargs)
+
+    def block(self, label, **kwargs):
+        # type: (str, **Any) -> Ref
+        """Add a create_block step"""
+        return self._add(label, 'create_block', **kwargs)
+
+    def resource(self, label, resource_name, **kwargs):
+        # type: (str, str, **Any) -> Ref
+        """Add a create_resource step"""
+        return self._add(label, 'create_resource', resource_name, **kwargs)
+
+    def block_resource(self, label, block_resource, **kwargs):
+        # type: (str, str, **Any) -> Ref
+        """Add a create_block_resource step"""
+        return self._add(
+            label, 'create_block_resource', block_resource, **kwargs
+        )
+
+    def attach(self, label, block_resource, **kwargs):
+        # type: (str, str, **Any) -> Ref
+        """Add an attach_block_resource step"""
+        return self._add(
+            label, 'attach_block_resource', block_resource, **kwargs
+        )
+
+    def plan(self):
+        # type: () -> List[List[str]]
+        """
+        Order steps by dependency.
+
+        :returns: lists of step labels, each step only depends on steps
+                  in earlier lists, steps in the same list are independent.
+        :raises: BESError if a step depends on an unknown step or there is
+                 a dependency cycle.
+        """
+        for step in self.steps.values():
+            unknown = step.deps.difference(self.steps)
+            if unknown:
+                msg = "Step {} depends on unknown step(s): {}".format(
+                    step.label, ", ".join(sorted(unknown))
+                )
+                raise BESError(msg)
+        levels = []
+        done = set()            # type: Set[str]
+        remaining = list(self.steps.values())
+        while remaining:
+            level = [
+                step.label for step in remaining if step.deps.issubset(done)
+            ]
+            if not level:
+                msg = "Dependency cycle between steps: {}".format(
+                    ", ".join(step.label for step in remaining)
+                )
+                raise BESError(msg)
+            levels.append(level)
+            done.update(level)
+            remaining = [
+                step for step in remaining if step.label not in done
+            ]
+        return levels
+
+    def _run_step(self, step, results):
+        # type: (_Step, Mapping[str, Mapping]) -> Any
+        """Call client method for step"""
+        args, kwargs = step.resolve(results)
+        return getattr(self.client, step.method)(*args, **kwargs)
+
+    def rollback(self, results, created):
+        # type: (Mapping[str, Mapping], Sequence[str]) -> Dict[str, Exception]
+        """
+        Delete created objects, most recent first.
+
+        :param results: results of steps, keyed by label
+        :param created: labels of steps that created an object, in order
+        :returns: errors raised while deleting, keyed by label
+        """
+        errors = OrderedDict()
+        for label in reversed(created):
+            step = self.steps[label]
+            try:
+                obj_id = results[label]['id']
+                _delete_created(self.client, step.method, step.args, obj_id)
+            except (BESError, RequestException, KeyError, TypeError) as err:
+                errors[label] = err
+        return errors
+
+    def build(self):
+        # type: () -> Dict[str, Any]
+        """
+        Create everything, running independent steps concurrently.
+
+        If a step fails no further steps are started and the objects
+        already created are deleted.
+
+        :returns: result of each step keyed by label
+        :rtype: dict
+        :raises: BESError, with failures, rollback_errors and results
+                 attributes, if a step fails.
+        """
+        self.plan()
+        results = OrderedDict()
+        created = []
+        failures = OrderedDict()
+        pending = OrderedDict(self.steps)
+        running = {}
+        workers = max(1, self.max_workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while pending or running:
+                if not failures:
+                    ready = [
+                        step for step in pending.values()
+                        if step.deps.issubset(results)
+                    ]
+                    for step in ready:
+                        del pending[step.label]
+                        future = executor.submit(
+                            self._run_step, step, dict(results)
+                        )
+                        running[future] = step.label
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    label = running.pop(future)
+                    try:
+                        results[label] = future.result()
+                        created.append(label)
+                    except Exception as err:    # pylint: disable=broad-except
+                        failures[label] = err
+        if failures:
+            rollback_errors = self.rollback(results, created)
+            msg = "Unable to build {}: {}".format(
+                ", ".join(failures),
+                "; ".join(str(err) for err in failures.values())
+            )
+            if rollback_errors:
+                msg = "{} (rollback failed for: {})".format(
+                    msg, ", ".join(rollback_errors)
+                )
+            raise BESError(
+                msg, failures=failures, rollback_errors=rollback_errors,
+                results=results
+            )
+        return results
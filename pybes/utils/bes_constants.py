@@ -13,10 +13,29 @@ IncompleteBldg = namedtuple(
     'IncompleteBldg', ('bldg_id', 'bldg_type', 'status')
 )
 
+# IncompleteBldg status of buildings skipped as an endpoint's circuit was
+# open (see pybes.breaker), they can be fetched again later
+DEFERRED = 'Deferred'
+
 ADDRESS_FIELDS = [
     'address_line_1', 'address_line_2', 'city', 'state', 'postal_code'
 ]
 
+# USPS standard suffix and directional abbreviations, used to normalize
+# addresses for comparison
+ADDRESS_ABBREVIATIONS = {
+    'alley': 'aly', 'apartment': 'apt', 'avenue': 'ave',
+    'boulevard': 'blvd', 'building': 'bldg', 'center': 'ctr',
+    'circle': 'cir', 'court': 'ct', 'drive': 'dr', 'expressway': 'expy',
+    'floor': 'fl', 'freeway': 'fwy', 'highway': 'hwy', 'lane': 'ln',
+    'parkway': 'pkwy', 'place': 'pl', 'plaza': 'plz', 'road': 'rd',
+    'room': 'rm', 'square': 'sq', 'street': 'st', 'suite': 'ste',
+    'terrace': 'ter', 'trail': 'trl', 'way': 'wy',
+    'north': 'n', 'south': 's', 'east': 'e', 'west': 'w',
+    'northeast': 'ne', 'northwest': 'nw', 'southeast': 'se',
+    'southwest': 'sw',
+}
+
 UPDATE_FIELDS_TO_EXCLUDE = (
     'status_type_id', 'id', 'address', 'zip_code', 'state', 'user_id',
     'year_of_construction', 'total_floor_area', 'name', 'city', 'updated_at'
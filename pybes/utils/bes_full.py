@@ -10,23 +10,44 @@ Functions for getting report and details from BES 'Full' buildings
 
 # Imports from Standard Library
 import logging
-from typing import Dict, List, Mapping, Optional, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
 
 # Imports from Third Party Modules
 from frozendict import frozendict
 from requests.exceptions import ReadTimeout
 
 # Local Imports
+from pybes.breaker import CircuitOpenError
 from pybes.pybes import BESClient, BESError
-from pybes.utils.bes_constants import IncompleteBldg
+from pybes.utils.bes_constants import DEFERRED, IncompleteBldg
 from pybes.utils.bes_preview import get_bes_preview_report
-from pybes.utils.bes_utils import get_full_bldg_status_map
+from pybes.utils.bes_utils import (
+    fetch_concurrently,
+    get_full_bldg_status_map,
+)
 
 # Setup
 
 # Constants
 log = logging.getLogger(__name__)            # pylint: disable-msg=invalid-name
 
+# building fields get_bes_buildings(stream=True) keeps from the listing,
+# details of rated buildings are fetched with their score
+LISTING_FIELDS = ('id', 'status_type_id', 'updated_at')
+
 
 # Data Structure Definitions
 
@@ -48,6 +69,21 @@ def _get_full_bldg_pdf_url(building_id, base_url):
     return pdf_url_format.format(base_url, building_id)
 
 
+def _map_bounded(executor, func, iterable, window):
+    # type: (Any, Callable, Iterable, int) -> Iterator[Any]
+    """
+    executor.map(func, iterable), but only taking items from iterable as
+    results are consumed, so at most window calls are pending
+    """
+    futures = deque()               # type: deque
+    for item in iterable:
+        futures.append(executor.submit(func, item))
+        if len(futures) >= window:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
 def _get_property_type(bes_building):
     # type: (Dict) -> str
     """Get property type from BES building"""
@@ -61,9 +97,17 @@ def _get_property_type(bes_building):
 # Public Classes and Functions
 
 def initiate_full_simulation(client, building_id, status_map=None,
-                             logger=log, **bes_kwargs):
+                             logger=log, negative_cache=None,
+                             updated_at=None, status=None, **bes_kwargs):
     # type: (BESClient, int) -> str
-    """Initiate BES simulation for BES building matching building_id"""
+    """
+    Initiate BES simulation for BES building matching building_id
+
+    If negative_cache (a pybes.cache.NegativeCache) is supplied a failed
+    validation is recorded in it against building_id and updated_at.
+    If status (the building's current status) is supplied it is returned
+    when validation fails, rather than fetching the unchanged building.
+    """
     if not status_map:
         status_map = get_full_bldg_status_map(**bes_kwargs)
     if not building_id or not isinstance(building_id, int):
@@ -72,31 +116,62 @@ def initiate_full_simulation(client, building_id, status_map=None,
     try:
         client.validate_building(building_id)
         client.simulate_building(building_id)
+    except CircuitOpenError:
+        raise
     except BESError as err:
         msg = 'Error validating or simulating: {}'.format(err)
         logger.error(msg)
+        if negative_cache is not None:
+            negative_cache.record('simulate', building_id, updated_at, err)
+        if status:
+            return status
     status_id = client.get_building(building_id)['status_type_id']
     return status_map.get(status_id)
 
 
 def get_bes_full_report(client, building, status_map=None,
-                        logger=log, **bes_kwargs):
+                        logger=log, negative_cache=None, executor=None,
+                        **bes_kwargs):
     # type: (BESClient, Dict) -> Tuple[Mapping, str]
-    """Get full report (long form and scores) from BES for 'Rated' building"""
+    """
+    Get full report (long form and scores) from BES for 'Rated' building
+
+    building may be a summary (id and status_type_id), in which case its
+    details are fetched concurrently with the score, using executor if
+    supplied.
+    If negative_cache (a pybes.cache.NegativeCache) is supplied, calls that
+    failed for the building at its current updated_at are not repeated.
+    """
     complete_report = None
     building_id = building.get('id')
+    updated_at = building.get('updated_at')
     if not status_map:
         status_map = get_full_bldg_status_map(**bes_kwargs)
     status = status_map.get(building['status_type_id'])
 
     if status != 'Running' and status != 'Rated':
+        if negative_cache is not None and negative_cache.get(
+                'simulate', building_id, updated_at):
+            return complete_report, status
         status = initiate_full_simulation(
-            client, building_id, status_map=status_map, logger=logger
+            client, building_id, status_map=status_map, logger=logger,
+            negative_cache=negative_cache, updated_at=updated_at,
+            status=status
         )
 
+    if status == 'Rated' and negative_cache is not None and negative_cache.get(
+            'score', building_id, updated_at):
+        return complete_report, status
+
     if status == 'Rated':
         try:
-            score_report = client.get_building_score(building_id)
+            if 'floors' in building:
+                score_report = client.get_building_score(building_id)
+            else:
+                score_report, building = fetch_concurrently([
+                    lambda: client.get_building_score(building_id),
+                    lambda: client.get_building(building_id),
+                ], executor=executor)
             pdf_url = _get_full_bldg_pdf_url(
                 building_id, bes_kwargs['base_url']
             )
@@ -115,19 +190,47 @@ def get_bes_full_report(client, building, status_map=None,
             complete_report.update(additional_facts)
             complete_report.update(score_report.get('score', {}))
             complete_report = frozendict(complete_report)
+        except CircuitOpenError:
+            raise
         except BESError as err:
             msg = "Error getting score for full building: {}".format(err)
             logger.error(msg)
+            if negative_cache is not None:
+                negative_cache.record('score', building_id, updated_at, err)
     return complete_report, status
 
 
 def get_bes_buildings(incomplete, bes_ids=None, full_bldg=False,
-                      status_map=None, logger=log, **bes_kwargs):
+                      status_map=None, logger=log, max_workers=None,
+                      negative_cache=None, stream=False, **bes_kwargs):
     # type: (list, Optional[List[int]]) -> Dict
-    """Get buildings with score report from BES api"""
+    """
+    Get buildings with score report from BES api
+
+    If max_workers is set reports are fetched concurrently by that many
+    threads. Buildings are still yielded in the order they were listed.
+
+    If stream is set the listing is parsed as it is downloaded (see
+    pybes.streaming), keeping only LISTING_FIELDS of each building, so
+    the listing held in memory is small. It is still read in full before
+    reports are fetched, so a listing cut off by the server is an error
+    (logged, as for the whole listing) rather than a partial run.
+
+    The status in the listing decides which calls each building needs:
+    none for buildings already running, validate and simulate for those
+    not yet rated, and the report for rated ones, with any building
+    details needed fetched alongside it.
+
+    Buildings whose report calls hit an open circuit (see pybes.breaker)
+    are added to incomplete with status DEFERRED.
+
+    If negative_cache (a pybes.cache.NegativeCache) is supplied, buildings
+    whose validation or score failed are not retried until their
+    updated_at changes or the entry expires.
+    """
     if not status_map:
         status_map = get_full_bldg_status_map(**bes_kwargs)
-    bes_preview_ids = []
+    bes_preview_ids = set()             # type: Set[int]
     bes_buildings = []
     client = BESClient(**bes_kwargs)
     if bes_ids:
@@ -137,41 +240,82 @@ def get_bes_buildings(incomplete, bes_ids=None, full_bldg=False,
                 bes_buildings.append(client.get_building(bldg_id))
             else:
                 bes_buildings.append(client.get_preview_building(bldg_id))
-                bes_preview_ids = bes_ids
+                bes_preview_ids = set(bes_ids)
+    elif stream:
+        try:
+            bes_preview_ids = set(
+                bldg['building_id'] for bldg in
+                client.iter_preview_buildings(fields=('building_id',))
+            )
+            # read to the end before any reports are fetched, rather than
+            # holding the listing open for the whole run
+            bes_buildings = list(
+                client.iter_buildings(fields=LISTING_FIELDS)
+            )
+        except (BESError, ReadTimeout) as err:
+            msg = 'Error downloading: {}'.format(err)
+            log.error(msg)
     else:
         try:
             bes_buildings = client.list_buildings()
 
             bes_preview_bldgs = client.list_preview_buildings()
-            bes_preview_ids = [
+            bes_preview_ids = set(
                 bldg['building_id'] for bldg in bes_preview_bldgs
-            ]
+            )
         except (BESError, ReadTimeout) as err:
             msg = 'Error downloading: {}'.format(err)
             log.error(msg)
-    for bldg in bes_buildings:
+
+    def get_report(bldg):
+        # type: (Dict) -> Tuple[Optional[Mapping], str, int, str]
+        """Get report for preview or full building"""
         try:
             bldg_id = bldg['id']
             status = status_map.get(bldg['status_type_id'])
         except KeyError:
             bldg_id = bldg['building_id']
             status = bldg['status!']
-        if bldg_id in bes_preview_ids:
-            building, status = get_bes_preview_report(
-                client, bldg_id, status=status, logger=logger
-            )
-            bes_type = 'Preview'
-        else:
-            building, status = get_bes_full_report(
-                client, bldg, status_map=status_map, logger=logger,
-                **bes_kwargs
-            )
-            bes_type = 'Full'
+        bes_type = 'Preview' if bldg_id in bes_preview_ids else 'Full'
+        try:
+            if bes_type == 'Preview':
+                building, status = get_bes_preview_report(
+                    client, bldg_id, status=status, logger=logger,
+                    negative_cache=negative_cache,
+                    updated_at=bldg.get('updated_at'), executor=fetcher
+                )
+            else:
+                building, status = get_bes_full_report(
+                    client, bldg, status_map=status_map, logger=logger,
+                    negative_cache=negative_cache, executor=fetcher,
+                    **bes_kwargs
+                )
+        except CircuitOpenError as err:
+            logger.warning('Deferred %s: %s', bldg_id, err)
+            building, status = None, DEFERRED
+        return building, bes_type, bldg_id, status
 
-        if not building:
-            incomplete_bldg = IncompleteBldg(
-                bldg_id=bldg_id, bldg_type=bes_type, status=status
-            )
-            incomplete.append(incomplete_bldg)
-        else:
-            yield building, bes_type
+    # reports and building details are fetched concurrently in their own
+    # executor, as get_report may already be running in executor
+    fetcher = ThreadPoolExecutor(max_workers=max_workers or 1)
+    if max_workers:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        reports = _map_bounded(
+            executor, get_report, bes_buildings, 2 * max_workers
+        )
+    else:
+        executor = None
+        reports = (get_report(bldg) for bldg in bes_buildings)
+    try:
+        for building, bes_type, bldg_id, status in reports:
+            if not building:
+                incomplete_bldg = IncompleteBldg(
+                    bldg_id=bldg_id, bldg_type=bes_type, status=status
+                )
+                incomplete.append(incomplete_bldg)
+            else:
+                yield building, bes_type
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+        fetcher.shutdown(wait=True)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Idempotent preview building creation.
+
+If a create_preview_building call times out (or fails with a 5xx error)
+the building may or may not have been created, and simply retrying can
+create a duplicate. create_preview_building() here keys each creation on
+the building's normalized name, address and year and keeps a local
+CreationIndex of the ids created. After a failure it looks for the
+building with list_preview_buildings before trying again, and returns
+the stored result if the same building is created twice::
+
+    index = CreationIndex('creations.db')
+    building = create_preview_building(client, index, **building_kwargs)
+
+The index is shared safely between threads and processes: a creation in
+progress is claimed, and other callers wait for it to finish.
+"""
+
+# Imports from Standard Library
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Mapping, Optional, Set
+
+# Imports from Third Party Modules
+from requests.exceptions import ConnectionError, Timeout
+
+# Local Imports
+from pybes.pybes import APIError, BESClient, BESError
+from pybes.utils.bes_utils import normalize_address
+
+# Constants
+log = logging.getLogger(__name__)            # pylint: disable-msg=invalid-name
+
+PENDING = 'pending'
+CREATED = 'created'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS creations (
+    key TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    building_id INTEGER,
+    response TEXT,
+    owner TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS creations_building_id
+    ON creations (building_id);
+"""
+
+
+# Private Functions
+def _is_ambiguous(err):
+    # type: (Exception) -> bool
+    """True if the building may have been created despite err"""
+    if isinstance(err, (Timeout, ConnectionError)):
+        return True
+    return isinstance(err, APIError) and (
+        getattr(err, 'status_code', None) or 0
+    ) >= 500
+
+
+def _building_key(building):
+    # type: (Mapping[str, Any]) -> str
+    """creation_key for a preview building as returned by the api"""
+    return creation_key(
+        building.get('name'), building.get('address'), building.get('city'),
+        building.get('state'), building.get('zip_code'),
+        building.get('year_of_construction')
+    )
+
+
+# Public Classes and Functions
+def creation_key(name, street, city, state, postal_code, year):
+    # type: (Any, Any, Any, Any, Any, Any) -> str
+    """
+    Key identifying a building by normalized name, address and year.
+
+    Only the first five digits of the postal code are used.
+    """
+    parts = [
+        normalize_address(name), normalize_address(street),
+        normalize_address(city), normalize_address(state),
+        normalize_address(postal_code)[:5],
+        str(int(year)) if year else '',
+    ]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+class CreationIndex(object):
+    """
+    SQLite index of buildings created, by creation_key. Safe to share
+    between threads and processes.
+    """
+
+    def __init__(self, path, lease=120, timeout=30, clock=time.time):
+        # type: (str, float, float, Callable[[], float]) -> None
+        """
+        :param path: database file, created if it does not exist
+        :param lease: seconds after which a creation claimed by another
+            caller is assumed abandoned (e.g. the process died)
+        :param timeout: seconds to wait for a database lock
+        :param clock: function returning the current time
+        """
+        self.path = path
+        self.lease = lease
+        self.timeout = timeout
+        self.clock = clock
+        self._local = threading.local()
+        self._conn.executescript(SCHEMA)
+
+    @property
+    def _conn(self):
+        # type: () -> sqlite3.Connection
+        """This thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        # type: () -> None
+        """Close this thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def get(self, key):
+        # type: (str) -> Optional[Dict[str, Any]]
+        """Index entry for key"""
+        row = self._conn.execute(
+            'SELECT state, building_id, response, owner, attempts, '
+            'updated_at FROM creations WHERE key = ?', (key,)
+        ).fetchone()
+        if not row:
+            return None
+        entry = dict(zip(
+            ('state', 'building_id', 'response', 'owner', 'attempts',
+             'updated_at'), row
+        ))
+        if entry['response']:
+            entry['response'] = json.loads(entry['response'])
+        return entry
+
+    def claim(self, key, owner):
+        # type: (str, str) -> Dict[str, Any]
+        """
+        Claim key for creation by owner, unless it is created or claimed
+        by another owner within the lease.
+
+        :returns: entry, claimed by owner if entry['owner'] == owner
+        """
+        now = self.clock()
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR IGNORE INTO creations '
+                '(key, state, owner, updated_at) VALUES (?, ?, ?, ?)',
+                (key, PENDING, owner, now)
+            )
+            conn.execute(
+                'UPDATE creations SET owner = ?, updated_at = ? '
+                'WHERE key = ? AND state = ? '
+                'AND (owner IS NULL OR updated_at < ?)',
+                (owner, now, key, PENDING, now - self.lease)
+            )
+            entry = self.get(key)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return entry
+
+    def attempt(self, key, owner):
+        # type: (str, str) -> None
+        """Record a creation attempt, renewing owner's claim"""
+        self._conn.execute(
+            'UPDATE creations SET attempts = attempts + 1, updated_at = ? '
+            'WHERE key = ? AND owner = ?', (self.clock(), key, owner)
+        )
+
+    def record(self, key, building_id, response):
+        # type: (str, int, Any) -> None
+        """Record building created for key"""
+        self._conn.execute(
+            'UPDATE creations SET state = ?, building_id = ?, response = ?, '
+            'owner = NULL, updated_at = ? WHERE key = ?',
+            (CREATED, int(building_id), json.dumps(response), self.clock(),
+             key)
+        )
+
+    def release(self, key, owner):
+        # type: (str, str) -> None
+        """Drop owner's claim on key, when creation definitely failed"""
+        self._conn.execute(
+            'DELETE FROM creations WHERE key = ? AND state = ? AND owner = ?',
+            (key, PENDING, owner)
+        )
+
+    def abandon(self, key, owner):
+        # type: (str, str) -> None
+        """Drop owner's claim on key, leaving the outcome unknown"""
+        self._conn.execute(
+            'UPDATE creations SET owner = NULL, updated_at = ? '
+            'WHERE key = ? AND state = ? AND owner = ?',
+            (self.clock(), key, PENDING, owner)
+        )
+
+    def building_ids(self):
+        # type: () -> Set[int]
+        """Ids of buildings in the index"""
+        return set(
+            row[0] for row in self._conn.execute(
+                'SELECT building_id FROM creations '
+                'WHERE building_id IS NOT NULL'
+            )
+        )
+
+
+def find_preview_building(client, index, key, name):
+    # type: (BESClient, CreationIndex, str, str) -> Optional[Dict]
+    """
+    Look for an unindexed preview building matching key.
+
+    list_preview_buildings only returns names, so buildings with a
+    matching name are fetched (newest first) to compare addresses.
+
+    :returns: building or None if not found
+    """
+    known = index.building_ids()
+    name = normalize_address(name)
+    candidates = sorted(
+        (
+            int(bldg['building_id'])
+            for bldg in client.list_preview_buildings()
+            if normalize_address(bldg.get('name')) == name
+            and int(bldg['building_id']) not in known
+        ),
+        reverse=True
+    )
+    for building_id in candidates:
+        building = client.get_preview_building(building_id)
+        if _building_key(building) == key:
+            building.setdefault('building_id', building_id)
+            return building
+    return None
+
+
+def create_preview_building(client, index, retries=2, poll_interval=1,
+                            sleep=time.sleep, **building):
+    # type: (BESClient, CreationIndex, int, float, Callable[[float], None], **Any) -> Dict
+    """
+    Create a preview building at most once.
+
+    Returns the indexed result if the building was already created. If an
+    earlier attempt failed in a way that may have created it (timeout,
+    connection error or 5xx response) the account's preview buildings are
+    checked before creating it again. Waits if another caller is creating
+    the same building.
+
+    :param client: BESClient
+    :param index: CreationIndex
+    :param retries: times to retry after an ambiguous failure
+    :param poll_interval: seconds between checks while waiting for another
+        caller
+    :param building: BESClient.create_preview_building kwargs
+    :raises: BESError (inc APIError), or the last error if every attempt
+        failed ambiguously
+    :returns: building details (inc building_id)
+    """
+    # pylint: disable=too-many-arguments
+    key = creation_key(
+        building.get('building_name'), building.get('street'),
+        building.get('city'), building.get('state'),
+        building.get('postal_code'), building.get('year_completed')
+    )
+    owner = uuid.uuid4().hex
+    entry = index.claim(key, owner)
+    while entry['state'] == PENDING and entry['owner'] != owner:
+        sleep(poll_interval)
+        entry = index.claim(key, owner)
+    if entry['state'] == CREATED:
+        return entry['response']
+
+    error = None                                # type: Optional[Exception]
+    for attempt in range(retries + 1):
+        if attempt or entry['attempts']:
+            found = find_preview_building(
+                client, index, key, building.get('building_name')
+            )
+            if found:
+                log.info('Found preview building %s, not recreating',
+                         found['building_id'])
+                index.record(key, found['building_id'], found)
+                return found
+        index.attempt(key, owner)
+        try:
+            result = client.create_preview_building(**building)
+        except (BESError, Timeout, ConnectionError) as err:
+            if not _is_ambiguous(err):
+                if error or entry['attempts']:
+                    # an earlier attempt may still have succeeded
+                    index.abandon(key, owner)
+                else:
+                    index.release(key, owner)
+                raise
+            log.warning('create_preview_building failed (attempt %s): %s',
+                        attempt + 1, err)
+            error = err
+            continue
+        index.record(key, result['building_id'], result)
+        return result
+    # outcome unknown, left pending so the next call checks first
+    index.abandon(key, owner)
+    raise error
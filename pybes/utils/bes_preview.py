@@ -16,9 +16,11 @@ from typing import Any, Dict, Mapping, Optional, Tuple, Union
 from frozendict import frozendict
 
 # Local Imports
+from pybes.breaker import CircuitOpenError
 from pybes.pybes import BESClient, BESError
 from pybes.utils.bes_utils import (
     convert_bes_year,
+    fetch_concurrently,
     get_addr_line_str,
     get_bes_property_type,
 )
@@ -69,49 +71,96 @@ def _validate_bes_payload(payload):
 
 # Public Functions
 
-def create_bes_preview_bldg_from_seed(client, property_view):
-    # type: (BESClient, Mapping) -> Mapping
-    """Create new bes preview building from SEED PropertyView"""
+def create_bes_preview_bldg_from_seed(client, property_view, validator=None):
+    # type: (BESClient, Mapping, Any) -> Mapping
+    """
+    Create new bes preview building from SEED PropertyView
+
+    If validator (a bes_validation.PayloadValidator) is supplied the
+    payload is checked against it before the api is called, raising
+    ValidationError.
+    """
     payload = _create_bes_preview_payload(property_view)
     if not _validate_bes_payload(payload):
         msg = "One or more required values are Null: {}".format(payload)
         raise ValueError(msg)
+    if validator:
+        validator.check_preview(payload)
     return client.create_preview_building(**payload)
 
 
-def initiate_preview_simulation(client, building_id, logger=log):
-    # type: (BESClient, int) -> str
-    """Initiate BES simulation for BES building matching building_id"""
+def initiate_preview_simulation(client, building_id, logger=log,
+                                negative_cache=None, updated_at=None,
+                                status=None):
+    # type: (BESClient, int, Any, Any, Any, Optional[str]) -> str
+    """
+    Initiate BES simulation for BES building matching building_id
+
+    If negative_cache (a pybes.cache.NegativeCache) is supplied a failed
+    validation is recorded in it against building_id and updated_at.
+    If status (the building's current status) is supplied it is returned
+    when validation fails, rather than fetching the unchanged building.
+    """
     if not building_id or not isinstance(building_id, int):
         msg = "building_id must be an integer"
         raise ValueError(msg)
     try:
         client.validate_preview_building(building_id)
         client.simulate_preview_building(building_id)
+    except CircuitOpenError:
+        raise
     except BESError as err:
         msg = "Error validating or simulating: {}, Asset Score ID: {}".format(
             err, building_id
         )
         logger.error(msg)
+        if negative_cache is not None:
+            negative_cache.record('simulate', building_id, updated_at, err)
+        if status:
+            return status
     return client.get_preview_building(building_id)['status!']
 
 
-def get_bes_preview_report(client, building_id, status=None, logger=log):
-    # type: (BESClient, int, Optional[str]) -> Tuple[Mapping, str]
-    """Get full report (long form and scores) from BES for 'Rated' building"""
+def get_bes_preview_report(client, building_id, status=None, logger=log,
+                           negative_cache=None, updated_at=None,
+                           executor=None):
+    # type: (BESClient, int, Optional[str], Any, Any, Any, Any) -> Tuple[Mapping, str]
+    """
+    Get full report (long form and scores) from BES for 'Rated' building
+
+    Pass status if known (e.g. from a listing) to save fetching it.
+    If negative_cache (a pybes.cache.NegativeCache) is supplied, calls that
+    failed for the building at updated_at are not repeated.
+    The report and building are fetched concurrently, using executor if
+    supplied.
+    """
     complete_report = None
     if not status:
-        status = client.get_preview_building(building_id)['status!']
+        preview = client.get_preview_building(building_id)
+        status = preview['status!']
+        updated_at = updated_at or preview.get('updated_at')
     if status != 'Running' and status != 'Rated':
+        if negative_cache is not None and negative_cache.get(
+                'simulate', building_id, updated_at):
+            return complete_report, status
         status = initiate_preview_simulation(
-            client, building_id, logger=logger
+            client, building_id, logger=logger,
+            negative_cache=negative_cache, updated_at=updated_at,
+            status=status
         )
 
+    if status == 'Rated' and negative_cache is not None and negative_cache.get(
+            'score', building_id, updated_at):
+        return complete_report, status
+
     if status == 'Rated':
         try:
-            score_report = client.get_preview_building(
-                building_id, report_type='pdf'
-            )
+            score_report, complete_report = fetch_concurrently([
+                lambda: client.get_preview_building(
+                    building_id, report_type='pdf'
+                ),
+                lambda: client.get_building(building_id),
+            ], executor=executor)
             pdf_url = score_report.pop('pdf_url', None)
             score_report.pop('name', None)
             score_report.pop('id', None)
@@ -122,14 +171,17 @@ def get_bes_preview_report(client, building_id, status=None, logger=log):
                 'pdf_url': pdf_url,
             }
 
-            complete_report = client.get_building(building_id)
             complete_report.update(additional_facts)
             complete_report.update(score_report)
             complete_report = frozendict(complete_report)
+        except CircuitOpenError:
+            raise
         except BESError as err:
             msg = (
                 "Error getting score for preview building: {}, "
                 "Asset Score ID: {}".format(err, building_id)
             )
             logger.error(msg)
+            if negative_cache is not None:
+                negative_cache.record('score', building_id, updated_at, err)
     return complete_report, status
@@ -0,0 +1,584 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Durable work queue for splitting BES jobs across worker processes.
+
+WorkQueue stores (building id, stage) items in a SQLite database, so no
+broker is needed. Workers claim items with a lease and heartbeat while
+working on them; items whose lease expires (e.g. because the worker died)
+are handed out again. Items can pass through a pipeline of stages, with
+each stage's result stored and passed on to the next::
+
+    queue = WorkQueue('sync.db')
+    enqueue_buildings(queue, BESClient(**bes_kwargs))
+
+    # in each worker process
+    queue.work({'report': report_handler(bes_kwargs)})
+
+    for item in queue.results('report'):
+        ...
+
+By default the database uses WAL mode, which lets readers and a writer
+work concurrently, but requires every process to be on the same host.
+For workers on several hosts sharing a network filesystem pass wal=False
+(rollback journal, relies on the filesystem's locking).
+"""
+
+# Imports from Standard Library
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+# Local Imports
+from pybes.breaker import CircuitOpenError
+from pybes.pybes import BESClient, BESError
+from pybes.utils.bes_full import get_bes_full_report
+from pybes.utils.bes_preview import get_bes_preview_report
+from pybes.utils.bes_utils import get_full_bldg_status_map
+
+# Constants
+log = logging.getLogger(__name__)            # pylint: disable-msg=invalid-name
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    building_id INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    payload TEXT,
+    result TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    available_at REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL,
+    PRIMARY KEY (building_id, stage)
+);
+CREATE INDEX IF NOT EXISTS items_claim
+    ON items (status, stage, available_at);
+"""
+
+
+# Data Structure Definitions
+WorkItem = namedtuple(
+    'WorkItem', ['building_id', 'stage', 'payload', 'attempts', 'worker']
+)
+
+
+class LeaseLost(BESError):
+    """The item's lease expired and it was claimed by another worker"""
+    pass
+
+
+# Private Functions
+def _default_worker():
+    # type: () -> str
+    """Worker id: host:pid:thread"""
+    return '{}:{}:{}'.format(
+        socket.gethostname(), os.getpid(), threading.current_thread().ident
+    )
+
+
+def _dumps(obj):
+    # type: (Any) -> Optional[str]
+    """json or None"""
+    return None if obj is None else json.dumps(obj, default=str)
+
+
+def _loads(text):
+    # type: (Optional[str]) -> Any
+    """Value from json or None"""
+    return None if text is None else json.loads(text)
+
+
+# Public Classes and Functions
+class WorkQueue(object):
+    """
+    SQLite backed work queue of building ids and pipeline stages.
+
+    Safe to share between threads (each gets its own connection) and
+    between processes using the same database file.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, path, lease=300, max_attempts=5, retry_delay=60,
+                 wal=True, timeout=30, clock=time.time):
+        # type: (str, float, int, float, bool, float, Callable[[], float]) -> None
+        """
+        :param path: database file, created if it does not exist
+        :param lease: seconds a claim lasts without a heartbeat
+        :param max_attempts: attempts before an item is marked failed
+        :param retry_delay: seconds before a failed attempt is retried
+        :param wal: use WAL mode, all workers must be on one host
+        :param timeout: seconds to wait for a database lock
+        :param clock: function returning the current time
+        """
+        # pylint: disable=too-many-arguments
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.wal = wal
+        self.timeout = timeout
+        self.clock = clock
+        self._local = threading.local()
+        self._conn.executescript(SCHEMA)
+
+    @property
+    def _conn(self):
+        # type: () -> sqlite3.Connection
+        """This thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            if self.wal:
+                conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        # type: () -> _Transaction
+        """Write transaction, taking the lock up front"""
+        return _Transaction(self._conn)
+
+    def close(self):
+        # type: () -> None
+        """Close this thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # producers
+    def put(self, building_id, stage, payload=None, delay=0):
+        # type: (int, str, Any, float) -> bool
+        """
+        Add item, unless it is already queued.
+
+        :param building_id: building id
+        :param stage: pipeline stage
+        :param payload: json serializable data for the handler
+        :param delay: seconds before the item can be claimed
+        :returns: True if added
+        """
+        return self.put_many([(building_id, payload)], stage, delay) == 1
+
+    def put_many(self, items, stage, delay=0):
+        # type: (Iterable, str, float) -> int
+        """
+        Add items, skipping any already queued.
+
+        :param items: building ids or (building id, payload) pairs
+        :returns: number added
+        """
+        now = self.clock()
+        rows = []
+        for item in items:
+            building_id, payload = (
+                item if isinstance(item, (tuple, list)) else (item, None)
+            )
+            rows.append(
+                (int(building_id), stage, _dumps(payload), now + delay, now)
+            )
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO items '
+                '(building_id, stage, payload, available_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)', rows
+            )
+            return conn.total_changes - before
+
+    # workers
+    def requeue_expired(self):
+        # type: () -> int
+        """Return items with expired leases to the queue"""
+        with self._transaction() as conn:
+            return self._requeue_expired(conn)
+
+    def _requeue_expired(self, conn):
+        # type: (sqlite3.Connection) -> int
+        """requeue_expired inside a transaction"""
+        now = self.clock()
+        cursor = conn.execute(
+            'UPDATE items SET status = ?, worker = NULL, '
+            'lease_expires = NULL, updated_at = ? '
+            'WHERE status = ? AND lease_expires < ?',
+            (PENDING, now, CLAIMED, now)
+        )
+        if cursor.rowcount:
+            log.warning('Requeued %s items with expired leases',
+                        cursor.rowcount)
+        return cursor.rowcount
+
+    def claim(self, worker=None, stages=None, limit=1):
+        # type: (Optional[str], Optional[Sequence[str]], int) -> List[WorkItem]
+        """
+        Claim up to limit available items, requeueing expired leases first.
+
+        :param worker: worker id, default host:pid:thread
+        :param stages: only claim items in these stages
+        :param limit: max items to claim
+        """
+        worker = worker or _default_worker()
+        now = self.clock()
+        sql = (
+            'SELECT building_id, stage, payload, attempts FROM items '
+            'WHERE status = ? AND available_at <= ?'
+        )
+        params = [PENDING, now]                 # type: List[Any]
+        if stages:
+            sql += ' AND stage IN ({})'.format(', '.join('?' * len(stages)))
+            params.extend(stages)
+        sql += ' ORDER BY available_at, building_id LIMIT ?'
+        params.append(limit)
+        with self._transaction() as conn:
+            self._requeue_expired(conn)
+            rows = conn.execute(sql, params).fetchall()
+            conn.executemany(
+                'UPDATE items SET status = ?, worker = ?, lease_expires = ?, '
+                'attempts = attempts + 1, updated_at = ? '
+                'WHERE building_id = ? AND stage = ?',
+                [
+                    (CLAIMED, worker, now + self.lease, now, bid, stage)
+                    for bid, stage, _, _ in rows
+                ]
+            )
+        return [
+            WorkItem(bid, stage, _loads(payload), attempts + 1, worker)
+            for bid, stage, payload, attempts in rows
+        ]
+
+    def _update_claimed(self, item, sql, params):
+        # type: (WorkItem, str, Sequence) -> None
+        """Update item if still claimed by item.worker, else LeaseLost"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                sql + ' WHERE building_id = ? AND stage = ? '
+                'AND status = ? AND worker = ?',
+                list(params) + [
+                    item.building_id, item.stage, CLAIMED, item.worker
+                ]
+            )
+            if not cursor.rowcount:
+                raise LeaseLost(
+                    'Lease on {} {} lost'.format(item.building_id, item.stage),
+                    item=item
+                )
+
+    def heartbeat(self, item):
+        # type: (WorkItem) -> None
+        """Extend lease on item, raises LeaseLost if no longer held"""
+        now = self.clock()
+        self._update_claimed(
+            item, 'UPDATE items SET lease_expires = ?, updated_at = ?',
+            (now + self.lease, now)
+        )
+
+    def complete(self, item, result=None, next_stage=None):
+        # type: (WorkItem, Any, Optional[str]) -> None
+        """
+        Mark item done, storing result, and queue it for next_stage with
+        result as payload.
+        """
+        now = self.clock()
+        self._update_claimed(
+            item,
+            'UPDATE items SET status = ?, result = ?, lease_expires = NULL, '
+            'error = NULL, updated_at = ?',
+            (DONE, _dumps(result), now)
+        )
+        if next_stage:
+            self.put(item.building_id, next_stage, payload=result)
+
+    def fail(self, item, error, retry_delay=None):
+        # type: (WorkItem, Any, Optional[float]) -> bool
+        """
+        Record a failed attempt. The item is retried after retry_delay
+        until it has had max_attempts.
+
+        :returns: True if the item will be retried
+        """
+        now = self.clock()
+        retry = item.attempts < self.max_attempts
+        delay = self.retry_delay if retry_delay is None else retry_delay
+        self._update_claimed(
+            item,
+            'UPDATE items SET status = ?, error = ?, worker = NULL, '
+            'lease_expires = NULL, available_at = ?, updated_at = ?',
+            (PENDING if retry else FAILED, str(error), now + delay, now)
+        )
+        return retry
+
+    def defer(self, item, delay):
+        # type: (WorkItem, float) -> None
+        """Return item to the queue after delay, not counting the attempt"""
+        now = self.clock()
+        self._update_claimed(
+            item,
+            'UPDATE items SET status = ?, attempts = attempts - 1, '
+            'worker = NULL, lease_expires = NULL, available_at = ?, '
+            'updated_at = ?',
+            (PENDING, now + delay, now)
+        )
+
+    def work(self, handlers, pipeline=None, worker=None, batch=1,
+             poll_interval=5, exit_when_empty=True, sleep=time.sleep):
+        # type: (Dict[str, Callable[[WorkItem], Any]], Optional[Sequence[str]], Optional[str], int, float, bool, Callable) -> int
+        """
+        Claim and process items until the queue is drained.
+
+        Leases are renewed by a heartbeat thread while handlers run. A
+        handler's return value is stored as the item's result; if pipeline
+        lists a later stage the item is then queued for it. Exceptions
+        raised by handlers are recorded with fail(), except CircuitOpenError
+        (see pybes.breaker) which defers the item until its circuit is
+        probed.
+
+        :param handlers: handler for each stage, called with the WorkItem
+        :param pipeline: ordered stages
+        :param worker: worker id
+        :param batch: items claimed at a time
+        :param poll_interval: seconds to wait when nothing is available
+        :param exit_when_empty: return when no items are pending or claimed
+        :returns: number of items processed
+        """
+        # pylint: disable=too-many-arguments
+        worker = worker or _default_worker()
+        pipeline = list(pipeline or [])
+        processed = 0
+        while True:
+            items = self.claim(worker, stages=list(handlers), limit=batch)
+            if not items:
+                if exit_when_empty and not self.remaining(list(handlers)):
+                    return processed
+                sleep(poll_interval)
+                continue
+            with _Heartbeat(self, items) as heartbeat:
+                for item in items:
+                    self._process(item, handlers, pipeline)
+                    heartbeat.discard(item)
+                    processed += 1
+
+    def _process(self, item, handlers, pipeline):
+        # type: (WorkItem, Dict[str, Callable], List[str]) -> None
+        """Run handler for item, completing or failing it"""
+        try:
+            result = handlers[item.stage](item)
+        except LeaseLost:
+            raise
+        except CircuitOpenError as err:
+            log.warning('%s %s deferred: %s', item.building_id, item.stage,
+                        err)
+            try:
+                self.defer(item, err.retry_after)
+            except LeaseLost as lost:
+                log.warning('%s', lost)
+            return
+        except Exception as err:            # pylint: disable=broad-except
+            log.error('%s %s failed (attempt %s): %s', item.building_id,
+                      item.stage, item.attempts, err)
+            try:
+                self.fail(item, err)
+            except LeaseLost as lost:
+                log.warning('%s', lost)
+            return
+        next_stage = None
+        if item.stage in pipeline:
+            idx = pipeline.index(item.stage) + 1
+            next_stage = pipeline[idx] if idx < len(pipeline) else None
+        try:
+            self.complete(item, result=result, next_stage=next_stage)
+        except LeaseLost as lost:
+            log.warning('%s, result discarded', lost)
+
+    # inspection
+    def remaining(self, stages=None):
+        # type: (Optional[Sequence[str]]) -> int
+        """Number of pending or claimed items"""
+        sql = 'SELECT COUNT(*) FROM items WHERE status IN (?, ?)'
+        params = [PENDING, CLAIMED]
+        if stages:
+            sql += ' AND stage IN ({})'.format(', '.join('?' * len(stages)))
+            params.extend(stages)
+        return self._conn.execute(sql, params).fetchone()[0]
+
+    def counts(self):
+        # type: () -> Dict[str, Dict[str, int]]
+        """Item counts by stage and status"""
+        counts = {}                     # type: Dict[str, Dict[str, int]]
+        for stage, status, count in self._conn.execute(
+                'SELECT stage, status, COUNT(*) FROM items '
+                'GROUP BY stage, status'):
+            counts.setdefault(stage, {})[status] = count
+        return counts
+
+    def results(self, stage):
+        # type: (str) -> Iterable[Any]
+        """Results of completed items in stage"""
+        cursor = self._conn.execute(
+            'SELECT result FROM items WHERE stage = ? AND status = ? '
+            'ORDER BY building_id', (stage, DONE)
+        )
+        for (result,) in cursor:
+            yield _loads(result)
+
+    def failures(self, stage=None):
+        # type: (Optional[str]) -> List[Dict[str, Any]]
+        """Items that failed max_attempts times"""
+        sql = 'SELECT building_id, stage, attempts, error FROM items ' \
+              'WHERE status = ?'
+        params = [FAILED]
+        if stage:
+            sql += ' AND stage = ?'
+            params.append(stage)
+        return [
+            dict(zip(('building_id', 'stage', 'attempts', 'error'), row))
+            for row in self._conn.execute(sql, params)
+        ]
+
+
+class _Transaction(object):
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK context manager"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.conn.execute('ROLLBACK')
+        else:
+            self.conn.execute('COMMIT')
+
+
+class _Heartbeat(object):
+    """
+    Renews leases on items from a background thread, until they are
+    discarded once processed
+    """
+
+    def __init__(self, queue, items):
+        self.queue = queue
+        self.items = list(items)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def _run(self):
+        """Heartbeat every third of a lease"""
+        while not self._stop.wait(self.queue.lease / 3.0):
+            for item in list(self.items):
+                with self._lock:
+                    if item not in self.items:
+                        continue
+                    try:
+                        self.queue.heartbeat(item)
+                    except LeaseLost as err:
+                        log.warning('%s', err)
+                        self.items.remove(item)
+        self.queue.close()
+
+    def discard(self, item):
+        # type: (WorkItem) -> None
+        """Stop renewing item's lease"""
+        with self._lock:
+            if item in self.items:
+                self.items.remove(item)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+
+# BES pipeline
+def enqueue_buildings(queue, client, stage='report'):
+    # type: (WorkQueue, BESClient, str) -> int
+    """
+    Queue every building the client can list for stage, with the listing
+    as payload (as used by report_handler).
+
+    :returns: number of buildings added
+    """
+    preview_ids = set(
+        bldg['building_id'] for bldg in client.list_preview_buildings()
+    )
+    return queue.put_many(
+        [
+            (bldg['id'], {
+                'bes_type': 'Preview' if bldg['id'] in preview_ids
+                else 'Full',
+                'building': bldg,
+            })
+            for bldg in client.list_buildings()
+        ],
+        stage
+    )
+
+
+def report_handler(bes_kwargs, status_map=None, logger=log,
+                   negative_cache=None):
+    # type: (Dict[str, Any], Optional[Dict], logging.Logger, Any) -> Callable[[WorkItem], Dict]
+    """
+    Handler fetching the report for an item queued by enqueue_buildings,
+    as get_bes_buildings does. Buildings that are not yet rated raise
+    BESError, so are retried later.
+
+    negative_cache (a pybes.cache.NegativeCache) is passed on to the
+    report functions, so failed validations and scores aren't repeated.
+    """
+    client = BESClient(**bes_kwargs)
+    status_map = status_map or get_full_bldg_status_map(**bes_kwargs)
+
+    def handler(item):
+        # type: (WorkItem) -> Dict
+        """Fetch report"""
+        building = item.payload['building']
+        if item.attempts > 1:
+            # listing is stale once a simulation has been started
+            building = client.get_building(item.building_id)
+        status = status_map.get(building['status_type_id'])
+        if item.payload['bes_type'] == 'Preview':
+            report, status = get_bes_preview_report(
+                client, item.building_id, status=status, logger=logger,
+                negative_cache=negative_cache,
+                updated_at=building.get('updated_at')
+            )
+        else:
+            report, status = get_bes_full_report(
+                client, building, status_map=status_map, logger=logger,
+                negative_cache=negative_cache, **bes_kwargs
+            )
+        if not report:
+            raise BESError(
+                'Building {} not rated: {}'.format(item.building_id, status),
+                status=status
+            )
+        return dict(report)
+    return handler
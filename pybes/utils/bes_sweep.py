@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Parametric (retrofit) scenario sweeps over preview buildings.
+
+Each scenario is a clone of a base preview building, made with
+duplicate_preview_building, with some of its block attributes changed
+through update_preview_building(extras=...), e.g.::
+
+    grid = {
+        'floor:floor_type': ['Slab-on-Grade', 'Wood framed'],
+        'hvac_system:type': [
+            'Packaged Rooftop Air Conditioner', 'VAV with Hot-Water Reheat'
+        ]
+    }
+    sweep = ScenarioSweep(client, building_id, grid)
+    results = sweep.run()
+    frame = results_to_dataframe(results, grid)
+
+Every combination of values is validated, simulated and its preview scores
+collected. The clones are deleted afterwards.
+
+results_to_array and results_to_dataframe require numpy/pandas
+(pip install py-bes[sweep]).
+"""
+
+# Imports from Standard Library
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Mapping, Optional, Sequence
+
+# Imports from Third Party Modules
+from requests import RequestException
+
+# Local Imports
+from pybes.pybes import BESClient, BESError
+from pybes.utils.bes_constants import PREVIEW_SCORE_KEYS
+
+# Constants
+MAX_WORKERS = 4
+POLL_INTERVAL = 30
+SIMULATION_TIMEOUT = 3600
+
+log = logging.getLogger(__name__)            # pylint: disable-msg=invalid-name
+
+
+# Public Classes and Functions
+def expand_grid(grid):
+    # type: (Mapping[str, Sequence]) -> List[OrderedDict]
+    """
+    Expand a grid of extras values into a list of scenarios.
+
+    :param grid: extras key (e.g. 'floor:floor_type') and values to try
+    :type grid: dict
+    :returns: extras for every combination of values
+    :rtype: list
+    """
+    keys = list(grid.keys())
+    return [
+        OrderedDict(zip(keys, values))
+        for values in itertools.product(*(grid[key] for key in keys))
+    ]
+
+
+def results_to_dataframe(results, grid):
+    # type: (Sequence[Mapping], Mapping[str, Sequence]) -> Any
+    """
+    Convert sweep results to a pandas DataFrame.
+
+    The frame is indexed by the grid keys and has a column for each of
+    PREVIEW_SCORE_KEYS as well as building_id, status and error.
+    """
+    try:
+        import pandas       # pylint: disable=import-error
+    except ImportError:
+        msg = "pandas is required: pip install py-bes[sweep]"
+        raise ImportError(msg)
+    columns = list(grid.keys()) + [
+        'building_id', 'status', 'error'
+    ] + list(PREVIEW_SCORE_KEYS)
+    frame = pandas.DataFrame(list(results), columns=columns)
+    return frame.set_index(list(grid.keys()))
+
+
+def results_to_array(results, grid, score_key):
+    # type: (Sequence[Mapping], Mapping[str, Sequence], str) -> Any
+    """
+    Convert one score from sweep results to a numpy array.
+
+    The array has one axis per grid key, in grid order, so e.g.
+    array[i, j] is the score for the ith value of the first key and the jth
+    value of the second. Scenarios without a score are NaN.
+    """
+    try:
+        import numpy        # pylint: disable=import-error
+    except ImportError:
+        msg = "numpy is required: pip install py-bes[sweep]"
+        raise ImportError(msg)
+    keys = list(grid.keys())
+    shape = tuple(len(grid[key]) for key in keys)
+    array = numpy.full(shape, numpy.nan)
+    for result in results:
+        idx = tuple(
+            list(grid[key]).index(result[key]) for key in keys
+        )
+        if result.get(score_key) is not None:
+            array[idx] = result[score_key]
+    return array
+
+
+class ScenarioSweep(object):
+    """
+    Clone, update, validate, simulate and report a grid of scenarios.
+
+    At most max_workers scenarios are processed at once. Clones are
+    deleted when the sweep finishes unless cleanup is False.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, client, building_id, grid, max_workers=MAX_WORKERS,
+                 poll_interval=POLL_INTERVAL, timeout=SIMULATION_TIMEOUT,
+                 cleanup=True, logger=log):
+        # type: (BESClient, int, Mapping, int, float, float, bool, Any) -> None
+        """
+        :param client: BES client
+        :type client: BESClient
+        :param building_id: id of base preview building
+        :type building_id: int
+        :param grid: extras key and values to try
+        :type grid: dict
+        :param max_workers: max number of scenarios processed at once
+        :type max_workers: int
+        :param poll_interval: seconds between simulation status checks
+        :type poll_interval: float
+        :param timeout: max seconds to wait for a simulation
+        :type timeout: float
+        :param cleanup: delete clones when finished
+        :type cleanup: bool
+        """
+        # pylint: disable=too-many-arguments
+        self.client = client
+        self.building_id = building_id
+        self.grid = grid
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.cleanup = cleanup
+        self.logger = logger
+        self.clones = []            # type: List[int]
+        self._lock = threading.Lock()
+
+    def _clone(self):
+        # type: () -> int
+        """Duplicate base building, returns id of clone"""
+        clone = self.client.duplicate_preview_building(self.building_id)
+        clone_id = clone.get('building_id') or clone.get('id')
+        with self._lock:
+            self.clones.append(clone_id)
+        return clone_id
+
+    def _update(self, clone_id, extras):
+        # type: (int, Mapping[str, Any]) -> None
+        """Set extras on every block of clone"""
+        details = self.client.get_preview_building(clone_id)
+        if details.get('status!') != 'Editing':
+            try:
+                self.client.set_preview_building_status(clone_id, 'edit_mode')
+            except BESError as err:
+                self.logger.warning(
+                    "Unable to set edit mode for {}: {}".format(clone_id, err)
+                )
+        for block in details['blocks']:
+            self.client.update_preview_building(
+                clone_id, block['block_id'], extras=dict(extras)
+            )
+
+    def _wait_for_rating(self, clone_id):
+        # type: (int) -> str
+        """Poll status of clone until it is no longer running"""
+        deadline = time.time() + self.timeout
+        status = self.client.get_preview_building(clone_id)['status!']
+        while status in ('Submitted', 'Running') and time.time() < deadline:
+            time.sleep(self.poll_interval)
+            status = self.client.get_preview_building(clone_id)['status!']
+        return status
+
+    def run_scenario(self, extras):
+        # type: (Mapping[str, Any]) -> OrderedDict
+        """
+        Run a single scenario.
+
+        :param extras: extras to set on the clone
+        :type extras: dict
+        :returns: extras, building_id, status, error and scores
+        :rtype: OrderedDict
+        """
+        result = OrderedDict(extras)
+        result.update(
+            (key, None) for key in ('building_id', 'status', 'error')
+        )
+        result.update((key, None) for key in PREVIEW_SCORE_KEYS)
+        try:
+            clone_id = result['building_id'] = self._clone()
+            self._update(clone_id, extras)
+            self.client.validate_preview_building(clone_id)
+            self.client.simulate_preview_building(clone_id)
+            result['status'] = self._wait_for_rating(clone_id)
+            if result['status'] == 'Rated':
+                report = self.client.get_preview_building(
+                    clone_id, report_type='pdf'
+                )
+                result.update(
+                    (key, report.get(key)) for key in PREVIEW_SCORE_KEYS
+                )
+        except (BESError, RequestException) as err:
+            result['error'] = str(err)
+            self.logger.error(
+                "Error running scenario {}: {}".format(dict(extras), err)
+            )
+        return result
+
+    def delete_clones(self):
+        # type: () -> None
+        """Delete all clones made by the sweep"""
+        with self._lock:
+            clones, self.clones = self.clones, []
+        for clone_id in clones:
+            try:
+                self.client.delete_preview_building(clone_id)
+            except (BESError, RequestException) as err:
+                self.logger.error(
+                    "Unable to delete clone {}: {}".format(clone_id, err)
+                )
+
+    def run(self, scenarios=None):
+        # type: (Optional[Sequence[Mapping]]) -> List[OrderedDict]
+        """
+        Run all scenarios.
+
+        :param scenarios: extras for each scenario, default: expand grid
+        :type scenarios: list
+        :returns: result of each scenario (see run_scenario), in order
+        :rtype: list
+        """
+        if scenarios is None:
+            scenarios = expand_grid(self.grid)
+        workers = max(1, min(self.max_workers, len(scenarios)))
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self.run_scenario, scenarios))
+        finally:
+            if self.cleanup:
+                self.delete_clones()
+        return results
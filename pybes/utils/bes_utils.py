@@ -9,14 +9,20 @@ Utility functions for Building Energy Asset Score processing
 """
 
 # Imports from Standard Library
-from typing import Mapping, Optional, Sequence, Union
+import re
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Mapping, Optional, Sequence, Union
 
 # Local Imports
 from pybes.pybes import BESClient
-from pybes.utils.bes_constants import ASSET_SCORE_PROPERTY_TYPE
+from pybes.utils.bes_constants import (
+    ADDRESS_ABBREVIATIONS,
+    ASSET_SCORE_PROPERTY_TYPE,
+)
 
 # Setup
 # Constants
+NON_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
 # Data Structure Definitions
 # Private Functions
 
@@ -30,6 +36,35 @@ def get_full_bldg_status_map(**bes_kwargs):
     return {status['id']: status['display_name'] for status in status_types}
 
 
+def fetch_concurrently(calls, executor=None):
+    # type: (Sequence[Callable[[], Any]], Any) -> List[Any]
+    """
+    Results of calls (functions taking no arguments), made concurrently.
+
+    The first call is made in this thread, the rest in executor, or in
+    threads of their own if it isn't supplied. All calls finish before
+    the first exception raised is re-raised.
+    """
+    calls = list(calls)
+    if len(calls) < 2:
+        return [call() for call in calls]
+    own_executor = None
+    if executor is None:
+        executor = own_executor = ThreadPoolExecutor(
+            max_workers=len(calls) - 1
+        )
+    try:
+        futures = [executor.submit(call) for call in calls[1:]]
+        try:
+            first = calls[0]()
+        finally:
+            wait(futures)
+        return [first] + [future.result() for future in futures]
+    finally:
+        if own_executor:
+            own_executor.shutdown(wait=False)
+
+
 def convert_bes_year(year):
     # type: (Union[str, int]) -> Union[str, int]
     """
@@ -71,3 +106,21 @@ def get_addr_line_str(addr_dict, addr_parts=None):
     addr_str = ' '.join(str(addr_dict[elem]) for elem in addr_parts
                         if addr_dict.get(elem))
     return addr_str
+
+
+def normalize_address(value):
+    # type: (Optional[str]) -> str
+    """
+    Normalize address (or other free text) for comparison.
+
+    Lower cases, strips punctuation and collapses whitespace, and
+    abbreviates street suffixes and directions, so '123 North Main Street.'
+    and '123 N. Main St' compare equal.
+
+    :param value: address string
+    :return: normalized string, '' if value is empty
+    """
+    if not value:
+        return ''
+    words = NON_ALPHANUMERIC.sub(' ', str(value).lower()).split()
+    return ' '.join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+copyright (c) 2016-2017 Earth Advantage.
+All rights reserved
+
+Local validation of BES payloads.
+
+Checks preview building payloads and v1 create_block/update_block
+parameters against the rules the server applies (required fields, numeric
+ranges, enums from the resource type listings and the dimensions each
+block shape needs), so bad rows are rejected before any api call::
+
+    validator = PayloadValidator.from_client(client)
+    errors = validator.validate_preview(payload)    # {} if valid
+    validator.check_block(params)                   # raises ValidationError
+
+Without resource types (PayloadValidator()) enums fetched from the api
+(use types, shapes etc) are not checked.
+"""
+
+# Imports from Standard Library
+import datetime
+import re
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+# Local Imports
+from pybes.pybes import BESClient, BESError
+from pybes.utils.bes_constants import PREVIEW_PAYLOAD_KEYS
+
+try:
+    basestring
+except NameError:                                       # pragma: no cover
+    basestring = str                    # pylint: disable=invalid-name
+
+
+# Data Structure Definitions
+class ValidationError(BESError):
+    """Payload failed local validation, errors maps field to message"""
+    pass
+
+
+class Field(object):
+    """Rule for a payload field"""
+    # pylint: disable=too-few-public-methods,too-many-arguments
+    __slots__ = (
+        'kind', 'required', 'minimum', 'maximum', 'exclusive', 'choices',
+        'resource', 'pattern',
+    )
+
+    def __init__(self, kind=str, required=False, minimum=None, maximum=None,
+                 exclusive=False, choices=None, resource=None, pattern=None):
+        """
+        :param kind: str, int, float or bool
+        :param required: must be present and not empty
+        :param minimum: minimum numeric value
+        :param maximum: maximum numeric value
+        :param exclusive: minimum is exclusive
+        :param choices: allowed values (case insensitive for strings)
+        :param resource: resource type endpoint listing allowed values, by
+            id for kind int or display name for str
+        :param pattern: regex string values must match
+        """
+        self.kind = kind
+        self.required = required
+        self.minimum = minimum
+        self.maximum = maximum
+        self.exclusive = exclusive
+        self.choices = (
+            frozenset(str(choice).lower() for choice in choices)
+            if choices else None
+        )
+        self.resource = resource
+        self.pattern = re.compile(pattern) if pattern else None
+
+
+# Constants
+COORDINATES = r'^\s*-?\d+(\.\d+)?\s*,\s*-?\d+(\.\d+)?\s*$'
+COORDINATE_LIST = (
+    r'^\s*-?\d+(\.\d+)?\s*,\s*-?\d+(\.\d+)?'
+    r'(\s+-?\d+(\.\d+)?\s*,\s*-?\d+(\.\d+)?)*\s*$'
+)
+MIN_YEAR = 1900
+MAX_DIMENSIONS = 10
+
+PREVIEW_SCHEMA = {
+    'building_name': Field(required=True),
+    'year_completed': Field(int, required=True, minimum=MIN_YEAR),
+    'floor_area': Field(float, required=True, minimum=0, exclusive=True),
+    'street': Field(required=True),
+    'city': Field(required=True),
+    'state': Field(required=True, pattern=r'^[A-Za-z]{2}$'),
+    'postal_code': Field(required=True, pattern=r'^\d{5}(-?\d{4})?$'),
+    'assessment_type': Field(required=True, choices=('Test', 'Real')),
+    'use_type': Field(required=True, resource='use_types'),
+    'orientation': Field(
+        required=True, choices=('North/South', 'East/West')
+    ),
+    'number_floors': Field(int, required=True, minimum=1, maximum=500),
+}
+
+BLOCK_SCHEMA = {
+    'shape_id': Field(int, required=True, resource='shapes'),
+    'name': Field(required=True),
+    'floor_to_floor_height': Field(
+        float, required=True, minimum=9, exclusive=True
+    ),
+    'floor_to_ceiling_height': Field(
+        float, required=True, minimum=0, exclusive=True
+    ),
+    'is_above_ground': Field(bool, required=True),
+    'number_of_floors': Field(int, required=True, minimum=1, maximum=500),
+    'orientation': Field(float, required=True, minimum=0, maximum=359),
+    'position': Field(required=True, pattern=COORDINATES),
+    'vertices': Field(required=True, pattern=COORDINATE_LIST),
+    'building_use_type_id': Field(int, resource='use_types'),
+    'operating_season_id': Field(int, resource='operating_seasons'),
+    'skylight_layout_id': Field(int, resource='skylight_layouts'),
+    'zone_layout_id': Field(int, resource='zone_layouts'),
+    'percent_footprint': Field(float, minimum=0, maximum=100),
+    'perimeter_zone_depth': Field(float, minimum=0, exclusive=True),
+    'co_sensors': Field(bool),
+    'has_drop_ceiling': Field(bool),
+    'has_timer_controls': Field(bool),
+    'has_toplight_control': Field(bool),
+    'low_flow_faucets': Field(bool),
+    'uses_percent_served': Field(bool),
+}
+BLOCK_SCHEMA.update({
+    'dimension_{}'.format(idx): Field(
+        float, required=idx <= 2, minimum=0, exclusive=True
+    )
+    for idx in range(1, MAX_DIMENSIONS + 1)
+})
+
+BOOLEANS = frozenset(['true', 'false'])
+
+
+# Private Functions
+def _is_empty(val):
+    # type: (Any) -> bool
+    """None or blank string"""
+    return val is None or (isinstance(val, basestring) and not val.strip())
+
+
+def _resource_values(resources, kind):
+    # type: (Iterable[Mapping], type) -> frozenset
+    """Allowed values from a resource type listing"""
+    if kind is int:
+        return frozenset(int(res['id']) for res in resources)
+    return frozenset(
+        str(res.get('display_name') or res.get('name')).lower()
+        for res in resources
+    )
+
+
+def _raise(errors, prefix):
+    # type: (Dict[str, str], str) -> None
+    """Raise ValidationError for errors, if any"""
+    if errors:
+        msg = '{}: {}'.format(prefix, ', '.join(
+            '{} {}'.format(key, val) for key, val in sorted(errors.items())
+        ))
+        raise ValidationError(msg, errors=errors)
+
+
+# Public Classes and Functions
+class PayloadValidator(object):
+    """Validates payloads against PREVIEW_SCHEMA and BLOCK_SCHEMA"""
+
+    def __init__(self, resource_types=None, max_year=None):
+        # type: (Optional[Mapping[str, Iterable[Mapping]]], Optional[int]) -> None
+        """
+        :param resource_types: resource type endpoint: listing (as returned
+            by list_resource_types) for enum checks
+        :param max_year: latest year_completed, default this year
+        """
+        resource_types = resource_types or {}
+        self.max_year = max_year or datetime.date.today().year
+        self.allowed = {}                       # type: Dict[Any, frozenset]
+        self.dimensions = {}                    # type: Dict[int, int]
+        for schema in (PREVIEW_SCHEMA, BLOCK_SCHEMA):
+            for field in schema.values():
+                if field.resource in resource_types:
+                    self.allowed[(field.resource, field.kind)] = (
+                        _resource_values(
+                            resource_types[field.resource], field.kind
+                        )
+                    )
+        for shape in resource_types.get('shapes', []):
+            if shape.get('number_of_dimensions'):
+                self.dimensions[int(shape['id'])] = int(
+                    shape['number_of_dimensions']
+                )
+
+    @classmethod
+    def from_client(cls, client, **kwargs):
+        # type: (BESClient, **Any) -> PayloadValidator
+        """Validator using resource types listed by client"""
+        endpoints = set(
+            field.resource
+            for schema in (PREVIEW_SCHEMA, BLOCK_SCHEMA)
+            for field in schema.values() if field.resource
+        )
+        return cls(
+            {
+                endpoint: client.list_resource_types(endpoint)
+                for endpoint in endpoints
+            },
+            **kwargs
+        )
+
+    def _check(self, name, field, val):
+        # type: (str, Field, Any) -> Optional[str]
+        """Error message for val, or None"""
+        # pylint: disable=too-many-return-statements,too-many-branches
+        if field.kind in (int, float):
+            try:
+                num = float(val)
+            except (TypeError, ValueError):
+                return 'must be a number'
+            if field.kind is int and num != int(num):
+                return 'must be a whole number'
+            if field.minimum is not None:
+                if num < field.minimum or (
+                        field.exclusive and num == field.minimum):
+                    return 'must be greater than {}{}'.format(
+                        '' if field.exclusive else 'or equal to ',
+                        field.minimum
+                    )
+            maximum = field.maximum
+            if name == 'year_completed':
+                maximum = self.max_year
+            if maximum is not None and num > maximum:
+                return 'must be less than or equal to {}'.format(maximum)
+            val = int(num) if field.kind is int else num
+        elif field.kind is bool:
+            if not isinstance(val, bool) and str(val).lower() not in BOOLEANS:
+                return 'must be true or false'
+        elif field.pattern and not field.pattern.match(str(val)):
+            return 'is not valid'
+        if field.choices and str(val).lower() not in field.choices:
+            return 'must be one of {}'.format(', '.join(sorted(field.choices)))
+        allowed = self.allowed.get((field.resource, field.kind))
+        if allowed is not None:
+            key = val if field.kind is int else str(val).lower()
+            if key not in allowed:
+                return 'is not a valid {}'.format(
+                    field.resource.rstrip('s').replace('_', ' ')
+                )
+        return None
+
+    def _validate(self, payload, schema, partial=False):
+        # type: (Mapping[str, Any], Mapping[str, Field], bool) -> Dict[str, str]
+        """Errors for payload"""
+        errors = {}
+        for name, field in schema.items():
+            val = payload.get(name)
+            if _is_empty(val):
+                if field.required and not partial:
+                    errors[name] = "can't be blank"
+                continue
+            error = self._check(name, field, val)
+            if error:
+                errors[name] = error
+        return errors
+
+    def validate_preview(self, payload):
+        # type: (Mapping[str, Any]) -> Dict[str, str]
+        """
+        Errors for create_preview_building payload.
+
+        :returns: field: message, empty if valid
+        """
+        errors = self._validate(payload, PREVIEW_SCHEMA)
+        for key in payload:
+            if key not in PREVIEW_PAYLOAD_KEYS:
+                errors[key] = 'is not a preview building field'
+        return errors
+
+    def validate_block(self, params, partial=False):
+        # type: (Mapping[str, Any], bool) -> Dict[str, str]
+        """
+        Errors for create_block or (partial=True) update_block params.
+
+        Dimensions beyond the shape's number of dimensions are required
+        when the shape is known.
+
+        :returns: field: message, empty if valid
+        """
+        errors = self._validate(params, BLOCK_SCHEMA, partial=partial)
+        if 'shape_id' not in errors and not partial:
+            try:
+                dimensions = self.dimensions.get(int(params['shape_id']), 0)
+            except (KeyError, TypeError, ValueError):
+                dimensions = 0
+            for idx in range(3, dimensions + 1):
+                name = 'dimension_{}'.format(idx)
+                if _is_empty(params.get(name)):
+                    errors[name] = "can't be blank for this shape"
+        floor, ceiling = (
+            params.get('floor_to_floor_height'),
+            params.get('floor_to_ceiling_height')
+        )
+        if not (_is_empty(floor) or _is_empty(ceiling)
+                or 'floor_to_floor_height' in errors
+                or 'floor_to_ceiling_height' in errors):
+            if float(ceiling) > float(floor):
+                errors['floor_to_ceiling_height'] = (
+                    'must be less than or equal to floor_to_floor_height'
+                )
+        return errors
+
+    def check_preview(self, payload):
+        # type: (Mapping[str, Any]) -> None
+        """Raise ValidationError if preview payload is invalid"""
+        _raise(self.validate_preview(payload), 'Invalid preview building')
+
+    def check_block(self, params, partial=False):
+        # type: (Mapping[str, Any], bool) -> None
+        """Raise ValidationError if block params are invalid"""
+        _raise(self.validate_block(params, partial=partial), 'Invalid block')